@@ -0,0 +1,113 @@
+"""
+持久化标注缓存（SQLite）
+
+每日重跑时历史对话的清洗和分类结果不变，只有新增对话需要计算。缓存分两张表：
+- cleaned：(原始对话哈希, 清洗规则指纹) -> clean_dialogue（清洗不依赖关键词配置）
+- annotations：(清洗后文本哈希, 关键词配置指纹) -> user_type, sentiment, topics
+清洗规则或关键词配置变化后，旧指纹的结果不再命中；只改关键词时清洗结果仍可复用。
+旧版缓存文件中不带指纹的 cleaned 表无法判断清洗版本，打开时直接丢弃重建。
+查询按批使用 IN (...)，写入在一个事务内 executemany。
+"""
+
+import hashlib
+import os
+import sqlite3
+
+# 单条 IN 查询的参数个数（低于 SQLite 默认上限 999）
+LOOKUP_BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cleaned (
+    text_hash BLOB NOT NULL,
+    fingerprint TEXT NOT NULL,
+    clean_dialogue TEXT NOT NULL,
+    PRIMARY KEY (text_hash, fingerprint)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS annotations (
+    text_hash BLOB NOT NULL,
+    fingerprint TEXT NOT NULL,
+    user_type TEXT NOT NULL,
+    sentiment TEXT NOT NULL,
+    topics TEXT NOT NULL,
+    PRIMARY KEY (text_hash, fingerprint)
+) WITHOUT ROWID;
+"""
+
+def text_hash(text):
+    return hashlib.sha1(str(text).encode('utf-8')).digest()
+
+def config_fingerprint(*parts):
+    """把关键词配置等任意可 repr 的内容压缩成短指纹"""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+class AnnotationCache:
+    """
+    get_clean / get_labels 返回 {文本: 结果}，只包含命中的文本；
+    put_clean / put_labels 接收 {文本: 结果}。lookups / hits / writes 按不同文本计数。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self._drop_unversioned_cleaned()
+        self.conn.executescript(SCHEMA)
+        self.lookups = 0
+        self.hits = 0
+        self.writes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def _drop_unversioned_cleaned(self):
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(cleaned)")]
+        if columns and 'fingerprint' not in columns:
+            with self.conn:
+                self.conn.execute("DROP TABLE cleaned")
+
+    def _get(self, query, keys, params=()):
+        keys = list(keys)
+        by_hash = {text_hash(key): key for key in keys}
+        hashes = list(by_hash)
+        found = {}
+        for start in range(0, len(hashes), LOOKUP_BATCH_SIZE):
+            batch = hashes[start:start + LOOKUP_BATCH_SIZE]
+            sql = query.format(placeholders=','.join('?' * len(batch)))
+            for row in self.conn.execute(sql, (*params, *batch)):
+                found[by_hash[row[0]]] = row[1:]
+        self.lookups += len(keys)
+        self.hits += len(found)
+        return found
+
+    def _put(self, sql, rows):
+        with self.conn:
+            self.conn.executemany(sql, rows)
+        self.writes += len(rows)
+
+    def get_clean(self, texts, fingerprint):
+        found = self._get("SELECT text_hash, clean_dialogue FROM cleaned "
+                          "WHERE fingerprint = ? AND text_hash IN ({placeholders})", texts, (fingerprint,))
+        return {text: row[0] for text, row in found.items()}
+
+    def put_clean(self, cleaned, fingerprint):
+        self._put("INSERT OR REPLACE INTO cleaned VALUES (?, ?, ?)",
+                  [(text_hash(text), fingerprint, clean) for text, clean in cleaned.items()])
+
+    def get_labels(self, texts, fingerprint):
+        return self._get("SELECT text_hash, user_type, sentiment, topics FROM annotations "
+                         "WHERE fingerprint = ? AND text_hash IN ({placeholders})", texts, (fingerprint,))
+
+    def put_labels(self, labels, fingerprint):
+        self._put("INSERT OR REPLACE INTO annotations VALUES (?, ?, ?, ?, ?)",
+                  [(text_hash(text), fingerprint, *label) for text, label in labels.items()])
+
+    def stats(self):
+        return {'lookups': self.lookups, 'hits': self.hits, 'writes': self.writes}
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+小馨宝运营分析 - 性能基准测试
+
+使用方法：
+1. 日志解析吞吐：python benchmark.py log-parser --lines 2000000 [--workers 8]
+2. CSV 加载：python benchmark.py load-csv --rows 500000 [--engine pyarrow]
+3. 关键词分类：python benchmark.py lexicon --keywords 10000 --rows 20000
+4. 对话清洗：python benchmark.py clean --rows 500000
+5. 重复对话的记忆化清洗与分类：python benchmark.py memo --rows 500000 --distinct 5000 [--workers 8]
+6. 时间戳解析：python benchmark.py timestamps --rows 1000000
+7. 每日重跑的增量预处理：python benchmark.py incremental --rows 500000 --new-fraction 0.01
+8. 月度分析并行：python benchmark.py months --rows 500000 [--workers 8]
+
+所有数据均为脚本合成的虚构内容，不包含任何真实用户信息。
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import re
+import tempfile
+import time
+
+import pandas as pd
+
+from data_preprocessor import XiaoXinBaoDataProcessor
+from lexicon import Lexicon
+from log_parser import LogParser
+from monthly_analyzer import month_workers, process_all_months
+
+NOISE_LINES = [
+    "[INFO][{ts}][chat_channel.py:120] - [chat_channel] receive message, msg_id=anonymous_{n}\n",
+    "[INFO][{ts}][bridge.py:55] - create bot chatGPT for chat\n",
+    "[WARNING][{ts}][gewechat_channel.py:88] - [gewechat] heartbeat timeout, retrying\n",
+    "[INFO][{ts}][plugin_manager.py:210] - [PluginManager] plugin Hello skipped\n",
+    "[ERROR][{ts}][http.py:33] - connection reset by peer\n",
+]
+
+def generate_synthetic_log(path, total_lines, seed=42):
+    """生成合成日志：约 10% 的行为提问/回复，其余为噪声行"""
+    rng = random.Random(seed)
+    written = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        while written < total_lines:
+            ts = f"2025-05-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}"
+            for _ in range(rng.randint(6, 12)):
+                f.write(rng.choice(NOISE_LINES).format(ts=ts, n=written))
+                written += 1
+            f.write(f"[INFO][{ts}][chat_gpt_bot.py:49] - [CHATGPT] query=化疗后恶心怎么办 {written}\n")
+            f.write(f"[INFO][{ts}][gewechat_channel.py:220] - [gewechat] Do send text to anonymous_{written}: 建议少食多餐\n")
+            written += 2
+            if rng.random() < 0.3:
+                f.write("如果持续呕吐请及时就医\n")
+                written += 1
+    return written
+
+def legacy_parse(log_file_path):
+    """原实现（readlines + 每行三次未编译 re.search），仅用于对比"""
+    with open(log_file_path, 'r', encoding='utf-8', errors='ignore') as f:
+        lines = f.readlines()
+    data = []
+    current_entry = {}
+    time_pattern = r'\[INFO\]\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\]'
+    query_pattern = r'\[CHATGPT\] query=(.*)'
+    reply_start_pattern = r'\[gewechat\] Do send text to .*?: (.*)'
+    for i, line in enumerate(lines):
+        time_match = re.search(time_pattern, line)
+        timestamp = time_match.group(1) if time_match else None
+        query_match = re.search(query_pattern, line)
+        if query_match:
+            current_entry = {'timestamp': timestamp, 'query': query_match.group(1).strip(), 'reply': None}
+            continue
+        reply_match = re.search(reply_start_pattern, line)
+        if reply_match and current_entry.get('query'):
+            reply_content = [reply_match.group(1).strip()]
+            j = i + 1
+            while j < len(lines):
+                next_line = lines[j]
+                if re.match(r'\[(INFO|WARNING|ERROR)\]', next_line):
+                    break
+                reply_content.append(next_line.strip())
+                j += 1
+            current_entry['reply'] = '\n'.join(reply_content).strip()
+            data.append(current_entry)
+            current_entry = {}
+    return data
+
+EXPORT_HEADER = "时间,来源,使用者,联系方式,标题,消息总数,用户赞同反馈,用户反对反馈,自定义反馈,标注答案,对话详情\n"
+
+def generate_synthetic_export(path, rows, encoding='gbk', seed=42):
+    """生成合成的平台导出CSV（默认 GBK 编码，即旧实现需要解析两次的情况）"""
+    rng = random.Random(seed)
+    with open(path, 'w', encoding=encoding) as f:
+        f.write(EXPORT_HEADER)
+        for i in range(rows):
+            content = rng.choice(['化疗后恶心怎么办', '我是患者家属，很担心', '谢谢医生的建议'])
+            f.write(f'2025/{rng.randint(1, 12)}/{rng.randint(1, 28)} {rng.randint(0, 23)}:{rng.randint(0, 59):02d},'
+                    f'外部接入单点,shareChat-{i},\'-,咨询{i},{rng.randint(1, 20)},[],[],[],[],'
+                    f'"[{{""type"":""text"",""text"":{{""content"":""{content} {i}""}}}}]"\n')
+
+def legacy_load(path):
+    """原实现：依次用每种编码完整解析，直到成功"""
+    for encoding in ['utf-8', 'gbk', 'gb2312', 'cp936']:
+        try:
+            return pd.read_csv(path, encoding=encoding)
+        except UnicodeDecodeError:
+            continue
+
+def legacy_clean_dialogue(text):
+    """原 extract_dialogue_content 的逐行清洗函数（每行经 re 模块缓存调用六次正则），仅用于对比"""
+    if pd.isna(text):
+        return ""
+    text = str(text)
+    text = re.sub(r'[→ʱ��]', '', text)
+    content_matches = re.findall(r'"content"\s*:\s*"([^"]*)"', text)
+    if content_matches:
+        return ' '.join(content_matches).replace('\\n', ' ').replace('\\"', '"')
+    text_only = re.sub(r'[\[\]{}",:]', ' ', text)
+    text_only = re.sub(r'type|text|content|interactive|userSelect|params|description|value|key', '', text_only)
+    text_only = re.sub(r'\s+', ' ', text_only).strip()
+    chinese_matches = re.findall(r'[\u4e00-\u9fff\w\s，。！？；：、（）]+', text_only)
+    if chinese_matches:
+        return ' '.join(chinese_matches).strip()
+    return text_only
+
+def legacy_parse_timestamps(values):
+    """原 parse_timestamp：逐个候选格式整列解析，直到有非空结果，否则整列通用推断"""
+    for fmt in ['%Y/%m/%d %H:%M', '%Y-%m-%d %H:%M:%S', '%Y/%m/%d', '%Y-%m-%d']:
+        parsed = pd.to_datetime(values, format=fmt, errors='coerce')
+        if parsed.notna().sum() > 0:
+            return parsed
+    return pd.to_datetime(values, errors='coerce')
+
+def time_call(func):
+    start_time = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start_time
+
+def bench_log_parser(args):
+    """日志解析：原实现 vs 单遍预过滤分发器 vs mmap 字节扫描"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_path = os.path.join(tmp_dir, 'synthetic.log')
+        total_lines = generate_synthetic_log(log_path, args.lines)
+        size_mb = os.path.getsize(log_path) / 1024 / 1024
+        print(f"合成日志: {total_lines} 行, {size_mb:.1f} MB")
+
+        legacy_pairs, legacy_sec = time_call(lambda: legacy_parse(log_path))
+        print(f"原实现:   {legacy_sec:.2f}秒, {total_lines / legacy_sec:,.0f} 行/秒, {len(legacy_pairs)} 个问答对")
+
+        line_pairs, line_sec = time_call(lambda: list(LogParser(log_path, use_mmap=False).iter_pairs()))
+        print(f"逐行分发器: {line_sec:.2f}秒, {total_lines / line_sec:,.0f} 行/秒, {len(line_pairs)} 个问答对")
+
+        pairs, new_sec = time_call(lambda: list(LogParser(log_path).iter_pairs()))
+        print(f"mmap字节扫描: {new_sec:.2f}秒, {total_lines / new_sec:,.0f} 行/秒, {len(pairs)} 个问答对")
+        print(f"加速比: 逐行 {legacy_sec / line_sec:.2f}x, mmap {legacy_sec / new_sec:.2f}x")
+        if len(pairs) != len(legacy_pairs) or pairs != line_pairs:
+            print("警告: 各实现的问答对不一致")
+
+        if args.workers > 1:
+            parallel_pairs, par_sec = time_call(
+                lambda: list(LogParser(log_path).iter_pairs(workers=args.workers, chunk_bytes=1024 * 1024)))
+            print(f"并行解析({args.workers}进程): {par_sec:.2f}秒, {total_lines / par_sec:,.0f} 行/秒, "
+                  f"相对单进程 {new_sec / par_sec:.2f}x")
+            if parallel_pairs != pairs:
+                print("警告: 并行解析结果与顺序解析不一致")
+
+def bench_load_csv(args):
+    """CSV 加载：逐编码完整解析 vs 样本探测编码 + 按需列 + 显式类型"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, 'export.csv')
+        generate_synthetic_export(csv_path, args.rows)
+        print(f"合成导出: {args.rows} 行, {os.path.getsize(csv_path) / 1024 / 1024:.1f} MB (GBK)")
+        
+        legacy_df, legacy_sec = time_call(lambda: legacy_load(csv_path))
+        legacy_mb = legacy_df.memory_usage(deep=True).sum() / 1024 / 1024
+        print(f"原实现:   {legacy_sec:.2f}秒, DataFrame {legacy_mb:.1f} MB")
+        
+        processor = XiaoXinBaoDataProcessor(csv_path)
+        _, new_sec = time_call(lambda: processor.load_data(columns=XiaoXinBaoDataProcessor.PIPELINE_COLUMNS,
+                                                           engine=args.engine))
+        new_mb = processor.df.memory_usage(deep=True).sum() / 1024 / 1024
+        print(f"新实现:   {new_sec:.2f}秒, DataFrame {new_mb:.1f} MB")
+        print(f"加速比: {legacy_sec / new_sec:.2f}x, 内存 {legacy_mb / new_mb:.2f}x")
+
+def bench_lexicon(args):
+    """关键词匹配：逐词 `word in text` vs Aho-Corasick 自动机（一次扫描）"""
+    rng = random.Random(42)
+    alphabet = '癌症患者家属志愿医生护士化疗放疗手术恶心呕吐焦虑担心谢谢帮助检查复查营养饮食睡眠疼痛'
+    categories = [('user', 'patient_family'), ('user', 'volunteer'), ('user', 'medical_professional'),
+                  ('sentiment', 'positive'), ('sentiment', 'negative'), ('sentiment', 'neutral')]
+    lexicons = {category: [] for category in categories}
+    for _ in range(args.keywords):
+        word = ''.join(rng.choice(alphabet) for _ in range(rng.randint(2, 5)))
+        lexicons[rng.choice(categories)].append(word)
+    texts = [''.join(rng.choice(alphabet) for _ in range(rng.randint(10, 120))) for _ in range(args.rows)]
+    print(f"{args.keywords} 个关键词, {len(categories)} 个类别, {args.rows} 条文本")
+
+    def naive():
+        return [{category: hits for category, words in lexicons.items()
+                 if (hits := sum(1 for word in words if word in text))} for text in texts]
+
+    lexicon, build_sec = time_call(lambda: Lexicon(lexicons))
+    print(f"自动机构建: {build_sec:.2f}秒 ({'pyahocorasick' if lexicon._automaton is not None else '纯 Python'})")
+    naive_counts, naive_sec = time_call(naive)
+    print(f"逐词匹配: {naive_sec:.2f}秒, {args.rows / naive_sec:,.0f} 条/秒")
+    counts, new_sec = time_call(lambda: [lexicon.count(text) for text in texts])
+    print(f"自动机:   {new_sec:.2f}秒, {args.rows / new_sec:,.0f} 条/秒, 加速比 {naive_sec / new_sec:.2f}x")
+    if counts != naive_counts:
+        print("警告: 自动机结果与逐词匹配不一致")
+
+def bench_clean(args):
+    """对话清洗：逐行 apply vs 预处理器实际使用的 clean_dialogues（预编译正则 + 快速路径 + 记忆化）"""
+    rng = random.Random(42)
+    texts = []
+    for i in range(args.rows):
+        if rng.random() < 0.6:
+            texts.append('[{"type":"text","text":{"content":"我是患者家属，化疗后恶心怎么办 %d"}}]' % i)
+        else:
+            texts.append('您好，请问复查多久一次 %d' % i)
+    series = pd.Series(texts)
+    print(f"{args.rows} 条对话（60% JSON 载荷）")
+    legacy, legacy_sec = time_call(lambda: series.apply(legacy_clean_dialogue))
+    print(f"逐行 apply: {legacy_sec:.2f}秒, {args.rows / legacy_sec:,.0f} 条/秒")
+    cleaned, new_sec = time_call(lambda: XiaoXinBaoDataProcessor('<memory>').clean_dialogues(series))
+    print(f"按列清洗:   {new_sec:.2f}秒, {args.rows / new_sec:,.0f} 条/秒, 加速比 {legacy_sec / new_sec:.2f}x")
+    if not cleaned.equals(legacy):
+        print("警告: 清洗结果与原实现不一致")
+
+def bench_memo(args):
+    """重复对话：逐行清洗、分类 vs 按内容去重的记忆化缓存"""
+    rng = random.Random(42)
+    pool = ['[{"type":"text","text":{"content":"我是患者家属，化疗后恶心怎么办 %d"}}]' % i if i % 2
+            else '您好，请问复查多久一次 %d' % i for i in range(args.distinct)]
+    series = pd.Series([rng.choice(pool) for _ in range(args.rows)])
+    print(f"{args.rows} 条对话, {args.distinct} 种不同内容")
+
+    def legacy():
+        processor = XiaoXinBaoDataProcessor.from_frame(pd.DataFrame({'clean_dialogue': series.map(XiaoXinBaoDataProcessor._clean_text)}))
+        lexicon = processor.lexicon()
+        labels = []
+        for text in processor.df['clean_dialogue']:
+            counts = lexicon.count(text)
+            labels.append((processor._classify_user(counts), processor._classify_sentiment(counts, text)))
+        return labels
+
+    def memoized():
+        processor = XiaoXinBaoDataProcessor.from_frame(pd.DataFrame({'dialogue_content': series}))
+        processor.verbose = False
+        processor.workers = args.workers
+        processor.extract_dialogue_content()
+        processor.annotate()
+        return processor
+
+    legacy_labels, legacy_sec = time_call(legacy)
+    print(f"逐行计算: {legacy_sec:.2f}秒, {args.rows / legacy_sec:,.0f} 条/秒")
+    processor, new_sec = time_call(memoized)
+    print(f"记忆化({args.workers}进程): {new_sec:.2f}秒, {args.rows / new_sec:,.0f} 条/秒, 加速比 {legacy_sec / new_sec:.2f}x, "
+          f"命中率 清洗 {processor.clean_memo.hit_rate:.1%} / 标注 {processor.annotation_memo.hit_rate:.1%}")
+    if list(zip(processor.df['user_type'], processor.df['sentiment'])) != legacy_labels:
+        print("警告: 记忆化结果与逐行计算不一致")
+
+def bench_timestamps(args):
+    """时间戳解析：逐格式整列尝试 vs 样本探测格式 + 去重解析"""
+    rng = random.Random(42)
+    # 日志格式排在候选列表第二位，原实现需要先整列试一遍第一个格式
+    values = pd.Series([f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} "
+                        f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00" for _ in range(args.rows)], dtype='str')
+    print(f"{args.rows} 个时间戳, {values.nunique()} 个不同值")
+    legacy, legacy_sec = time_call(lambda: legacy_parse_timestamps(values))
+    print(f"逐格式整列解析: {legacy_sec:.2f}秒")
+
+    def sniffed():
+        processor = XiaoXinBaoDataProcessor.from_frame(pd.DataFrame({'timestamp': values}))
+        processor.verbose = False
+        processor.parse_timestamp()
+        return processor.df['timestamp']
+
+    parsed, new_sec = time_call(sniffed)
+    print(f"探测格式+去重: {new_sec:.2f}秒, 加速比 {legacy_sec / new_sec:.2f}x")
+    if not parsed.equals(legacy):
+        print("警告: 解析结果与原实现不一致")
+
+def preprocess_export(csv_path, output_dir, incremental=False):
+    """整表预处理一次（不输出过程信息），incremental=True 时按 output_dir 中的增量标记只处理新行"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        processor = XiaoXinBaoDataProcessor(csv_path, verbose=False)
+        processor.load_data(columns=XiaoXinBaoDataProcessor.PIPELINE_COLUMNS)
+        processor.clean_column_names()
+        processor.parse_timestamp()
+        watermark = processor.load_watermark(output_dir) if incremental else None
+        if watermark is not None:
+            processor.select_new_rows(watermark)
+        processor.extract_dialogue_content()
+        processor.annotate()
+        return processor.save_processed_data(output_dir, watermark=watermark)
+
+def bench_incremental(args):
+    """每日重跑：全量重新预处理 vs 按高水位标记只处理新增行并追加"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, 'export.csv')
+        generate_synthetic_export(csv_path, args.rows)
+        # 按时间排序，末尾 new_fraction 的行作为“昨天新增”
+        export = pd.read_csv(csv_path, encoding='gbk', dtype=str)
+        export = export.iloc[pd.to_datetime(export['时间'], format='%Y/%m/%d %H:%M').argsort(kind='stable')]
+        history_rows = int(args.rows * (1 - args.new_fraction))
+        export.iloc[:history_rows].to_csv(csv_path, index=False, encoding='gbk')
+        incremental_dir = os.path.join(tmp_dir, 'incremental')
+        preprocess_export(csv_path, incremental_dir)
+        export.to_csv(csv_path, index=False, encoding='gbk')
+        print(f"{args.rows} 行, 其中新增 {args.rows - history_rows} 行")
+
+        expected, full_sec = time_call(lambda: preprocess_export(csv_path, os.path.join(tmp_dir, 'full')))
+        print(f"全量重跑: {full_sec:.2f}秒")
+        summary, new_sec = time_call(lambda: preprocess_export(csv_path, incremental_dir, incremental=True))
+        print(f"增量运行: {new_sec:.2f}秒, 加速比 {full_sec / new_sec:.2f}x")
+        if summary != expected:
+            print("警告: 增量摘要与全量重跑不一致")
+
+def bench_months(args):
+    """月度分析：逐月顺序执行 vs 进程池并行（各月独立读取、分析、写报告）"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, 'export.csv')
+        generate_synthetic_export(csv_path, args.rows)
+        preprocess_export(csv_path, tmp_dir)
+        print(f"{args.rows} 行, 12 个月份")
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            sequential, sequential_sec = time_call(lambda: process_all_months(tmp_dir, workers=1))
+            parallel, parallel_sec = time_call(lambda: process_all_months(tmp_dir, workers=args.workers))
+        workers = month_workers(args.workers, len(sequential))
+        print(f"顺序分析: {sequential_sec:.2f}秒")
+        if workers == 1:
+            print(f"并行分析: {parallel_sec:.2f}秒（CPU 核数或月份数不足，实际逐月顺序执行）")
+        else:
+            print(f"并行分析({workers}进程): {parallel_sec:.2f}秒, 加速比 {sequential_sec / parallel_sec:.2f}x")
+        if [report['month'] for report in parallel] != [report['month'] for report in sequential]:
+            print("警告: 并行分析的月份顺序与顺序执行不一致")
+
+def main():
+    parser = argparse.ArgumentParser(description='小馨宝运营分析性能基准测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    log_parser_cmd = subparsers.add_parser('log-parser', help='日志解析吞吐（行/秒）')
+    log_parser_cmd.add_argument('--lines', type=int, default=2000000, help='合成日志行数，默认 2000000')
+    log_parser_cmd.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='并行解析进程数，默认CPU核数')
+    log_parser_cmd.set_defaults(func=bench_log_parser)
+
+    load_csv_cmd = subparsers.add_parser('load-csv', help='导出CSV加载耗时与内存')
+    load_csv_cmd.add_argument('--rows', type=int, default=500000, help='合成导出行数，默认 500000')
+    load_csv_cmd.add_argument('--engine', type=str, default=None, choices=['c', 'pyarrow'], help='CSV 解析器')
+    load_csv_cmd.set_defaults(func=bench_load_csv)
+
+    lexicon_cmd = subparsers.add_parser('lexicon', help='关键词分类吞吐（条/秒）')
+    lexicon_cmd.add_argument('--keywords', type=int, default=10000, help='关键词总数，默认 10000')
+    lexicon_cmd.add_argument('--rows', type=int, default=20000, help='文本条数，默认 20000')
+    lexicon_cmd.set_defaults(func=bench_lexicon)
+
+    clean_cmd = subparsers.add_parser('clean', help='对话清洗吞吐（条/秒）')
+    clean_cmd.add_argument('--rows', type=int, default=500000, help='对话条数，默认 500000')
+    clean_cmd.set_defaults(func=bench_clean)
+
+    memo_cmd = subparsers.add_parser('memo', help='重复对话的清洗与分类吞吐（条/秒）')
+    memo_cmd.add_argument('--rows', type=int, default=500000, help='对话条数，默认 500000')
+    memo_cmd.add_argument('--distinct', type=int, default=5000, help='不同对话内容数，默认 5000')
+    memo_cmd.add_argument('--workers', type=int, default=1, help='清洗和分类的并行进程数，默认 1')
+    memo_cmd.set_defaults(func=bench_memo)
+
+    timestamps_cmd = subparsers.add_parser('timestamps', help='时间戳解析耗时')
+    timestamps_cmd.add_argument('--rows', type=int, default=1000000, help='时间戳个数，默认 1000000')
+    timestamps_cmd.set_defaults(func=bench_timestamps)
+
+    incremental_cmd = subparsers.add_parser('incremental', help='每日重跑：全量 vs 增量预处理耗时')
+    incremental_cmd.add_argument('--rows', type=int, default=500000, help='导出总行数，默认 500000')
+    incremental_cmd.add_argument('--new-fraction', type=float, default=0.01, help='新增行占比，默认 0.01')
+    incremental_cmd.set_defaults(func=bench_incremental)
+
+    months_cmd = subparsers.add_parser('months', help='月度分析：顺序 vs 并行耗时')
+    months_cmd.add_argument('--rows', type=int, default=500000, help='导出总行数（分布在 12 个月），默认 500000')
+    months_cmd.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='并行分析进程数，默认CPU核数')
+    months_cmd.set_defaults(func=bench_months)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+压缩文件的流式读取（.gz/.bz2/.xz/.zst）
+
+日志和CSV可以直接以压缩归档形式输入，边解压边读取，不落地临时文件。
+.zst 需要可选依赖 zstandard。
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+import os
+
+try:
+    import zstandard  # type: ignore
+except ImportError:
+    zstandard = None
+
+# 文件后缀 -> pandas compression 参数
+COMPRESSION_SUFFIXES = {
+    '.gz': 'gzip',
+    '.bz2': 'bz2',
+    '.xz': 'xz',
+    '.zst': 'zstd',
+}
+
+def compression_of(path):
+    """根据后缀返回压缩格式（与 pandas 的 compression 参数一致），未压缩返回 None"""
+    return COMPRESSION_SUFFIXES.get(os.path.splitext(str(path))[1].lower())
+
+def strip_compression_suffix(path):
+    """去掉压缩后缀：xyanb.log.gz -> xyanb.log"""
+    root, ext = os.path.splitext(str(path))
+    return root if ext.lower() in COMPRESSION_SUFFIXES else str(path)
+
+def open_binary(path):
+    """以二进制流打开文件，压缩文件透明解压"""
+    compression = compression_of(path)
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'bz2':
+        return bz2.open(path, 'rb')
+    if compression == 'xz':
+        return lzma.open(path, 'rb')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImportError("读取 .zst 文件需要安装 zstandard：pip install zstandard")
+        # stream_reader 不支持按行迭代，包一层缓冲
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True))
+    return open(path, 'rb')
+
+def seek_forward(f, offset, block_size=1024 * 1024):
+    """定位到解压后的 offset；不支持 seek 的流通过读取丢弃前面的数据"""
+    if f.seekable():
+        f.seek(offset)
+        return
+    remaining = offset
+    while remaining > 0:
+        block = f.read(min(block_size, remaining))
+        if not block:
+            break
+        remaining -= len(block)
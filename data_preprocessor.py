@@ -3,12 +3,30 @@ import numpy as np
 from datetime import datetime
 import json
 import re
-import re
 import os
+import codecs
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
 try:
     import yaml
+    # 有 libyaml 时使用 C 实现的 dumper
+    YAML_DUMPER = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
 except ImportError:
     yaml = None
+try:
+    # 可选：更快的 JSON 解析
+    from orjson import loads as json_loads  # type: ignore
+except ImportError:
+    json_loads = json.loads
+
+from compressed_io import open_binary
+import parquet_io
+from lexicon import Lexicon
+from memo import LRUMemo
+from annotation_cache import AnnotationCache, config_fingerprint
+from watermark import Watermark
+from summary_aggregate import SummaryAggregate, count_latencies, ordered_counts, ordered_topic_counts
 
 try:
     # 允许通过 .env 覆盖关键词配置
@@ -18,213 +36,501 @@ except Exception:
     # 可选依赖，不存在时忽略
     pass
 
+# 编码探测读取的样本大小
+ENCODING_SAMPLE_BYTES = 1024 * 1024
+
+# 探测时间格式使用的样本数（不同的时间字符串）
+TIMESTAMP_SAMPLE_SIZE = 1000
+
+# 分块预处理每块的行数
+DEFAULT_CHUNK_ROWS = 100000
+
+# YAML 输出每批序列化的行数
+YAML_BATCH_ROWS = 10000
+
+# 重复 JSON 载荷的解析结果缓存条数
+PAYLOAD_CACHE_SIZE = 65536
+
+# 并行清洗/分类时每个进程分到的分片数，以及启用进程池的最少不同文本数
+SHARDS_PER_WORKER = 4
+PARALLEL_MIN_TEXTS = 10000
+
+# 对话清洗的预编译正则
+GARBLED_PATTERN = re.compile(r'[→ʱ��]')
+CONTENT_PATTERN = re.compile(r'"content"\s*:\s*"([^"]*)"')
+JSON_CHARS_PATTERN = re.compile(r'[\[\]{}",:]')
+JSON_WORDS_PATTERN = re.compile(r'type|text|content|interactive|userSelect|params|description|value|key')
+CHINESE_PATTERN = re.compile(r'[\u4e00-\u9fff\w\s，。！？；：、（）]+')
+
+# 清洗逻辑版本：修改 _clean_dialogue_text 等清洗规则时递增，
+# 与上面的正则一起组成持久化缓存中 cleaned 结果的指纹，旧版本的清洗结果随之失效
+CLEANER_VERSION = 1
+CLEANER_FINGERPRINT = config_fingerprint(CLEANER_VERSION, GARBLED_PATTERN.pattern, CONTENT_PATTERN.pattern,
+                                         JSON_CHARS_PATTERN.pattern, JSON_WORDS_PATTERN.pattern,
+                                         CHINESE_PATTERN.pattern)
+
+def _collect_payload_text(node, contents, others):
+    """按文档顺序收集 content 文本，以及 text 文本和 userSelect 交互的描述/选项"""
+    if isinstance(node, list):
+        for item in node:
+            _collect_payload_text(item, contents, others)
+        return
+    if not isinstance(node, dict):
+        return
+    if isinstance(node.get('content'), str):
+        contents.append(node['content'])
+    if isinstance(node.get('text'), str):
+        others.append(node['text'])
+    if node.get('type') == 'userSelect' and isinstance(node.get('params'), dict):
+        params = node['params']
+        if isinstance(params.get('description'), str):
+            others.append(params['description'])
+        selected = params.get('userSelectedVal')
+        if isinstance(selected, str) and selected:
+            others.append(selected)
+        else:
+            others.extend(option['value'] for option in params.get('userSelectOptions') or []
+                          if isinstance(option, dict) and isinstance(option.get('value'), str))
+    for value in node.values():
+        if isinstance(value, (dict, list)):
+            _collect_payload_text(value, contents, others)
+
+@lru_cache(maxsize=PAYLOAD_CACHE_SIZE)
+def _extract_json_payload(text):
+    """
+    解析 FastGPT 的 JSON 载荷并提取文本，无法解析或没有可提取的节点时返回 None。
+    有 content 节点时只取 content（与正则提取一致），否则取 text / userSelect 节点。
+    重复出现的载荷（菜单点击、模板消息）直接命中缓存。
+    """
+    contents, others = [], []
+    try:
+        # 嵌套过深的载荷（解析或递归遍历超出递归深度）交给正则兜底
+        _collect_payload_text(json_loads(text), contents, others)
+    except (ValueError, RecursionError):
+        return None
+    parts = contents or others
+    if not parts:
+        return None
+    return ' '.join(parts).replace('\n', ' ')
+
+def _clean_dialogue_text(text, remove_garbled=GARBLED_PATTERN.sub, find_content=CONTENT_PATTERN.findall,
+                         remove_json_chars=JSON_CHARS_PATTERN.sub, remove_json_words=JSON_WORDS_PATTERN.sub,
+                         find_chinese=CHINESE_PATTERN.findall):
+    # 移除常见的乱码字符
+    text = remove_garbled('', text)
+    
+    # 快速路径：不含反斜杠时字符串值里没有转义，正则提取的 content 与按结构解析完全相同，不必解码 JSON
+    has_content = '"content"' in text
+    if has_content and '\\' not in text:
+        content_matches = find_content(text)
+        if content_matches:
+            return ' '.join(content_matches)
+    
+    # 含转义（引号、\n、\uXXXX）或只有 text / userSelect 节点的 JSON 载荷按结构提取
+    if text.lstrip()[:1] in ('[', '{'):
+        extracted = _extract_json_payload(text)
+        if extracted is not None:
+            return extracted
+    
+    # 其余情况用正则提取 content 字段（CONTENT_PATTERN 以 "content" 开头，先做子串判断）
+    if has_content:
+        content_matches = find_content(text)
+        if content_matches:
+            # 合并所有找到的内容，移除转义字符
+            return ' '.join(content_matches).replace('\\n', ' ').replace('\\"', '"')
+    
+    # 如果没有找到JSON格式，尝试提取纯文本：移除JSON结构字符，保留中文内容
+    # split/join 与 re.sub(r'\s+', ' ', ...).strip() 等价（同为 Unicode 空白）
+    text_only = ' '.join(remove_json_words('', remove_json_chars(' ', text)).split())
+    
+    # 提取中文文本段落
+    chinese_matches = find_chinese(text_only)
+    if chinese_matches:
+        return ' '.join(chinese_matches).strip()
+    return text_only
+
+# 进程池 worker 内的 (关键词自动机, 话题列表)，由 initializer 每个进程构建一次
+_worker_lexicon = None
+
+def _init_annotation_worker(lexicons, topic_names):
+    global _worker_lexicon
+    _worker_lexicon = (Lexicon(lexicons), topic_names)
+
+def _clean_shard(texts):
+    return [XiaoXinBaoDataProcessor._clean_text(text) for text in texts]
+
+def _label_shard(texts):
+    lexicon, topic_names = _worker_lexicon
+    return [XiaoXinBaoDataProcessor._label(lexicon, topic_names, text) for text in texts]
+
 class XiaoXinBaoDataProcessor:
-    def __init__(self, file_path):
+    ENCODINGS = ['utf-8', 'gbk', 'gb2312', 'cp936']
+    
+    # 平台导出CSV的标准列名（按列位置对应）
+    STANDARD_COLUMNS = [
+        'timestamp', 'source', 'user_id', 'contact_type', 
+        'title', 'message_type', 'user_agreement', 'user_reply',
+        'auto_reply', 'notes', 'dialogue_content'
+    ]
+    
+    # 预处理和月度分析实际用到的列（含日志解析结果的回复列）
+    PIPELINE_COLUMNS = ['timestamp', 'user_id', 'dialogue_content',
+                        'bot_reply', 'reply_timestamp', 'reply_latency_ms']
+    
+    # 候选时间格式（平台导出为 2025/7/28 14:32，日志解析结果为 2025-07-28 14:32:00）
+    TIMESTAMP_FORMATS = ['%Y/%m/%d %H:%M', '%Y-%m-%d %H:%M:%S', '%Y/%m/%d', '%Y-%m-%d']
+    
+    # 分类标签取值，标注结果以 category 类型保存
+    USER_TYPES = ['patient_family', 'volunteer', 'medical_professional', 'other']
+    SENTIMENTS = ['positive', 'negative', 'neutral']
+    
+    # 显式列类型（低基数的来源、联系方式列用 category），跳过 pandas 的类型推断；未列出的列（如消息总数）仍自动推断
+    COLUMN_DTYPES = {
+        'timestamp': str, 'source': 'category', 'user_id': str, 'contact_type': 'category', 'title': str,
+        'user_agreement': str, 'user_reply': str, 'auto_reply': str, 'notes': str,
+        'dialogue_content': str, 'bot_reply': str, 'reply_timestamp': str,
+        'reply_latency_ms': 'Int64',
+    }
+    
+    def __init__(self, file_path, verbose=True):
         self.file_path = file_path
         self.df = None
+        # 最近一次分类得到的分布，摘要直接复用
+        self.distributions = {}
+        # 分块处理时每块的处理器关闭各阶段的过程输出
+        self.verbose = verbose
+        # 按对话内容记忆化的清洗和分类结果，分块处理时各块共享
+        self.clean_memo = LRUMemo()
+        self.annotation_memo = LRUMemo()
+        # 可选的持久化标注缓存（annotation_cache.AnnotationCache），重跑时只计算新出现的对话
+        self.annotation_cache = None
+        # 清洗和分类的并行进程数，1 为单进程
+        self.workers = 1
+        # 时间格式，None 时由 parse_timestamp 从样本探测
+        self.timestamp_format = None
+        # 话题 -> 位序号（见 topic_mask_columns），未配置话题时为空
+        self.topic_ids = {}
+    
+    def _log(self, *args):
+        if self.verbose:
+            print(*args)
+    
+    def open_annotation_cache(self, path):
+        """启用持久化标注缓存（SQLite 文件），已缓存的对话不再重新清洗和分类"""
+        self.annotation_cache = AnnotationCache(path)
+        return self.annotation_cache
+    
+    def close_annotation_cache(self):
+        """关闭持久化标注缓存，返回并输出本次运行由缓存提供的行数"""
+        if self.annotation_cache is None:
+            return None
+        stats = {
+            'rows': self.clean_memo.hits + self.clean_memo.misses,
+            'cleaned_from_cache': self.clean_memo.store_hits,
+            'annotated_from_cache': self.annotation_memo.store_hits,
+            'written': self.annotation_cache.writes,
+        }
+        self.annotation_cache.close()
+        self.annotation_cache = None
+        print(f"持久化标注缓存: 共 {stats['rows']} 行，清洗 {stats['cleaned_from_cache']} 行、"
+              f"标注 {stats['annotated_from_cache']} 行来自缓存，新写入 {stats['written']} 条")
+        return stats
+    
+    @classmethod
+    def from_frame(cls, df, source_name='<memory>'):
+        """直接使用内存中的 DataFrame（如 LogParser 的解析结果），无需 load_data"""
+        processor = cls(source_name)
+        processor.df = df
+        return processor
         
-    def load_data(self):
-        """加载并修复编码问题"""
+    def load_data(self, columns=None, engine=None):
+        """加载并修复编码问题
+
+        编码从文件开头的有限样本中探测，整个文件只解析一次（显式 dtype，不做类型推断）。
+        columns: 只加载这些标准列（如 PIPELINE_COLUMNS），加载时即完成列名标准化；
+        engine: 传 'pyarrow' 使用 pyarrow 的 CSV 解析器（需安装 pyarrow）。
+        """
+        if engine == 'pyarrow' and importlib.util.find_spec('pyarrow') is None:
+            print("未安装 pyarrow，使用默认 CSV 解析器")
+            engine = None
         try:
-            # 尝试多种编码方式
-            encodings = ['utf-8', 'gbk', 'gb2312', 'cp936']
+            encoding = self.detect_encoding()
+            # 样本之后仍可能出现无法解码的字节，此时依次尝试其余编码
+            encodings = [encoding] + [e for e in self.ENCODINGS if e != encoding] if encoding else []
             for encoding in encodings:
                 try:
-                    self.df = pd.read_csv(self.file_path, encoding=encoding)
+                    self.df = self._read_csv(encoding, columns, engine)
                     print(f"成功使用 {encoding} 编码加载数据")
                     break
                 except UnicodeDecodeError:
                     continue
             
             if self.df is None:
-                # 如果都失败，使用二进制模式读取并修复
-                with open(self.file_path, 'rb') as f:
-                    content = f.read()
-                # 尝试修复乱码
-                content = content.decode('utf-8', errors='ignore')
-                from io import StringIO
-                self.df = pd.read_csv(StringIO(content))
+                # 如果都失败，按 utf-8 读取并忽略无法解码的字节（修复乱码）
+                self.df = self._read_csv('utf-8', columns, None, encoding_errors='ignore')
                 
         except Exception as e:
             print(f"加载数据失败: {e}")
             return False
         return True
     
-    def clean_column_names(self):
-        """清理和标准化列名"""
-        # 如果已经是解析后的日志格式，跳过重命名
-        if 'dialogue_content' in self.df.columns and 'timestamp' in self.df.columns:
-            print("检测到已解析的日志格式，跳过列重命名")
-            return self.df.columns.tolist()
-
-        # 修复乱码列名，提供标准化的列名映射
-        original_columns = self.df.columns.tolist()
-        
-        # 基于常见CSV结构定义标准列名
-        standard_columns = [
-            'timestamp', 'source', 'user_id', 'contact_type', 
-            'title', 'message_type', 'user_agreement', 'user_reply',
-            'auto_reply', 'notes', 'dialogue_content'
-        ]
+    def detect_encoding(self, sample_bytes=ENCODING_SAMPLE_BYTES):
+        """用文件开头的样本探测编码，均无法解码时返回 None"""
+        with open_binary(self.file_path) as f:
+            sample = f.read(sample_bytes)
+            complete = not f.read(1)
+        for encoding in self.ENCODINGS:
+            try:
+                # 样本末尾可能截断在多字节字符中间，未读完时不要求以完整字符结尾
+                codecs.getincrementaldecoder(encoding)().decode(sample, final=complete)
+                return encoding
+            except UnicodeDecodeError:
+                continue
+        return None
+    
+    def _read_csv(self, encoding, columns=None, engine=None, chunksize=None, **kwargs):
+        """读取CSV；指定 chunksize 时返回按块迭代的 DataFrame"""
+        header = pd.read_csv(self.file_path, encoding=encoding, nrows=0, **kwargs).columns.tolist()
+        column_mapping = self._column_mapping(header)
+        usecols = None
+        if columns is not None:
+            usecols = [col for col in header if column_mapping[col] in columns]
+        dtype = {col: self.COLUMN_DTYPES[column_mapping[col]] for col in (usecols or header)
+                 if column_mapping[col] in self.COLUMN_DTYPES}
+        if engine:
+            kwargs['engine'] = engine
+        df = pd.read_csv(self.file_path, encoding=encoding, usecols=usecols, dtype=dtype, chunksize=chunksize, **kwargs)
+        if columns is None:
+            return df
+        # 列被裁剪后无法再按位置映射，加载时直接换成标准列名
+        if chunksize:
+            return (chunk.rename(columns=column_mapping) for chunk in df)
+        return df.rename(columns=column_mapping)
+    
+    @classmethod
+    def _column_mapping(cls, original_columns):
+        """原始列名 -> 标准列名；已解析的日志格式保持不变"""
+        if 'dialogue_content' in original_columns and 'timestamp' in original_columns:
+            return {col: col for col in original_columns}
         
-        # 创建列名映射
+        # 基于常见CSV结构按位置映射标准列名
         column_mapping = {}
         for i, col in enumerate(original_columns):
-            if i < len(standard_columns):
-                column_mapping[col] = standard_columns[i]
+            if i < len(cls.STANDARD_COLUMNS):
+                column_mapping[col] = cls.STANDARD_COLUMNS[i]
             else:
                 # 对于超出预期的列，进行清理
                 clean_name = re.sub(r'[^\w\u4e00-\u9fff]', '', str(col))
                 column_mapping[col] = clean_name or f'column_{i}'
-        
+        return column_mapping
+    
+    def clean_column_names(self):
+        """清理和标准化列名"""
+        # 如果已经是解析后的日志格式，跳过重命名
+        if 'dialogue_content' in self.df.columns and 'timestamp' in self.df.columns:
+            self._log("检测到已解析的日志格式，跳过列重命名")
+            return self.df.columns.tolist()
+
+        # 修复乱码列名，提供标准化的列名映射
+        column_mapping = self._column_mapping(self.df.columns.tolist())
         self.df = self.df.rename(columns=column_mapping)
-        print(f"列名映射: {dict(list(column_mapping.items())[:5])}")
+        self._log(f"列名映射: {dict(list(column_mapping.items())[:5])}")
         return self.df.columns.tolist()
     
     def parse_timestamp(self):
-        """解析时间戳"""
+        """
+        解析时间戳：相同的时间字符串只解析一次（先去重），格式由样本探测
+        （或预先设置 self.timestamp_format，如日志解析结果），整列按该格式解析一遍；
+        不符合该格式的值再逐个自动推断，仍无法解析的为 NaT。
+        """
         # 使用标准化的时间戳列名
-        if 'timestamp' in self.df.columns:
-            # 先尝试多种时间格式
-            time_formats = ['%Y/%m/%d %H:%M', '%Y-%m-%d %H:%M:%S', '%Y/%m/%d', '%Y-%m-%d']
-            
-            for fmt in time_formats:
-                try:
-                    self.df['parsed_timestamp'] = pd.to_datetime(self.df['timestamp'], format=fmt, errors='coerce')
-                    if self.df['parsed_timestamp'].notna().sum() > 0:
-                        break
-                except:
-                    continue
+        if 'timestamp' in self.df.columns and not pd.api.types.is_datetime64_any_dtype(self.df['timestamp']):
+            codes, uniques = pd.factorize(self.df['timestamp'])
+            uniques = pd.Index(uniques.astype(str))
+            if self.timestamp_format is None:
+                self.timestamp_format = self.detect_timestamp_format(uniques)
             
-            # 如果格式化失败，使用通用解析
-            if 'parsed_timestamp' not in self.df.columns or self.df['parsed_timestamp'].notna().sum() == 0:
-                self.df['parsed_timestamp'] = pd.to_datetime(self.df['timestamp'], errors='coerce')
+            if self.timestamp_format:
+                parsed = pd.to_datetime(uniques, format=self.timestamp_format, errors='coerce').array
+                # 不符合探测格式的值逐个推断；带时区的值无法放进不带时区的列，记为 NaT
+                unmatched = parsed.isna()
+                if unmatched.any():
+                    fallback = self._parse_mixed(uniques[unmatched])
+                    if fallback.tz is not None:
+                        fallback = pd.DatetimeIndex([pd.NaT] * len(fallback))
+                    parsed[unmatched] = fallback.as_unit(parsed.unit)
+            else:
+                parsed = self._parse_mixed(uniques).array
             
-            # 替换原时间戳列
-            self.df['timestamp'] = self.df['parsed_timestamp']
-            self.df = self.df.drop('parsed_timestamp', axis=1)
+            # 空值（code 为 -1）取 NaT
+            self.df['timestamp'] = pd.Series(parsed.take(codes, allow_fill=True), index=self.df.index)
             
         self.df['year_month'] = self.df['timestamp'].dt.to_period('M')
         valid_timestamps = self.df['timestamp'].notna().sum()
-        print(f"成功解析时间戳: {valid_timestamps}/{len(self.df)}")
+        self._log(f"成功解析时间戳: {valid_timestamps}/{len(self.df)}")
         return valid_timestamps
     
+    @staticmethod
+    def _parse_mixed(values):
+        """
+        逐值推断格式解析，无法解析的为 NaT。带时区与不带时区的值混在一起时 pandas 整体报错，
+        此时逐个解析，带时区的值记为 NaT。
+        """
+        try:
+            return pd.to_datetime(values, format='mixed', errors='coerce')
+        except ValueError:
+            parsed = [pd.to_datetime(value, errors='coerce') for value in values]
+            return pd.DatetimeIndex([pd.NaT if pd.isna(value) or value.tzinfo is not None else value
+                                     for value in parsed])
+    
+    @classmethod
+    def detect_timestamp_format(cls, values, sample_size=TIMESTAMP_SAMPLE_SIZE):
+        """在前 sample_size 个值上尝试候选格式，返回匹配最多的格式（并列时取靠前的），都不匹配返回 None"""
+        sample = pd.Index(values[:sample_size])
+        best_format, best_matches = None, 0
+        for fmt in cls.TIMESTAMP_FORMATS:
+            matches = int(pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum())
+            if matches > best_matches:
+                best_format, best_matches = fmt, matches
+        return best_format
+    
     def extract_dialogue_content(self):
         """提取对话内容"""
         # 使用标准化的对话内容列名
         dialogue_col = 'dialogue_content'
         
-        def clean_dialogue(text):
-            if pd.isna(text):
-                return ""
-            
-            text = str(text)
-            
-            # 移除常见的乱码字符
-            text = re.sub(r'[→ʱ��]', '', text)
-            
-            # 尝试从JSON格式中提取内容
-            try:
-                # 提取所有content字段的内容
-                content_pattern = r'"content"\s*:\s*"([^"]*)"'
-                content_matches = re.findall(content_pattern, text)
-                
-                if content_matches:
-                    # 合并所有找到的内容
-                    extracted_content = ' '.join(content_matches)
-                    # 移除转义字符
-                    extracted_content = extracted_content.replace('\\n', ' ').replace('\\"', '"')
-                    return extracted_content
-                
-                # 如果没有找到JSON格式，尝试提取纯文本
-                # 移除JSON结构字符，保留中文内容
-                text_only = re.sub(r'[\[\]{}",:]', ' ', text)
-                text_only = re.sub(r'type|text|content|interactive|userSelect|params|description|value|key', '', text_only)
-                text_only = re.sub(r'\s+', ' ', text_only).strip()
-                
-                # 提取中文文本段落
-                chinese_pattern = r'[\u4e00-\u9fff\w\s，。！？；：、（）]+'
-                chinese_matches = re.findall(chinese_pattern, text_only)
-                
-                if chinese_matches:
-                    return ' '.join(chinese_matches).strip()
-                
-                return text_only
-                
-            except Exception as e:
-                print(f"对话提取错误: {e}")
-                return str(text)
-        
-        self.df['clean_dialogue'] = self.df[dialogue_col].apply(clean_dialogue)
+        self.df['clean_dialogue'] = self.clean_dialogues(self.df[dialogue_col])
+        # 对话内容变了，之前的分类结果作废
+        self.distributions = {}
         avg_length = self.df['clean_dialogue'].str.len().mean()
-        print(f"对话内容提取完成，平均长度: {avg_length:.2f}字符")
+        self._log(f"对话内容提取完成，平均长度: {avg_length:.2f}字符")
         
         # 显示一些样本用于验证
-        print("对话内容样本:")
-        for i, content in enumerate(self.df['clean_dialogue'].head(3)):
-            print(f"样本{i+1}: {content[:100]}{'...' if len(content) > 100 else ''}")
-        
+        if self.verbose:
+            print("对话内容样本:")
+            for i, content in enumerate(self.df['clean_dialogue'].head(3)):
+                print(f"样本{i+1}: {content[:100]}{'...' if len(content) > 100 else ''}")
+
         return avg_length
     
+    def clean_dialogues(self, texts):
+        """
+        按列清洗对话内容，返回与 texts 同索引的 Series，结果与逐行清洗完全一致：
+        - 含 "content" 字段的 JSON 载荷：提取所有 content 值并合并
+        - 其他文本：移除 JSON 结构字符和字段名，保留中文文本段落
+        正则全部预编译并以绑定方法调用；不含 "content" 的行直接走纯文本路径，不做 findall。
+        空值清洗为空字符串。重复的原始对话只清洗一次（clean_memo 及持久化标注缓存），
+        workers > 1 时不同的对话分片并行清洗。
+        """
+        cache = self.annotation_cache
+        if cache is not None:
+            lookup = partial(cache.get_clean, fingerprint=CLEANER_FINGERPRINT)
+            save = partial(cache.put_clean, fingerprint=CLEANER_FINGERPRINT)
+        else:
+            lookup = save = None
+        # 字符串列的去重值都是 str，省去逐个 str() 的包装调用
+        clean = _clean_dialogue_text if pd.api.types.is_string_dtype(texts) else self._clean_text
+        cleaned = self.clean_memo.map(texts, clean, na_key='',
+                                      compute_many=self._compute_many(clean, _clean_shard),
+                                      lookup=lookup, save=save)
+        return pd.Series(cleaned, index=texts.index)
+    
+    @staticmethod
+    def _clean_text(text):
+        return _clean_dialogue_text(str(text))
+    
+    def _compute_many(self, compute, shard_func, initargs=()):
+        """
+        批量计算不同文本的结果：workers > 1 且文本足够多时，把文本按顺序切成分片
+        交给进程池（initializer 每个进程只执行一次），按分片顺序拼回，与逐个 compute 结果一致。
+        """
+        def compute_many(keys):
+            if self.workers <= 1 or len(keys) < PARALLEL_MIN_TEXTS:
+                return list(map(compute, keys))
+            shard_size = -(-len(keys) // (self.workers * SHARDS_PER_WORKER))
+            shards = [keys[start:start + shard_size] for start in range(0, len(keys), shard_size)]
+            initializer = _init_annotation_worker if initargs else None
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=initializer, initargs=initargs) as executor:
+                return [result for shard in executor.map(shard_func, shards) for result in shard]
+        return compute_many
+    
+    def load_user_keywords(self):
+        """用户分类关键词：优先 JSON，其次逗号分隔列表，最后使用内置默认值"""
+        # JSON 结构：{"patient_family": [...], "volunteer": [...], "medical_professional": [...]}
+        json_str = os.getenv('USER_CATEGORY_KEYWORDS', '').strip()
+        if json_str:
+            try:
+                data = json.loads(json_str)
+                # 基本校验
+                if isinstance(data, dict):
+                    return {
+                        'patient_family': list(data.get('patient_family', [])),
+                        'volunteer': list(data.get('volunteer', [])),
+                        'medical_professional': list(data.get('medical_professional', [])),
+                    }
+            except Exception:
+                pass
+        # 兼容逗号分隔的独立变量
+        return {
+            'patient_family': self._split_list(os.getenv('PATIENT_KEYWORDS', '')) or ['患者', '病人', '家属', '家人', '老公', '老婆', '妈妈', '爸爸', '儿子', '女儿', '确诊', '化疗', '放疗', '手术', '癌症', '肿瘤', '检查', '治疗'],
+            'volunteer': self._split_list(os.getenv('VOLUNTEER_KEYWORDS', '')) or ['志愿者', '志愿', '帮助', '陪伴', '支持', '倾听', '服务', '援助'],
+            'medical_professional': self._split_list(os.getenv('MEDICAL_KEYWORDS', '')) or ['医生', '医师', '护士', '专业', '医疗', '临床', '诊断', '用药', '医院'],
+        }
+    
+    @staticmethod
+    def _split_list(value):
+        if not value:
+            return []
+        # 支持中文逗号、顿号
+        return [p.strip() for p in re.split(r'[，,、]', value) if p.strip()]
+    
+    def lexicon(self):
+        """
+        用户、话题、情感三类关键词表合并编译成的自动机，类别为 (分类, 标签)。
+        关键词配置（.env / JSON 配置文件）变化时自动重建。
+        """
+        groups = (
+            ('user', self.load_user_keywords()),
+            ('topic', self.load_topic_keywords()),
+            ('sentiment', self.load_sentiment_words()),
+        )
+        lexicons = {(group, str(label)): [str(word) for word in words]
+                    for group, keywords in groups for label, words in keywords.items()}
+        fingerprint = json.dumps(sorted(lexicons.items()), ensure_ascii=False)
+        if getattr(self, '_lexicon_fingerprint', None) != fingerprint:
+            self._lexicon = Lexicon(lexicons)
+            self._lexicon_fingerprint = fingerprint
+            # 并行分类时发给各进程重建自动机
+            self._lexicons = lexicons
+        return self._lexicon
+    
+    @staticmethod
+    def _classify_user(counts):
+        """由关键词命中数判定用户类型"""
+        patient_score = counts.get(('user', 'patient_family'), 0)
+        volunteer_score = counts.get(('user', 'volunteer'), 0)
+        medical_score = counts.get(('user', 'medical_professional'), 0)
+        
+        # 根据最高得分分类
+        if patient_score > 0 and patient_score >= volunteer_score and patient_score >= medical_score:
+            return 'patient_family'
+        elif volunteer_score > 0 and volunteer_score >= medical_score:
+            return 'volunteer'
+        elif medical_score > 0:
+            return 'medical_professional'
+        else:
+            return 'other'
+    
     def categorize_users(self):
         """用户分类"""
-        # 从环境变量读取用户分类关键词，优先 JSON，其次逗号分隔列表，最后使用内置默认值
-        def load_user_keywords():
-            # JSON 结构：{"patient_family": [...], "volunteer": [...], "medical_professional": [...]}
-            json_str = os.getenv('USER_CATEGORY_KEYWORDS', '').strip()
-            if json_str:
-                try:
-                    data = json.loads(json_str)
-                    # 基本校验
-                    if isinstance(data, dict):
-                        return {
-                            'patient_family': list(data.get('patient_family', [])),
-                            'volunteer': list(data.get('volunteer', [])),
-                            'medical_professional': list(data.get('medical_professional', [])),
-                        }
-                except Exception:
-                    pass
-            # 兼容逗号分隔的独立变量
-            def split_list(value):
-                if not value:
-                    return []
-                # 支持中文逗号、顿号
-                parts = [p.strip() for p in re.split(r'[，,、]', value) if p.strip()]
-                return parts
-            return {
-                'patient_family': split_list(os.getenv('PATIENT_KEYWORDS', '')) or ['患者', '病人', '家属', '家人', '老公', '老婆', '妈妈', '爸爸', '儿子', '女儿', '确诊', '化疗', '放疗', '手术', '癌症', '肿瘤', '检查', '治疗'],
-                'volunteer': split_list(os.getenv('VOLUNTEER_KEYWORDS', '')) or ['志愿者', '志愿', '帮助', '陪伴', '支持', '倾听', '服务', '援助'],
-                'medical_professional': split_list(os.getenv('MEDICAL_KEYWORDS', '')) or ['医生', '医师', '护士', '专业', '医疗', '临床', '诊断', '用药', '医院'],
-            }
-
-        user_keywords = load_user_keywords()
-
-        def classify_user(dialogue):
-            dialogue_str = str(dialogue)
-            
-            # 关键词匹配（支持 .env 覆盖）
-            patient_keywords = user_keywords.get('patient_family', [])
-            volunteer_keywords = user_keywords.get('volunteer', [])
-            medical_keywords = user_keywords.get('medical_professional', [])
-            
-            # 计算匹配度
-            patient_score = sum(1 for word in patient_keywords if word in dialogue_str)
-            volunteer_score = sum(1 for word in volunteer_keywords if word in dialogue_str)
-            medical_score = sum(1 for word in medical_keywords if word in dialogue_str)
-            
-            # 根据最高得分分类
-            if patient_score > 0 and patient_score >= volunteer_score and patient_score >= medical_score:
-                return 'patient_family'
-            elif volunteer_score > 0 and volunteer_score >= medical_score:
-                return 'volunteer'
-            elif medical_score > 0:
-                return 'medical_professional'
-            else:
-                return 'other'
-        
-        self.df['user_type'] = self.df['clean_dialogue'].apply(classify_user)
-        user_distribution = self.df['user_type'].value_counts().to_dict()
-        print(f"用户类型分布: {user_distribution}")
+        # 一次扫描得到各类别命中的关键词数（支持 .env 覆盖）
+        self.df['user_type'] = self._annotations()['user_type']
+        return self._user_distribution()
+    
+    def _user_distribution(self):
+        user_distribution = ordered_counts(self.df['user_type'].value_counts(sort=False).to_dict(), self.USER_TYPES)
+        self.distributions['user_type_distribution'] = user_distribution
+        self._log(f"用户类型分布: {user_distribution}")
         return user_distribution
 
     def load_breast_cancer_config(self):
@@ -238,8 +544,8 @@ class XiaoXinBaoDataProcessor:
                 print(f"加载配置文件失败: {e}")
         return None
 
-    def categorize_topics(self):
-        """按话题分类 (优选.env配置, 其次JSON)"""
+    def load_topic_keywords(self):
+        """话题关键词 (优选.env配置, 其次JSON)，都没有时返回空字典"""
         topics = {}
         
         # 1. 尝试从环境变量读取 (COMPATIBILITY with monthly_analyzer)
@@ -257,91 +563,183 @@ class XiaoXinBaoDataProcessor:
             config = self.load_breast_cancer_config()
             if config and 'topics' in config:
                 topics = config['topics']
-        
+        return topics
+
+    def categorize_topics(self):
+        """按话题分类 (优选.env配置, 其次JSON)"""
+        topics = self.load_topic_keywords()
         if not topics:
-            print("未找到话题配置(.env CONVERSATION_THEMES 或 JSON)，跳过话题分类")
+            self._log("未找到话题配置(.env CONVERSATION_THEMES 或 JSON)，跳过话题分类")
+            self.distributions['topic_distribution'] = {}
             return {}
         
-        def get_topic(text):
-            text_str = str(text)
-            matched_topics = []
-            for topic, keywords in topics.items():
-                if any(keyword in text_str for keyword in keywords):
-                    matched_topics.append(topic)
-            
-            if not matched_topics:
-                return 'other'
-            return ','.join(matched_topics) # Allow multi-label or just pick first? Picking join for now.
-
-        self.df['topics'] = self.df['clean_dialogue'].apply(get_topic)
-        
-        # Split multi-label for counting
-        all_topics = []
-        for t in self.df['topics']:
-            if t:
-                all_topics.extend(t.split(','))
+        labels = self._annotations()
+        self.df['topics'] = labels['topics']
+        for column in self.topic_mask_columns(len(self.topic_ids)):
+            self.df[column] = labels[column]
+        return self._topic_distribution()
+    
+    @staticmethod
+    def _match_topics(counts, topic_names):
+        matched_topics = [topic for topic in topic_names if counts.get(('topic', topic), 0) > 0]
         
-        from collections import Counter
-        topic_distribution = dict(Counter(all_topics))
-        print(f"话题分布: {topic_distribution}")
+        if not matched_topics:
+            return 'other'
+        return ','.join(matched_topics) # Allow multi-label or just pick first? Picking join for now.
+    
+    @staticmethod
+    def topic_mask_columns(topic_count):
+        """
+        位掩码列名：每列为 64 位的 uint64，序号为 i 的话题对应第 i // 64 列的第 i % 64 位。
+        第一列为 topic_mask，超过 64 个话题时依次增加 topic_mask_1、topic_mask_2 ……
+        """
+        return ['topic_mask' if word == 0 else f'topic_mask_{word}' for word in range((topic_count + 63) // 64)]
+    
+    @staticmethod
+    def _topic_mask(topics, topic_ids):
+        """逗号连接的话题 -> 位掩码（Python int，'other' 为 0）"""
+        mask = 0
+        for topic in topics.split(','):
+            if topic in topic_ids:
+                mask |= 1 << topic_ids[topic]
+        return mask
+    
+    def has_topic(self, topic):
+        """每行是否命中 topic 的布尔 Series（对所在的位掩码列做位运算）"""
+        word, bit = divmod(self.topic_ids[topic], 64)
+        mask = self.df[self.topic_mask_columns(len(self.topic_ids))[word]]
+        return (mask & np.uint64(1 << bit)) != 0
+    
+    def _topic_distribution(self):
+        # 多标签计数：每个话题一次位与
+        counts = {topic: int(self.has_topic(topic).sum()) for topic in self.topic_ids}
+        columns = self.topic_mask_columns(len(self.topic_ids))
+        counts['other'] = int((self.df[columns] == 0).all(axis=1).sum())
+        topic_distribution = ordered_topic_counts(counts, self.topic_ids)
+        self.distributions['topic_distribution'] = topic_distribution
+        self._log(f"话题分布: {topic_distribution}")
         return topic_distribution
     
+    def load_sentiment_words(self):
+        """情感词库：优先 JSON，其次逗号分隔，最后默认"""
+        # JSON 结构：{"positive": [...], "negative": [...], "neutral": [...]}
+        json_str = os.getenv('SENTIMENT_WORDS', '').strip()
+        if json_str:
+            try:
+                data = json.loads(json_str)
+                if isinstance(data, dict):
+                    return {
+                        'positive': list(data.get('positive', [])),
+                        'negative': list(data.get('negative', [])),
+                        'neutral': list(data.get('neutral', [])),
+                    }
+            except Exception:
+                pass
+        return {
+            'positive': self._split_list(os.getenv('POSITIVE_WORDS', '')) or ['谢谢', '感谢', '帮助', '有用', '好', '棒', '专业', '安慰', '支持', '鼓励', '温暖', '理解', '陪伴', '放心', '舒服', '开心', '满意', '赞'],
+            'negative': self._split_list(os.getenv('NEGATIVE_WORDS', '')) or ['担心', '害怕', '痛苦', '难受', '焦虑', '不好', '没用', '绝望', '沮丧', '恐惧', '抑郁', '烦躁', '失望', '无助', '孤独', '崩溃', '压抑'],
+            'neutral': self._split_list(os.getenv('NEUTRAL_WORDS', '')) or ['咨询', '询问', '了解', '知道', '请教', '想问', '如何', '什么', '怎么'],
+        }
+    
+    @staticmethod
+    def _classify_sentiment(counts, text_str):
+        """由情感词命中数判定情感倾向"""
+        positive_score = counts.get(('sentiment', 'positive'), 0)
+        negative_score = counts.get(('sentiment', 'negative'), 0)
+        neutral_score = counts.get(('sentiment', 'neutral'), 0)
+        
+        # 情感判断逻辑
+        if positive_score > negative_score and positive_score > 0:
+            return 'positive'
+        elif negative_score > positive_score and negative_score > 0:
+            return 'negative'
+        elif neutral_score > 0 or len(text_str.strip()) > 10:  # 有内容但无明显情感倾向
+            return 'neutral'
+        else:
+            return 'neutral'
+    
     def analyze_sentiment(self):
         """情感分析"""
-        # 从环境变量读取情感词库，优先 JSON，其次逗号分隔，最后默认
-        def load_sentiment_words():
-            # JSON 结构：{"positive": [...], "negative": [...], "neutral": [...]}
-            json_str = os.getenv('SENTIMENT_WORDS', '').strip()
-            if json_str:
-                try:
-                    data = json.loads(json_str)
-                    if isinstance(data, dict):
-                        return (
-                            list(data.get('positive', [])),
-                            list(data.get('negative', [])),
-                            list(data.get('neutral', [])),
-                        )
-                except Exception:
-                    pass
-            def split_list(value):
-                if not value:
-                    return []
-                return [p.strip() for p in re.split(r'[，,、]', value) if p.strip()]
-            positive = split_list(os.getenv('POSITIVE_WORDS', '')) or ['谢谢', '感谢', '帮助', '有用', '好', '棒', '专业', '安慰', '支持', '鼓励', '温暖', '理解', '陪伴', '放心', '舒服', '开心', '满意', '赞']
-            negative = split_list(os.getenv('NEGATIVE_WORDS', '')) or ['担心', '害怕', '痛苦', '难受', '焦虑', '不好', '没用', '绝望', '沮丧', '恐惧', '抑郁', '烦躁', '失望', '无助', '孤独', '崩溃', '压抑']
-            neutral = split_list(os.getenv('NEUTRAL_WORDS', '')) or ['咨询', '询问', '了解', '知道', '请教', '想问', '如何', '什么', '怎么']
-            return (positive, negative, neutral)
-
-        positive_words_default, negative_words_default, neutral_words_default = load_sentiment_words()
-
-        def get_sentiment(text):
-            text_str = str(text)
-            
-            # 情感词汇（支持 .env 覆盖）
-            positive_words = positive_words_default
-            negative_words = negative_words_default
-            neutral_words = neutral_words_default
-            
-            # 计算情感得分
-            positive_score = sum(1 for word in positive_words if word in text_str)
-            negative_score = sum(1 for word in negative_words if word in text_str)
-            neutral_score = sum(1 for word in neutral_words if word in text_str)
-            
-            # 情感判断逻辑
-            if positive_score > negative_score and positive_score > 0:
-                return 'positive'
-            elif negative_score > positive_score and negative_score > 0:
-                return 'negative'
-            elif neutral_score > 0 or len(text_str.strip()) > 10:  # 有内容但无明显情感倾向
-                return 'neutral'
-            else:
-                return 'neutral'
-        
-        self.df['sentiment'] = self.df['clean_dialogue'].apply(get_sentiment)
-        sentiment_distribution = self.df['sentiment'].value_counts().to_dict()
-        print(f"情感分布: {sentiment_distribution}")
+        # 计算情感得分（支持 .env 覆盖）
+        self.df['sentiment'] = self._annotations()['sentiment']
+        return self._sentiment_distribution()
+    
+    def _sentiment_distribution(self):
+        sentiment_distribution = ordered_counts(self.df['sentiment'].value_counts(sort=False).to_dict(), self.SENTIMENTS)
+        self.distributions['sentiment_distribution'] = sentiment_distribution
+        self._log(f"情感分布: {sentiment_distribution}")
         return sentiment_distribution
     
+    def annotate(self):
+        """
+        融合标注：一次遍历同时得到 user_type、sentiment 和 topics（未配置话题时不生成该列），
+        每条不同的对话只扫描一次关键词自动机。分布统计保存在 self.distributions，
+        save_processed_data 生成摘要时直接复用，不再重新分类。
+        """
+        labels = self._annotations()
+        self.df['user_type'] = labels['user_type']
+        self.df['sentiment'] = labels['sentiment']
+        self._user_distribution()
+        self._sentiment_distribution()
+        if 'topics' in labels:
+            self.df['topics'] = labels['topics']
+            for column in self.topic_mask_columns(len(self.topic_ids)):
+                self.df[column] = labels[column]
+            self._topic_distribution()
+        else:
+            self._log("未找到话题配置(.env CONVERSATION_THEMES 或 JSON)，跳过话题分类")
+            self.distributions['topic_distribution'] = {}
+        self._log(f"标注缓存命中率: {self.annotation_memo.hit_rate:.1%}")
+        return self.distributions
+    
+    @classmethod
+    def _label(cls, lexicon, topic_names, text):
+        """单条对话的 (user_type, sentiment, topics)"""
+        text_str = str(text)
+        counts = lexicon.count(text_str)
+        return (cls._classify_user(counts), cls._classify_sentiment(counts, text_str),
+                cls._match_topics(counts, topic_names))
+    
+    def _annotations(self):
+        """
+        按 clean_dialogue 内容记忆化的 (user_type, sentiment, topics) 标注，返回 {列名: Series}；
+        标签列为 category 类型，另有 uint64 位掩码列（topic_mask 等，第 i 位对应 self.topic_ids
+        中序号为 i 的话题，见 topic_mask_columns）。未配置话题时不含 topics 和位掩码列。
+        关键词配置或话题列表变化时缓存自动失效。
+        """
+        lexicon = self.lexicon()
+        topic_names = [str(topic) for topic in self.load_topic_keywords()]
+        self.annotation_memo.validate((self._lexicon_fingerprint, tuple(topic_names)))
+        
+        classify = partial(self._label, lexicon, topic_names)
+        texts = self.df['clean_dialogue']
+        cache = self.annotation_cache
+        if cache is not None:
+            fingerprint = config_fingerprint(self._lexicon_fingerprint, topic_names)
+            lookup = partial(cache.get_labels, fingerprint=fingerprint)
+            save = partial(cache.put_labels, fingerprint=fingerprint)
+        else:
+            lookup = save = None
+        compute_many = self._compute_many(classify, _label_shard, (self._lexicons, topic_names))
+        labels = self.annotation_memo.map(texts, classify, na_key='nan', compute_many=compute_many,
+                                          lookup=lookup, save=save)
+        index = texts.index
+        columns = {
+            'user_type': pd.Series(pd.Categorical([label[0] for label in labels], categories=self.USER_TYPES), index=index),
+            'sentiment': pd.Series(pd.Categorical([label[1] for label in labels], categories=self.SENTIMENTS), index=index),
+        }
+        self.topic_ids = {topic: i for i, topic in enumerate(topic_names)}
+        if topic_names:
+            topics = pd.Categorical([label[2] for label in labels])
+            # 每种话题组合只算一次掩码，再按类别编码展开
+            masks = [self._topic_mask(combo, self.topic_ids) for combo in topics.categories]
+            columns['topics'] = pd.Series(topics, index=index)
+            for word, column in enumerate(self.topic_mask_columns(len(topic_names))):
+                # 每列取掩码中的 64 位，Parquet / CSV 都能按 uint64 保存
+                words = np.array([(mask >> (64 * word)) & 0xFFFFFFFFFFFFFFFF for mask in masks], dtype=np.uint64)
+                columns[column] = pd.Series(words.take(topics.codes), index=index)
+        return columns
+    
     def split_by_month(self):
         """按月份分割数据"""
         monthly_data = {}
@@ -349,30 +747,117 @@ class XiaoXinBaoDataProcessor:
             monthly_data[str(month)] = group
         return monthly_data
     
-    def save_processed_data(self, output_dir, format='csv'):
-        """保存处理后的数据"""
+    def save_processed_data(self, output_dir, format='csv', watermark=None):
+        """
+        保存处理后的数据。format='parquet' 时写成按月分区的 Parquet 数据集（每行只写一次，
+        保留时间戳和 category 类型，需要 pyarrow）；csv/yaml 写完整清洗数据和按月的 CSV。
+        watermark（load_watermark 的结果）给定时为增量模式：self.df 只含标记之后的新行，
+        追加到已有的输出文件/分区，摘要在上次的基础上累加。两种模式最后都更新增量标记。
+        """
         import os
         os.makedirs(output_dir, exist_ok=True)
+        format = self._output_format(format)
+        append = watermark is not None
+        if watermark is None:
+            watermark = Watermark(self.output_config(format))
         
+        root = parquet_io.dataset_path(output_dir)
+        if not append:
+            # 月度分析优先读取分区数据集，无论哪种格式全量保存时都先清掉旧的数据集
+            parquet_io.reset_dataset(root)
+        if format == 'parquet':
+            monthly_counts = parquet_io.write_partitions(self.df, root, part_name=self._parquet_part(watermark.next_part))
+            watermark.next_part += 1
+            for month, count in monthly_counts.items():
+                print(f"保存月份分区: {root}/year_month={month}, 记录数: {count}")
+        else:
+            self._save_csv_outputs(output_dir, format, append)
+        
+        # 生成摘要统计（增量模式下与已处理数据的统计合并）
+        watermark.aggregate = watermark.aggregate.merge(self.summary_aggregate())
+        summary = self.summary(watermark.aggregate)
+        self._write_summary(output_dir, summary, format)
+        watermark.advance(self.df)
+        watermark.save(output_dir)
+        return summary
+    
+    def output_config(self, format):
+        """输出格式与关键词配置的指纹，增量标记只在两者都不变时有效"""
+        if format == 'parquet' and not parquet_io.available():
+            format = 'csv'
+        self.lexicon()
+        return config_fingerprint(format, self._lexicon_fingerprint)
+    
+    def load_watermark(self, output_dir, format='csv'):
+        """
+        读取 output_dir 中的增量标记。标记或上次的摘要不存在、输出格式或关键词配置
+        与上次不同时返回 None，此时应全量预处理。
+        """
+        watermark = Watermark.load(output_dir)
+        if watermark is None:
+            print("未找到增量标记，执行全量预处理")
+        elif watermark.config != self.output_config(format):
+            print("输出格式或关键词配置已变化，执行全量预处理")
+        else:
+            return watermark
+        return None
+    
+    def select_new_rows(self, watermark):
+        """只保留增量标记之后的行（需先 parse_timestamp），返回保留的行数"""
+        self.df = self.df[watermark.new_rows(self.df)]
+        self.distributions = {}
+        return len(self.df)
+    
+    def summary_aggregate(self):
+        """当前 self.df 的可合并摘要统计，分布复用已计算的结果"""
+        timestamps = self.df['timestamp']
+        start, end = timestamps.min(), timestamps.max()
+        # 机器人回复延迟，仅日志解析的数据有 reply_latency_ms 列
+        latency_counts = count_latencies(self.df['reply_latency_ms']) if 'reply_latency_ms' in self.df.columns else {}
+        return SummaryAggregate(
+            total_records=len(self.df),
+            start=start if pd.notna(start) else None,
+            end=end if pd.notna(end) else None,
+            user_types=self._memoized('user_type_distribution', self.categorize_users),
+            sentiments=self._memoized('sentiment_distribution', self.analyze_sentiment),
+            topics=self._memoized('topic_distribution', self.categorize_topics),
+            monthly_counts={str(month): int(count) for month, count in self.df['year_month'].value_counts().items()},
+            latency_counts=latency_counts,
+            topic_ids=self.topic_ids,
+        )
+    
+    def summary(self, aggregate):
+        """由 SummaryAggregate 生成 summary.json 的内容（分布按本类的标签顺序排列）"""
+        return aggregate.to_summary(self.USER_TYPES, self.SENTIMENTS)
+    
+    @staticmethod
+    def _output_format(format):
+        """未安装 pyarrow 时 parquet 退回 csv"""
+        if format == 'parquet' and not parquet_io.available():
+            print("未安装 pyarrow，无法保存为 Parquet 格式，改为 CSV。")
+            return 'csv'
+        return format
+    
+    @staticmethod
+    def _parquet_part(i):
+        return f"part-{i:05d}"
+    
+    def _save_csv_outputs(self, output_dir, format, append=False):
+        """
+        完整清洗数据（CSV 或 YAML）加按月的 data_YYYY-MM.csv，返回 {月份: 行数}；
+        append=True 时追加到已有文件之后
+        """
         # 保存完整清洗数据
         if format == 'yaml':
-            # Convert DF to list of dicts for YAML dump
-            data_dict = self.df.to_dict(orient='records')
-            # Handle timestamps for YAML serialization
-            for row in data_dict:
-                for k, v in row.items():
-                    if pd.isna(v):
-                        row[k] = None
-                    elif hasattr(v, 'isoformat'):
-                        row[k] = v.isoformat()
-            
             output_file = f"{output_dir}/cleaned_data.yaml"
             if yaml:
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    yaml.dump(data_dict, f, allow_unicode=True, sort_keys=False)
+                with open(output_file, 'a' if append else 'w', encoding='utf-8') as f:
+                    self._write_yaml_records(self.df, f)
                 print(f"已保存 YAML 数据: {output_file}")
             else:
                 print("未安装 PyYAML，无法保存为 YAML 格式。")
+        elif append:
+            self._append_csv(self.df, f"{output_dir}/cleaned_data.csv")
         else:
             self.df.to_csv(f"{output_dir}/cleaned_data.csv", index=False, encoding='utf-8')
         
@@ -380,29 +865,178 @@ class XiaoXinBaoDataProcessor:
         monthly_data = self.split_by_month()
         for month, data in monthly_data.items():
             filename = f"{output_dir}/data_{month.replace('/', '-')}.csv"
-            data.to_csv(filename, index=False, encoding='utf-8')
+            if append:
+                self._append_csv(data, filename)
+            else:
+                data.to_csv(filename, index=False, encoding='utf-8')
             print(f"保存月份数据: {filename}, 记录数: {len(data)}")
-        
-        # 生成摘要统计
-        summary = {
-            'total_records': len(self.df),
-            'date_range': {
-                'start': str(self.df['timestamp'].min()),
-                'end': str(self.df['timestamp'].max())
-            },
-            'user_type_distribution': self.categorize_users(),
-            'sentiment_distribution': self.analyze_sentiment(),
-            'topic_distribution': self.categorize_topics(), # Added
-            'monthly_counts': {str(k): len(v) for k, v in monthly_data.items()}
-        }
-        
+        return {str(k): len(v) for k, v in monthly_data.items()}
+    
+    @staticmethod
+    def _append_csv(df, filename):
+        """追加到已有 CSV（列按已有表头对齐），文件不存在时新建"""
+        if os.path.exists(filename):
+            columns = pd.read_csv(filename, nrows=0).columns.tolist()
+            df.reindex(columns=columns).to_csv(filename, index=False, encoding='utf-8', mode='a', header=False)
+        else:
+            df.to_csv(filename, index=False, encoding='utf-8')
+    
+    def _memoized(self, key, classify):
+        """复用已计算的分布，尚未分类时才运行对应的分类器"""
+        if key not in self.distributions:
+            classify()
+        return self.distributions[key]
+    
+    @staticmethod
+    def _yaml_values(values):
+        """把一列的不同取值转换为 YAML 可直接表示的 Python 值：时间为 ISO 字符串，月份为 YYYY-MM"""
+        return [value.isoformat() if hasattr(value, 'isoformat')
+                else str(value) if isinstance(value, pd.Period)
+                else value.item() if isinstance(value, np.generic)
+                else value for value in values]
+    
+    @classmethod
+    def _yaml_fragments(cls, name, column):
+        """
+        返回该列每行的 YAML 片段（"- name: value\n"，长文本可能折行）。
+        每个不同取值只序列化一次：整列去重后一次 dump 成单键映射的列表，再按条目切分。
+        """
+        codes, uniques = pd.factorize(column)
+        # 空值的 code 为 -1，取到末尾的 None
+        values = cls._yaml_values(uniques) + [None]
+        text = yaml.dump([{name: value} for value in values], Dumper=YAML_DUMPER,
+                         allow_unicode=True, sort_keys=False)
+        # 条目以行首的 "- " 开始，值的续行都有缩进
+        starts = [match.start() for match in re.finditer(r'^- ', text, flags=re.MULTILINE)]
+        fragments = np.array([text[begin:end] for begin, end in zip(starts, starts[1:] + [len(text)])], dtype=object)
+        return fragments.take(codes)
+    
+    @classmethod
+    def _write_yaml_records(cls, df, f, batch_size=YAML_BATCH_ROWS):
+        """
+        把 df 写成 YAML 记录列表（每行一个映射），与 yaml.dump(records) 的输出一致。
+        每批 batch_size 行按列生成片段，第一列保留 "- "，其余列换成同宽的缩进后逐行拼接。
+        """
+        names = [str(name) for name in df.columns]
+        for start in range(0, len(df), batch_size):
+            batch = df.iloc[start:start + batch_size]
+            columns = [cls._yaml_fragments(name, batch[column]) for name, column in zip(names, batch.columns)]
+            if not columns:
+                f.write('- {}\n' * len(batch))
+                continue
+            for i in range(1, len(columns)):
+                columns[i] = ['  ' + fragment[2:] for fragment in columns[i]]
+            f.write(''.join(fragment for row in zip(*columns) for fragment in row))
+    
+    @staticmethod
+    def _write_summary(output_dir, summary, format='csv'):
         with open(f"{output_dir}/summary.json", 'w', encoding='utf-8') as f:
             json.dump(summary, f, ensure_ascii=False, indent=2)
             
         if format == 'yaml' and yaml:
              with open(f"{output_dir}/summary.yaml", 'w', encoding='utf-8') as f:
                 yaml.dump(summary, f, allow_unicode=True, sort_keys=False)
+    
+    def process_in_chunks(self, output_dir, chunksize=DEFAULT_CHUNK_ROWS, format='csv', columns=None, watermark=None):
+        """分块（out-of-core）预处理
+
+        按 chunksize 行流式读取输入，每块依次完成列名标准化、时间戳解析、对话提取、
+        用户/情感分类，立即追加写入 cleaned_data 与按月的 data_YYYY-MM.csv
+        （parquet 格式时每块写入各月分区的一个 part 文件）；
+        每块的摘要统计（SummaryAggregate）逐块合并，峰值内存只与 chunksize 有关，self.df 不保存全量数据。
+        输出文件与 save_processed_data 一致，返回同样结构的摘要，加载失败返回 None。
+        时间格式由第一块探测后沿用；格式不符的值逐个推断，与整表处理结果一致
+        （第一块的样本与整表相同）。
+        watermark 给定时为增量模式：每块解析时间戳后只保留标记之后的行，追加到已有输出，
+        摘要统计与标记中已处理数据的统计合并（见 save_processed_data）。
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        encoding = self.detect_encoding()
+        # 样本无法按任何候选编码解码时，与 load_data 一样忽略无法解码的字节
+        read_options = {} if encoding else {'encoding_errors': 'ignore'}
+        try:
+            chunks = self._read_csv(encoding or 'utf-8', columns, chunksize=chunksize, **read_options)
+        except Exception as e:
+            print(f"加载数据失败: {e}")
+            return None
+        
+        format = self._output_format(format)
+        append = watermark is not None
+        # 各块按进入时的标记筛选新行，处理过的行计入 progress
+        progress = watermark.copy() if append else Watermark(self.output_config(format))
+        dataset_root = parquet_io.dataset_path(output_dir)
+        if not append:
+            parquet_io.reset_dataset(dataset_root)
+        if format == 'yaml':
+            cleaned_file = f"{output_dir}/cleaned_data.yaml"
+            if not yaml:
+                print("未安装 PyYAML，无法保存为 YAML 格式。")
+        else:
+            cleaned_file = f"{output_dir}/cleaned_data.csv"
+        
+        # 本次运行处理的行的统计；各月份是否已写过也以此判断
+        processed = SummaryAggregate()
+        try:
+            for i, chunk in enumerate(chunks):
+                processor = XiaoXinBaoDataProcessor.from_frame(chunk, self.file_path)
+                processor.verbose = False
+                # 跨块共享记忆化缓存，前面块出现过的对话不再重复清洗和分类
+                processor.clean_memo = self.clean_memo
+                processor.annotation_memo = self.annotation_memo
+                processor.annotation_cache = self.annotation_cache
+                processor.workers = self.workers
+                processor.timestamp_format = self.timestamp_format
+                processor.clean_column_names()
+                processor.parse_timestamp()
+                # 第一块探测到的时间格式用于后续各块
+                self.timestamp_format = processor.timestamp_format
+                if append and not processor.select_new_rows(watermark):
+                    continue
+                processor.extract_dialogue_content()
+                processor.annotate()
+                self.topic_ids = processor.topic_ids
+                df = processor.df
+                
+                if format == 'parquet':
+                    parquet_io.write_partitions(df, dataset_root, part_name=self._parquet_part(progress.next_part))
+                    progress.next_part += 1
+                else:
+                    # 全量运行第一次写到某个文件时覆盖旧文件，之后（及增量运行）追加
+                    if format == 'yaml':
+                        if yaml and len(df):
+                            with open(cleaned_file, 'w' if i == 0 and not append else 'a', encoding='utf-8') as f:
+                                self._write_yaml_records(df, f)
+                    elif i == 0 and not append:
+                        df.to_csv(cleaned_file, index=False, encoding='utf-8')
+                    else:
+                        self._append_csv(df, cleaned_file)
+                    
+                    for month, data in processor.split_by_month().items():
+                        filename = f"{output_dir}/data_{month.replace('/', '-')}.csv"
+                        if month not in processed.monthly_counts and not append:
+                            data.to_csv(filename, index=False, encoding='utf-8')
+                        else:
+                            self._append_csv(data, filename)
+                
+                processed = processed.merge(processor.summary_aggregate())
+                progress.advance(df)
+                print(f"已处理 {processed.total_records} 行（第 {i + 1} 块）")
+        except Exception as e:
+            print(f"分块处理失败: {e}")
+            return None
+        
+        print(f"清洗缓存命中率: {self.clean_memo.hit_rate:.1%}，标注缓存命中率: {self.annotation_memo.hit_rate:.1%}")
+        monthly_counts = processed.monthly_counts
+        for month in sorted(monthly_counts):
+            if format == 'parquet':
+                print(f"保存月份分区: {dataset_root}/year_month={month}, 记录数: {monthly_counts[month]}")
+            else:
+                print(f"保存月份数据: {output_dir}/data_{month.replace('/', '-')}.csv, 记录数: {monthly_counts[month]}")
         
+        progress.aggregate = progress.aggregate.merge(processed)
+        summary = self.summary(progress.aggregate)
+        self._write_summary(output_dir, summary, format)
+        progress.save(output_dir)
         return summary
 
 # 使用示例
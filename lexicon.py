@@ -0,0 +1,99 @@
+"""
+多模式关键词匹配（Aho-Corasick 自动机）
+
+用户分类、话题分类和情感分析的关键词表合并编译为一个自动机，每条文本只扫描一遍，
+即可得到每个类别命中的关键词数。计数语义与逐词 `word in text` 完全一致：
+同一关键词在文本中出现多次只计一次，关键词表中重复列出的词按列出次数计。
+安装可选依赖 pyahocorasick 时使用其 C 实现，否则使用纯 Python 实现。
+"""
+
+from collections import deque
+
+try:
+    import ahocorasick  # type: ignore
+except ImportError:
+    ahocorasick = None
+
+class Lexicon:
+    """
+    lexicons: {类别: [关键词, ...]}，类别可以是任意可哈希对象（如 ('user', 'volunteer')）。
+    count(text) 返回 {类别: 命中关键词数}，只包含命中数大于 0 的类别。
+    """
+
+    def __init__(self, lexicons, use_native=True):
+        # 关键词 -> {类别: 在该类别中列出的次数}
+        weights = {}
+        for category, words in lexicons.items():
+            for word in words:
+                per_category = weights.setdefault(str(word), {})
+                per_category[category] = per_category.get(category, 0) + 1
+        # 空字符串 `'' in text` 恒为真，与原逐词匹配保持一致
+        self._always = weights.pop('', {})
+        self._keywords = list(weights)
+        self._weights = [weights[word] for word in self._keywords]
+        self.categories = list(lexicons)
+
+        self._automaton = None
+        if use_native and ahocorasick is not None and self._keywords:
+            self._automaton = ahocorasick.Automaton()
+            for i, word in enumerate(self._keywords):
+                self._automaton.add_word(word, i)
+            self._automaton.make_automaton()
+        else:
+            self._build()
+
+    def __len__(self):
+        return len(self._keywords)
+
+    def _build(self):
+        """构建 goto 表、失败链接和输出表"""
+        self._goto = [{}]
+        self._output = [()]
+        for i, word in enumerate(self._keywords):
+            node = 0
+            for char in word:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._output.append(())
+                node = next_node
+            self._output[node] += (i,)
+
+        # 按层次遍历设置失败链接，并把失败状态的输出并入当前状态
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] += self._output[self._fail[child]]
+
+    def matches(self, text):
+        """文本中出现的关键词编号集合（重叠匹配也会返回）"""
+        if not self._keywords:
+            return set()
+        if self._automaton is not None:
+            return {i for _, i in self._automaton.iter(text)}
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                found.update(output[node])
+        return found
+
+    def count(self, text):
+        counts = dict(self._always)
+        for i in self.matches(str(text)):
+            for category, weight in self._weights[i].items():
+                counts[category] = counts.get(category, 0) + weight
+        return counts
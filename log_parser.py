@@ -1,113 +1,723 @@
+import hashlib
+import heapq
+import json
+import mmap
+import os
+import pickle
 import re
+import tempfile
 import pandas as pd
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from compressed_io import compression_of, open_binary, seek_forward
+
+# Number of Q&A pairs per DataFrame yielded by iter_frames
+DEFAULT_BATCH_SIZE = 10000
+
+# Line dispatch. Cheap substring/prefix checks run first so that noise lines
+# never reach the regex engine; the compiled patterns only run on candidates.
+# [INFO][2025-05-31 14:53:42]...
+TIME_PATTERN = re.compile(r'\[INFO\]\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\]')
+# [CHATGPT] query=...
+QUERY_MARKER = '[CHATGPT] query='
+# [gewechat] Do send text to ...: ... (reply content)
+REPLY_MARKER = '[gewechat] Do send text to '
+REPLY_START_PATTERN = re.compile(r'\[gewechat\] Do send text to (.*?): (.*)')
+# Every log record starts with one of these; anything else continues the previous record
+HEADER_PREFIXES = ('[INFO]', '[WARNING]', '[ERROR]')
+QUERY_MARKER_BYTES = QUERY_MARKER.encode('ascii')
+REPLY_MARKER_BYTES = REPLY_MARKER.encode('ascii')
+HEADER_PREFIXES_BYTES = tuple(prefix.encode('ascii') for prefix in HEADER_PREFIXES)
+
+# Byte-level patterns for the mmap scanner, which jumps from marker to marker
+# and never decodes the noise in between
+MARKER_PATTERN_BYTES = re.compile(rb'\[CHATGPT\] query=|\[gewechat\] Do send text to ')
+HEADER_LINE_PATTERN_BYTES = re.compile(rb'^\[(?:INFO|WARNING|ERROR)\]', re.MULTILINE)
+TIME_PATTERN_BYTES = re.compile(TIME_PATTERN.pattern.encode('ascii'))
+REPLY_START_PATTERN_BYTES = re.compile(REPLY_START_PATTERN.pattern.encode('ascii'))
+
+QUERY_EVENT = 'query'
+REPLY_EVENT = 'reply'
+
+# Smallest byte range handed to a worker in parallel parsing
+DEFAULT_CHUNK_BYTES = 8 * 1024 * 1024
+
+# Bytes hashed at the start of the file to recognise it across runs
+CHECKPOINT_HEAD_BYTES = 4096
+
+# Conversations with a query awaiting its reply, kept at most
+DEFAULT_MAX_PENDING = 10000
+LOG_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+class EventScanner:
+    """
+    Single-pass dispatcher over the raw (bytes) lines of a log.
+    Yields (QUERY_EVENT, timestamp, query, conversation) and
+    (REPLY_EVENT, timestamp, reply, recipient) tuples. The query's conversation
+    key comes from session_pattern (None when not configured or not found).
+    Continuation lines of a multi-line reply are consumed exactly once.
+
+    self.offset always holds the byte offset from which a fresh scanner
+    reproduces every event not yielded yet, i.e. a safe resume point.
+    """
+
+    def __init__(self, offset=0, session_pattern=None):
+        self.offset = offset
+        self.session_pattern = re.compile(session_pattern) if isinstance(session_pattern, str) else session_pattern
+
+    def _conversation(self, line):
+        if self.session_pattern is None:
+            return None
+        session_match = self.session_pattern.search(line)
+        return session_match.group(1).strip() if session_match else None
+
+    def scan(self, raw_lines, flush=True):
+        """
+        flush=False leaves a reply that runs into the end of the data, and an
+        unterminated last line, unconsumed: the file may still be growing.
+        """
+        reply_content = reply_timestamp = recipient = None
+        position = self.offset
+        for raw in raw_lines:
+            line_start = position
+            position += len(raw)
+            if not flush and not raw.endswith(b'\n'):
+                break
+
+            if reply_content is not None:
+                if not raw.startswith(HEADER_PREFIXES_BYTES):
+                    reply_content.append(raw.decode('utf-8', errors='ignore').strip())
+                    continue
+                self.offset = line_start
+                yield REPLY_EVENT, reply_timestamp, '\n'.join(reply_content).strip(), recipient
+                reply_content = None
+
+            # Markers are ASCII, so noise lines are rejected before decoding
+            if QUERY_MARKER_BYTES in raw:
+                line = raw.decode('utf-8', errors='ignore')
+                time_match = TIME_PATTERN.search(line)
+                timestamp = time_match.group(1) if time_match else None
+                query = line[line.find(QUERY_MARKER) + len(QUERY_MARKER):].strip()
+                self.offset = position
+                yield QUERY_EVENT, timestamp, query, self._conversation(line)
+                continue
+
+            if REPLY_MARKER_BYTES in raw:
+                line = raw.decode('utf-8', errors='ignore')
+                reply_match = REPLY_START_PATTERN.search(line)
+                if reply_match:
+                    # Resume from the reply start until the reply is complete
+                    time_match = TIME_PATTERN.search(line)
+                    reply_timestamp = time_match.group(1) if time_match else None
+                    recipient = reply_match.group(1).strip()
+                    reply_content = [reply_match.group(2).strip()]
+                    continue
+            self.offset = position
+
+        # The last reply may run until the end of the file
+        if reply_content is not None and flush:
+            self.offset = position
+            yield REPLY_EVENT, reply_timestamp, '\n'.join(reply_content).strip(), recipient
+
+    def scan_buffer(self, buf, end=None, flush=True):
+        """
+        Same events as scan(), over a bytes-like buffer (typically an mmap)
+        from self.offset to end. Markers and header lines are searched
+        directly on bytes; only the timestamp, query and reply spans that are
+        kept get decoded.
+        """
+        end = len(buf) if end is None else end
+        pos = self.offset
+        while True:
+            marker = MARKER_PATTERN_BYTES.search(buf, pos, end)
+            if not marker:
+                break
+            newline = buf.rfind(b'\n', pos, marker.start())
+            line_start = newline + 1 if newline >= 0 else pos
+            line_end = buf.find(b'\n', marker.end(), end)
+            if line_end < 0:
+                if not flush:
+                    # Unterminated last line: leave it for the next run
+                    self.offset = line_start
+                    return
+                line_end = next_pos = end
+            else:
+                next_pos = line_end + 1
+
+            query_pos = buf.find(QUERY_MARKER_BYTES, line_start, line_end)
+            if query_pos >= 0:
+                time_match = TIME_PATTERN_BYTES.search(buf, line_start, line_end)
+                timestamp = time_match.group(1).decode('ascii') if time_match else None
+                query = buf[query_pos + len(QUERY_MARKER_BYTES):line_end].decode('utf-8', errors='ignore')
+                conversation = None
+                if self.session_pattern is not None:
+                    conversation = self._conversation(buf[line_start:line_end].decode('utf-8', errors='ignore'))
+                pos = self.offset = next_pos
+                yield QUERY_EVENT, timestamp, query.strip(), conversation
+                continue
+
+            reply_match = REPLY_START_PATTERN_BYTES.search(buf, line_start, line_end)
+            if not reply_match:
+                pos = self.offset = next_pos
+                continue
+
+            # Continuation lines run until the next log header
+            header = HEADER_LINE_PATTERN_BYTES.search(buf, next_pos, end)
+            if header:
+                reply_end = header.start()
+            elif flush:
+                reply_end = end
+            else:
+                # The reply may still be growing: resume from its first line
+                self.offset = line_start
+                return
+            time_match = TIME_PATTERN_BYTES.search(buf, line_start, line_end)
+            reply_timestamp = time_match.group(1).decode('ascii') if time_match else None
+            recipient = reply_match.group(1).decode('utf-8', errors='ignore').strip()
+            reply_content = [reply_match.group(2).decode('utf-8', errors='ignore').strip()]
+            if reply_end > next_pos:
+                continuation = buf[next_pos:reply_end].decode('utf-8', errors='ignore')
+                if continuation.endswith('\n'):
+                    continuation = continuation[:-1]
+                reply_content.extend(line.strip() for line in continuation.split('\n'))
+            pos = self.offset = reply_end
+            yield REPLY_EVENT, reply_timestamp, '\n'.join(reply_content).strip(), recipient
+
+        # Only noise is left: resume after the last complete line
+        if flush:
+            self.offset = end
+        else:
+            newline = buf.rfind(b'\n', pos, end)
+            self.offset = newline + 1 if newline >= 0 else pos
+
+def _parse_log_time(timestamp):
+    # TIME_PATTERN only captures 'YYYY-MM-DD HH:MM:SS', which the C ISO parser
+    # reads several times faster than strptime(LOG_TIME_FORMAT)
+    try:
+        return datetime.fromisoformat(timestamp) if timestamp else None
+    except ValueError:
+        return None
+
+class PendingQueries:
+    """
+    Bounded map of queries waiting for a reply, keyed by conversation
+    (the recipient the bot answers). Queries logged without a conversation key
+    share the None slot, which reproduces the "most recent query" pairing.
+
+    Memory is capped by max_pending (least recently asked conversation is
+    evicted first) and, optionally, by ttl_seconds of log time. Every query
+    that leaves the map without a reply is passed to on_drop with a reason:
+    'superseded', 'evicted', 'expired' or 'end_of_log'; nothing is kept.
+
+    Each query's timestamp is parsed once, when it is added; replies pass their
+    already parsed time to match().
+    """
+
+    def __init__(self, max_pending=DEFAULT_MAX_PENDING, ttl_seconds=None, entries=None, on_drop=None):
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self.on_drop = on_drop
+        self._pending = OrderedDict()
+        for entry in entries or []:
+            self._pending[entry.get('conversation')] = dict(entry, asked=_parse_log_time(entry.get('timestamp')))
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, timestamp, query, conversation):
+        asked = _parse_log_time(timestamp)
+        self._advance(asked)
+        previous = self._pending.pop(conversation, None)
+        if previous is not None:
+            self._drop(previous, 'superseded')
+        # 'asked' is the parsed timestamp; it is stripped from entries handed out
+        self._pending[conversation] = {'timestamp': timestamp, 'query': query, 'conversation': conversation,
+                                       'asked': asked}
+        while len(self._pending) > self.max_pending:
+            self._drop(self._pending.popitem(last=False)[1], 'evicted')
+
+    def match(self, replied, recipient):
+        """
+        Pops the query a reply to recipient answers, or None. replied is the
+        reply's parsed time (None when unknown); the entry keeps its 'asked' time.
+        """
+        self._advance(replied)
+        entry = self._pending.pop(recipient, None)
+        if entry is None:
+            # Queries whose conversation could not be identified
+            entry = self._pending.pop(None, None)
+        return entry
+
+    def drain(self, reason='end_of_log'):
+        while self._pending:
+            self._drop(self._pending.popitem(last=False)[1], reason)
+
+    def entries(self):
+        """Pending queries in JSON-serializable form (for the checkpoint)"""
+        return [self._public(entry) for entry in self._pending.values()]
+
+    def _advance(self, now):
+        if self.ttl_seconds is None or now is None:
+            return
+        # Insertion order is log order, so expired queries are at the front
+        while self._pending:
+            asked = next(iter(self._pending.values()))['asked']
+            if asked is not None and (now - asked).total_seconds() <= self.ttl_seconds:
+                break
+            self._drop(self._pending.popitem(last=False)[1], 'expired')
+
+    def _drop(self, entry, reason):
+        if self.on_drop is not None:
+            entry = self._public(entry)
+            entry['reason'] = reason
+            self.on_drop(entry)
+
+    @staticmethod
+    def _public(entry):
+        return {key: value for key, value in entry.items() if key != 'asked'}
+
+class UnansweredWriter:
+    """
+    Callable sink for LogParser(on_unanswered=...): streams unanswered queries
+    to a CSV in batches of batch_size rows, so memory stays bounded. With
+    append=True an existing file is extended (checkpointed runs); otherwise it
+    is overwritten by the first batch. Call close() to write the last batch.
+    """
+
+    def __init__(self, path, append=False, batch_size=DEFAULT_BATCH_SIZE):
+        self.path = path
+        self.append = append
+        self.batch_size = batch_size
+        # Rows written (or buffered) so far
+        self.count = 0
+        self._batch = []
+
+    def __call__(self, entry):
+        self._batch.append(entry)
+        self.count += 1
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._batch:
+            return
+        header = not (self.append and os.path.exists(self.path) and os.path.getsize(self.path) > 0)
+        LogParser.unanswered_frame(self._batch).to_csv(
+            self.path, index=False, encoding='utf-8', mode='w' if header else 'a', header=header)
+        # Later batches of this run always extend the file
+        self.append = True
+        self._batch = []
+
+    def close(self):
+        self.flush()
+
+def _align_to_header(f, position, end):
+    """Returns the start of the first header line at or after position"""
+    if position > 0:
+        # Skip the rest of the line containing position - 1
+        f.seek(position - 1)
+        f.readline()
+    else:
+        f.seek(0)
+    while True:
+        line_start = f.tell()
+        if line_start >= end:
+            return end
+        raw = f.readline()
+        if not raw or raw.startswith(HEADER_PREFIXES_BYTES):
+            return min(line_start, end)
+
+def split_log_ranges(log_file_path, start, max_chunks, min_chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    Splits [start, EOF) of a log into at most max_chunks (start, end) byte ranges
+    whose boundaries fall on log header lines ([INFO]/[WARNING]/[ERROR]).
+    """
+    end = os.path.getsize(log_file_path)
+    if start >= end:
+        return [(start, end)]
+    chunk_size = max((end - start) // max(max_chunks, 1), min_chunk_bytes, 1)
+    boundaries = [start]
+    with open(log_file_path, 'rb') as f:
+        for approx in range(start + chunk_size, end, chunk_size):
+            boundary = _align_to_header(f, approx, end)
+            if boundaries[-1] < boundary < end:
+                boundaries.append(boundary)
+    boundaries.append(end)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+def _read_range(f, start, end):
+    f.seek(start)
+    position = start
+    for raw in f:
+        yield raw
+        position += len(raw)
+        if position >= end:
+            break
+
+def _scan_range(task):
+    """Process pool worker: scans one byte range into a list of events"""
+    log_file_path, start, end, flush, use_mmap, session_pattern = task
+    scanner = EventScanner(start, session_pattern)
+    with open(log_file_path, 'rb') as f:
+        if use_mmap:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                events = list(scanner.scan_buffer(mm, end, flush=flush))
+        else:
+            events = list(scanner.scan(_read_range(f, start, end), flush=flush))
+    return events, scanner.offset
 
 class LogParser:
-    def __init__(self, log_file_path):
+    # Columns of the parsed DataFrame, as expected by XiaoXinBaoDataProcessor
+    COLUMNS = ['timestamp', 'dialogue_content', 'bot_reply', 'reply_timestamp', 'reply_latency_ms']
+    UNANSWERED_COLUMNS = ['timestamp', 'dialogue_content', 'conversation', 'reason']
+
+    def __init__(self, log_file_path, checkpoint_path=None, use_mmap=True, session_pattern=None,
+                 max_pending=DEFAULT_MAX_PENDING, pending_ttl=None, on_unanswered=None):
         self.log_file_path = log_file_path
-        self.data = []
+        # Regex whose first group extracts the conversation (user/group) from a query line;
+        # replies are matched to queries of the conversation they are sent to
+        self.session_pattern = session_pattern
+        # Bounds of the pending-query map: conversation count and age in seconds of log time
+        self.max_pending = max_pending
+        self.pending_ttl = pending_ttl
+        # Called with each query that never gets a reply (dict with 'timestamp', 'query',
+        # 'conversation' and 'reason'), as soon as it is dropped; e.g. an UnansweredWriter
+        self.on_unanswered = on_unanswered
+        # Unanswered queries of the last run
+        self.unanswered_count = 0
+        # Scan regular files through mmap, decoding only the spans that are kept
+        self.use_mmap = use_mmap
+        # Optional JSON checkpoint for incremental (tail) parsing
+        self.checkpoint_path = checkpoint_path
+        # How the last run started: 'full', 'new', 'resumed', 'rotated' or 'truncated'
+        self.checkpoint_status = 'full'
+        self._resume_offset = 0
 
-    def parse(self):
+    def iter_pairs(self, workers=1, chunk_bytes=DEFAULT_CHUNK_BYTES):
         """
-        Parses the log file and extracts Q&A pairs.
-        Assumes sequential logging: Query comes first, then Reply.
+        Streams the log file line by line and yields Q&A pairs as dicts with
+        'timestamp', 'query', 'reply', 'reply_timestamp' and 'reply_latency_ms'
+        keys. Replies are matched to the pending query of the conversation they
+        are sent to (see PendingQueries); without a session_pattern this is the
+        most recent query, as in sequential logs.
+        Queries that never get a reply are streamed to on_unanswered.
+
+        With a checkpoint_path, parsing resumes after the bytes consumed by the
+        previous run and the checkpoint is rewritten once the file is exhausted.
+        A reply still being written at the end of the file is left for the next run.
+
+        Compressed logs (.gz/.bz2/.xz/.zst) are decompressed on the fly; offsets
+        then count decompressed bytes.
+
+        workers > 1 scans byte ranges of the file in a process pool (see
+        _scan_parallel); the pairs are identical to the sequential scan.
+        """
+        offset, pending_entries = 0, []
+        if self.checkpoint_path:
+            offset, pending_entries = self._resume_state()
+        self.unanswered_count = 0
+        pending = PendingQueries(self.max_pending, self.pending_ttl, pending_entries, on_drop=self._unanswered)
+
+        flush = not self.checkpoint_path
+        if workers and workers > 1:
+            events = self._scan_parallel(offset, flush, workers, chunk_bytes)
+        else:
+            events = self._scan_sequential(offset, flush)
+
+        for kind, timestamp, text, conversation in events:
+            if kind == QUERY_EVENT:
+                if text:
+                    pending.add(timestamp, text, conversation)
+                continue
+            replied = _parse_log_time(timestamp)
+            entry = pending.match(replied, conversation)
+            if entry is None:
+                continue
+            asked = entry['asked']
+            yield {
+                'timestamp': entry['timestamp'],
+                'query': entry['query'],
+                'reply': text,
+                'reply_timestamp': timestamp,
+                'reply_latency_ms': int((replied - asked).total_seconds() * 1000) if asked and replied else None,
+            }
+
+        if self.checkpoint_path:
+            # Pending queries may still be answered in the next run
+            self._save_checkpoint(self._resume_offset, pending.entries())
+        else:
+            pending.drain()
+
+    def _unanswered(self, entry):
+        self.unanswered_count += 1
+        if self.on_unanswered is not None:
+            self.on_unanswered(entry)
+
+    def _scan_sequential(self, offset, flush):
+        scanner = EventScanner(offset, self.session_pattern)
+        if compression_of(self.log_file_path):
+            # Compressed archives are decompressed on the fly, line by line
+            with open_binary(self.log_file_path) as f:
+                seek_forward(f, offset)
+                yield from scanner.scan(f, flush=flush)
+            self._resume_offset = scanner.offset
+            return
+        with open(self.log_file_path, 'rb') as f:
+            # Empty files cannot be mapped
+            if self.use_mmap and os.fstat(f.fileno()).st_size > offset:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    yield from scanner.scan_buffer(mm, flush=flush)
+            else:
+                f.seek(offset)
+                yield from scanner.scan(f, flush=flush)
+        self._resume_offset = scanner.offset
+
+    def _scan_parallel(self, offset, flush, workers, chunk_bytes):
+        """
+        Splits [offset, EOF) into byte ranges that start on log header lines and
+        scans them in a process pool. Because every range starts with a header,
+        no multi-line reply straddles two ranges; queries and replies that end up
+        in different ranges are stitched by the pairing loop in iter_pairs, which
+        consumes the per-range events in file order.
+        """
+        if compression_of(self.log_file_path):
+            # Byte ranges of a compressed stream cannot be decoded independently
+            yield from self._scan_sequential(offset, flush)
+            return
+        ranges = split_log_ranges(self.log_file_path, offset, workers * 4, chunk_bytes)
+        if len(ranges) <= 1:
+            yield from self._scan_sequential(offset, flush)
+            return
+
+        # Only the last range touches the end of the file
+        tasks = [(self.log_file_path, start, end, flush if i == len(ranges) - 1 else True, self.use_mmap,
+                  self.session_pattern)
+                 for i, (start, end) in enumerate(ranges)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for events, resume_offset in executor.map(_scan_range, tasks):
+                yield from events
+        self._resume_offset = resume_offset
+
+    def _file_identity(self, head_length=CHECKPOINT_HEAD_BYTES):
+        """Inode, size and a hash of the first bytes of the log file"""
+        stat = os.stat(self.log_file_path)
+        with open(self.log_file_path, 'rb') as f:
+            head = f.read(head_length)
+        return {
+            'inode': stat.st_ino,
+            'size': stat.st_size,
+            'head_length': len(head),
+            'head_hash': hashlib.sha1(head).hexdigest(),
+        }
+
+    def _resume_state(self):
+        """Returns (offset, pending entries) from the checkpoint, or (0, []) to start over"""
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            offset = int(checkpoint['offset'])
+            head_length = int(checkpoint['head_length'])
+        except FileNotFoundError:
+            self.checkpoint_status = 'new'
+            return 0, []
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Warning: ignoring unreadable checkpoint {self.checkpoint_path}: {e}")
+            self.checkpoint_status = 'new'
+            return 0, []
+
+        identity = self._file_identity(head_length)
+        if identity['inode'] != checkpoint.get('inode'):
+            print(f"Log rotation detected for {self.log_file_path}, parsing from the start")
+            self.checkpoint_status = 'rotated'
+            return 0, []
+        if compression_of(self.log_file_path):
+            # offset counts decompressed bytes; compare the archive with its size at the last run
+            truncated = identity['size'] < int(checkpoint.get('size', 0))
+        else:
+            truncated = identity['size'] < offset
+        if truncated:
+            print(f"Log truncation detected for {self.log_file_path}, parsing from the start")
+            self.checkpoint_status = 'truncated'
+            return 0, []
+        if identity['head_hash'] != checkpoint.get('head_hash'):
+            # Same inode but different content: the file was rewritten in place
+            print(f"Log rotation detected for {self.log_file_path}, parsing from the start")
+            self.checkpoint_status = 'rotated'
+            return 0, []
+
+        print(f"Resuming {self.log_file_path} from byte {offset}")
+        self.checkpoint_status = 'resumed'
+        pending = checkpoint.get('pending') or []
+        if isinstance(pending, dict):
+            # Checkpoints written before per-conversation pairing hold a single query
+            pending = [dict(pending, conversation=None)]
+        return offset, pending
+
+    def _save_checkpoint(self, offset, pending):
+        checkpoint = self._file_identity()
+        checkpoint.update({
+            'log_file': os.path.abspath(self.log_file_path),
+            'offset': offset,
+            # Queries whose reply has not been logged yet
+            'pending': pending,
+            'updated_at': datetime.now().isoformat(timespec='seconds'),
+        })
+        checkpoint_dir = os.path.dirname(self.checkpoint_path)
+        if checkpoint_dir:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def iter_frames(self, batch_size=DEFAULT_BATCH_SIZE, workers=1):
+        """
+        Yields the parsed Q&A pairs as DataFrames of at most batch_size rows.
+        Pairs are buffered column-wise, so memory stays bounded by batch_size
+        whatever the size of the log file.
+        """
+        columns = {name: [] for name in self.COLUMNS}
+        for entry in self.iter_pairs(workers=workers):
+            columns['timestamp'].append(entry['timestamp'])
+            columns['dialogue_content'].append(entry['query'])
+            columns['bot_reply'].append(entry['reply'])
+            columns['reply_timestamp'].append(entry['reply_timestamp'])
+            columns['reply_latency_ms'].append(entry['reply_latency_ms'])
+            if len(columns['timestamp']) >= batch_size:
+                yield self._build_frame(columns)
+                columns = {name: [] for name in self.COLUMNS}
+        if columns['timestamp']:
+            yield self._build_frame(columns)
+
+    @classmethod
+    def unanswered_frame(cls, entries):
+        """DataFrame of unanswered query entries, with the reason they were dropped"""
+        return pd.DataFrame(
+            [[entry['timestamp'], entry['query'], entry.get('conversation'), entry['reason']]
+             for entry in entries],
+            columns=cls.UNANSWERED_COLUMNS)
+
+    @staticmethod
+    def _build_frame(columns):
+        df = pd.DataFrame(columns)
+        # Nullable integers: replies without a timestamp have no latency
+        df['reply_latency_ms'] = df['reply_latency_ms'].astype('Int64')
+        # Tag rows so downstream processing can tell parsed logs from CSV exports
+        df['source'] = 'log_parser'
+        return df
+
+    def parse(self, batch_size=DEFAULT_BATCH_SIZE, workers=1):
+        """
+        Parses the log file and extracts Q&A pairs into a single DataFrame.
+        Use iter_frames() to process large logs without holding every pair in memory.
         """
         print(f"Parsing log file: {self.log_file_path}")
         try:
-            with open(self.log_file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                lines = f.readlines()
+            frames = list(self.iter_frames(batch_size=batch_size, workers=workers))
         except FileNotFoundError:
             print(f"Error: File not found {self.log_file_path}")
             return pd.DataFrame()
 
-        current_entry = {}
-        
-        # Regex patterns
-        # [INFO][2025-05-31 14:53:42]...
-        time_pattern = r'\[INFO\]\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\]'
-        
-        # [CHATGPT] query=...
-        query_pattern = r'\[CHATGPT\] query=(.*)'
-        
-        # [gewechat] Do send text to ...: ... (reply content)
-        reply_start_pattern = r'\[gewechat\] Do send text to .*?: (.*)'
-        
-        for i, line in enumerate(lines):
-            # Extract timestamp
-            time_match = re.search(time_pattern, line)
-            timestamp = time_match.group(1) if time_match else None
-            
-            # Check for User Query
-            query_match = re.search(query_pattern, line)
-            if query_match:
-                # If we have a pending entry (query without reply), we might save it as unanswered or just overwrite
-                if current_entry.get('query'):
-                    # Discard previous unanswered query or handle as needed
-                    pass
-                
-                current_entry = {
-                    'timestamp': timestamp,
-                    'query': query_match.group(1).strip(),
-                    'reply': None
-                }
-                continue
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
 
-            # Check for Bot Reply Start
-            reply_match = re.search(reply_start_pattern, line)
-            if reply_match and current_entry.get('query'):
-                # Found a potential reply block
-                reply_content = [reply_match.group(1).strip()]
-                
-                # Check if this reply belongs to the current query? 
-                # In simple sequential logs, we assume yes.
-                
-                # Read subsequent lines until next log header or empty line
-                j = i + 1
-                while j < len(lines):
-                    next_line = lines[j]
-                    # Stop if next line is a log header
-                    if re.match(r'\[(INFO|WARNING|ERROR)\]', next_line):
-                        break
-                    reply_content.append(next_line.strip())
-                    j += 1
-                
-                current_entry['reply'] = '\n'.join(reply_content).strip()
-                
-                # Ignore "received image" processing logs if they don't look like real answers
-                # But here we assume all [gewechat] Do send text to... are answers.
-                
-                # Add valid entry
-                self.data.append(current_entry)
-                current_entry = {} # Reset
-                
-        df = pd.DataFrame(self.data)
-        # Clean up column names to match what XiaoXinBaoDataProcessor expects or at least be useful
-        if not df.empty:
-            df.rename(columns={'query': 'dialogue_content', 'reply': 'bot_reply'}, inplace=True)
-            # Add dummy columns if needed for strict compatibility, or just let existing processor handle flexible columns
-            df['source'] = 'log_parser'
-            
-        return df
+PAIR_KEYS = ('timestamp', 'query', 'reply', 'reply_timestamp', 'reply_latency_ms')
+
+def _timestamp_key(pair):
+    # Queries logged without an [INFO] timestamp sort first
+    return pair[0] or ''
+
+def _write_spool(items, spool_dir):
+    """Pickles items to a new file in spool_dir in batches of DEFAULT_BATCH_SIZE; returns its path"""
+    fd, path = tempfile.mkstemp(suffix='.spool', dir=spool_dir)
+    with os.fdopen(fd, 'wb') as f:
+        for start in range(0, len(items), DEFAULT_BATCH_SIZE):
+            pickle.dump(items[start:start + DEFAULT_BATCH_SIZE], f, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+def _read_spool(path):
+    """Streams the items of a spool file, one batch in memory at a time"""
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                batch = pickle.load(f)
+            except EOFError:
+                return
+            yield from batch
+
+def _parse_log_file(task):
+    """
+    Process pool worker: spools one file's pairs (tuples in PAIR_KEYS order,
+    sorted by timestamp) and its unanswered queries to spool_dir and returns
+    the two spool paths
+    """
+    log_file_path, parser_options, spool_dir = task
+    unanswered = []
+    parser = LogParser(log_file_path, on_unanswered=unanswered.append, **parser_options)
+    pairs = [tuple(entry[key] for key in PAIR_KEYS) for entry in parser.iter_pairs()]
+    # Stable sort: pairs logged in the same second keep their file order
+    pairs.sort(key=_timestamp_key)
+    return _write_spool(pairs, spool_dir), _write_spool(unanswered, spool_dir)
+
+class MultiLogParser(LogParser):
+    """
+    Parses several log files (e.g. one per bot instance per day) concurrently
+    and yields a single stream of pairs ordered by timestamp. Each worker sorts
+    one file's pairs and spools them to a temporary file; a heap-based k-way
+    merge streams the spools, so the combined set is never held in memory,
+    concatenated or re-sorted.
+    """
+
+    def __init__(self, log_file_paths, session_pattern=None, max_pending=DEFAULT_MAX_PENDING, pending_ttl=None,
+                 on_unanswered=None):
+        super().__init__(f"{len(log_file_paths)} log files", session_pattern=session_pattern,
+                         max_pending=max_pending, pending_ttl=pending_ttl, on_unanswered=on_unanswered)
+        self.log_file_paths = list(log_file_paths)
+
+    def iter_pairs(self, workers=1, chunk_bytes=DEFAULT_CHUNK_BYTES):
+        """workers is the number of files parsed at the same time"""
+        parser_options = {'session_pattern': self.session_pattern, 'max_pending': self.max_pending,
+                          'pending_ttl': self.pending_ttl}
+        with tempfile.TemporaryDirectory(prefix='log_spool_') as spool_dir:
+            tasks = [(path, parser_options, spool_dir) for path in self.log_file_paths]
+            if workers and workers > 1 and len(tasks) > 1:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    spools = list(executor.map(_parse_log_file, tasks))
+            else:
+                spools = [_parse_log_file(task) for task in tasks]
+
+            self.unanswered_count = 0
+            for _, unanswered_path in spools:
+                for entry in _read_spool(unanswered_path):
+                    self._unanswered(entry)
+            for pair in heapq.merge(*(_read_spool(pairs_path) for pairs_path, _ in spools), key=_timestamp_key):
+                yield dict(zip(PAIR_KEYS, pair))
 
 if __name__ == '__main__':
     import sys
-    import os
-    
+
     input_file = 'input/xyanb.yaml'
     output_file = 'input/parsed_logs.csv'
-    
+
     if len(sys.argv) > 1:
         input_file = sys.argv[1]
     if len(sys.argv) > 2:
         output_file = sys.argv[2]
-        
+
     parser = LogParser(input_file)
-    df = parser.parse()
-    
-    if not df.empty:
-        print(f"Parsed {len(df)} Q&A pairs.")
-        print(df.head())
-        df.to_csv(output_file, index=False)
+    written = 0
+    try:
+        # Stream batches straight to the CSV instead of materializing the whole log
+        for i, frame in enumerate(parser.iter_frames()):
+            frame.to_csv(output_file, index=False, mode='w' if i == 0 else 'a', header=(i == 0))
+            written += len(frame)
+    except FileNotFoundError:
+        print(f"Error: File not found {input_file}")
+
+    if written:
+        print(f"Parsed {written} Q&A pairs.")
         print(f"Saved to {output_file}")
     else:
         print("No data parsed.")
@@ -0,0 +1,123 @@
+"""
+按内容去重的记忆化缓存（LRU）
+
+大量对话逐字重复（菜单点击、“您好”、模板问题），清洗和分类结果只取决于文本本身。
+map() 先对整列去重（pd.factorize），每个不同文本只查一次缓存、最多计算一次，
+再把结果广播回各行；跨批次（分块处理的各块）重复出现的文本直接命中缓存。
+缓存按最近使用淘汰，条数上限为 maxsize；结果依赖的配置（如关键词表指纹）
+通过 validate(token) 传入，token 变化时缓存自动清空。
+可选的 lookup / save 接入二级存储（如持久化标注缓存），内存未命中的值先批量查询
+二级存储，仍未命中才计算，新计算的结果批量写回。
+几乎没有重复的批次（不同值超过 DISTINCT_FRACTION）不走 LRU 维护：缓存里已有的值仍直接取用，
+但不调整淘汰顺序，新结果也不写入缓存，避免每行的 OrderedDict 开销。
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# 默认缓存条数
+DEFAULT_MEMO_SIZE = 100000
+
+# 不同值占行数的比例超过该值时，批次按直接映射处理，不维护 LRU
+DISTINCT_FRACTION = 0.9
+
+class LRUMemo:
+    """
+    hits / misses 按行计数：同一批内的重复行和缓存中已有的文本都算命中，
+    实际调用 compute 的次数计为 misses；store_hits 为由二级存储提供结果的行数。
+    """
+
+    def __init__(self, maxsize=DEFAULT_MEMO_SIZE):
+        self.maxsize = maxsize
+        self.token = None
+        self.hits = 0
+        self.misses = 0
+        self.store_hits = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def validate(self, token):
+        """结果依赖的配置变化时清空缓存（命中统计保留）"""
+        if token != self.token:
+            self._data.clear()
+            self.token = token
+
+    def clear(self):
+        self._data.clear()
+        self.hits = self.misses = self.store_hits = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'store_hits': self.store_hits,
+                'hit_rate': self.hit_rate, 'size': len(self._data)}
+
+    def _remember(self, key, value):
+        self._data[key] = value
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def map(self, values, compute, na_key=None, lookup=None, save=None, compute_many=None):
+        """
+        对 values（Series 或序列）逐值求 compute(value)，返回与 values 等长的 object 数组。
+        空值按 na_key 计算和缓存。lookup(keys) 返回二级存储中命中的 {key: 结果}，
+        save({key: 结果}) 写回新计算的结果。compute_many(keys) 给定时一次批量计算
+        所有未命中的值（如进程池并行），返回与 keys 顺序一致的结果列表。
+        """
+        codes, uniques = pd.factorize(values)
+        keys = np.asarray(uniques, dtype=object).tolist()
+        missing = codes == -1
+        if missing.any():
+            keys.append(na_key)
+            codes = np.where(missing, len(keys) - 1, codes)
+        remember = len(keys) <= DISTINCT_FRACTION * len(codes)
+
+        data = self._data
+        results = np.empty(len(keys), dtype=object)
+        if not data:
+            pending = list(range(len(keys)))
+        else:
+            pending = []
+            for i, key in enumerate(keys):
+                if key in data:
+                    if remember:
+                        data.move_to_end(key)
+                    results[i] = data[key]
+                else:
+                    pending.append(i)
+
+        if pending and lookup is not None:
+            stored = lookup([keys[i] for i in pending])
+            if stored:
+                served = []
+                for i in pending:
+                    if keys[i] in stored:
+                        results[i] = stored[keys[i]]
+                        if remember:
+                            self._remember(keys[i], results[i])
+                        served.append(i)
+                self.store_hits += int(np.bincount(codes, minlength=len(keys))[served].sum())
+                pending = [i for i in pending if keys[i] not in stored]
+
+        pending_keys = [keys[i] for i in pending]
+        if compute_many is not None:
+            computed_values = compute_many(pending_keys)
+        else:
+            computed_values = [compute(key) for key in pending_keys]
+        for i, value in zip(pending, computed_values):
+            results[i] = value
+        if remember:
+            for key, value in zip(pending_keys, computed_values):
+                self._remember(key, value)
+        if pending and save is not None:
+            save(dict(zip(pending_keys, computed_values)))
+        self.misses += len(pending)
+        self.hits += len(codes) - len(pending)
+        return results.take(codes)
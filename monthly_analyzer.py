@@ -4,7 +4,11 @@ import numpy as np
 from datetime import datetime
 import re
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import os
+import parquet_io
+from summary_aggregate import count_latencies, latency_stats
 
 def convert_numpy_types(obj):
     """转换numpy类型为Python原生类型，用于JSON序列化"""
@@ -21,7 +25,15 @@ def convert_numpy_types(obj):
     else:
         return obj
 
+def label_counts(series):
+    """value_counts 转字典；category 列不计未出现的类别"""
+    counts = series.value_counts()
+    return counts[counts > 0].to_dict()
+
 class MonthlyAnalyzer:
+    # 月度分析用到的列，读取 Parquet 分区时只加载这些列
+    COLUMNS = ['timestamp', 'user_id', 'clean_dialogue', 'user_type', 'sentiment', 'reply_latency_ms']
+    
     def __init__(self, month_data):
         self.df = month_data
         self.analysis_result = {}
@@ -46,6 +58,12 @@ class MonthlyAnalyzer:
             }
         else:
             metrics['date_range'] = {'start': 'N/A', 'end': 'N/A'}
+        
+        # 机器人回复延迟（仅日志解析的数据有该列）
+        if 'reply_latency_ms' in self.df.columns:
+            latency_counts = count_latencies(self.df['reply_latency_ms'])
+            if latency_counts:
+                metrics['reply_latency_ms'] = latency_stats(latency_counts)
             
         return metrics
     
@@ -160,12 +178,12 @@ class MonthlyAnalyzer:
             user_last_dialogue = self.df.groupby(user_col).last()
             
             # 简单的情感变化分析
-            first_sentiment = convert_numpy_types(user_first_dialogue[sentiment_col].value_counts().to_dict())
-            last_sentiment = convert_numpy_types(user_last_dialogue[sentiment_col].value_counts().to_dict())
+            first_sentiment = convert_numpy_types(label_counts(user_first_dialogue[sentiment_col]))
+            last_sentiment = convert_numpy_types(label_counts(user_last_dialogue[sentiment_col]))
         else:
             # 如果没有用户ID，使用整体情感分布
             if sentiment_col:
-                sentiment_dist = convert_numpy_types(self.df[sentiment_col].value_counts().to_dict())
+                sentiment_dist = convert_numpy_types(label_counts(self.df[sentiment_col]))
                 first_sentiment = sentiment_dist
                 last_sentiment = sentiment_dist
             else:
@@ -248,7 +266,7 @@ class MonthlyAnalyzer:
             insights.append(f"用户最大痛点是：{top_pain['indicator']}，出现了{top_pain['count']}次")
         
         # 基于情感的洞察
-        sentiment_dist = self.df['sentiment'].value_counts().to_dict()
+        sentiment_dist = label_counts(self.df['sentiment'])
         if 'negative' in sentiment_dist and sentiment_dist['negative'] > len(self.df) * 0.3:
             insights.append("本月负面情绪较高，需要加强心理支持服务")
         
@@ -311,32 +329,73 @@ class MonthlyAnalyzer:
         return recommendations
 
 # 批量处理所有月份
-def process_all_months(input_dir):
-    import os
+def _monthly_sources(input_dir, months=None, columns=None):
+    """
+    [(描述, 读取函数), ...]：有 Parquet 分区数据集时按月读取分区（只加载 columns），
+    否则读取 data_YYYY-MM.csv。months 指定时只处理这些月份（如 ['2025-07']）。
+    读取函数为模块级函数的 partial，可以发给进程池。
+    """
     import glob
     
+    partitions = parquet_io.list_partitions(parquet_io.dataset_path(input_dir))
+    if partitions and parquet_io.available():
+        return [(partition, partial(parquet_io.read_partition, partition, month, columns))
+                for month, partition in partitions if months is None or month in months]
+    
     # 找到所有月度文件
-    monthly_files = glob.glob(f"{input_dir}/data_*.csv")
+    monthly_files = sorted(glob.glob(f"{input_dir}/data_*.csv"))
+    if months is not None:
+        monthly_files = [path for path in monthly_files
+                         if os.path.basename(path)[len('data_'):-len('.csv')] in months]
+    return [(file_path, partial(pd.read_csv, file_path)) for file_path in monthly_files]
+
+def _analyze_month(input_dir, source, load):
+    """分析一个月份并写出 report_{month}.json，返回 (报告, None)；失败时返回 (None, 错误信息)"""
+    try:
+        month_data = load()
+        analyzer = MonthlyAnalyzer(month_data)
+        report = analyzer.comprehensive_analysis()
+        
+        # 保存月度报告
+        month = report['month']
+        with open(f"{input_dir}/report_{month}.json", 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return report, None
+    except Exception as e:
+        return None, str(e)
+
+def month_workers(workers, month_count):
+    """
+    月度分析实际使用的进程数：workers 默认 CPU 核数，且不超过核数和月份数。
+    分析是 CPU 密集的，超过核数的进程只会增加进程池开销；结果为 1 时逐月顺序分析。
+    """
+    cpu_count = os.cpu_count() or 1
+    return max(1, min(workers or cpu_count, cpu_count, month_count))
+
+def process_all_months(input_dir, months=None, columns=MonthlyAnalyzer.COLUMNS, workers=None):
+    """
+    月度分析；columns 为 None 时读取 Parquet 分区的全部列。
+    各月份互不依赖，不止一个月份且进程数（见 month_workers）> 1 时用进程池并行分析，
+    每个月的读取、分析和 report_{month}.json 的写出都在同一个工作进程内完成；
+    否则在当前进程逐月分析，不启动进程池。
+    报告按月份顺序返回；单个月份失败只跳过该月。
+    """
+    sources = _monthly_sources(input_dir, months, columns)
+    workers = month_workers(workers, len(sources))
+    analyze = partial(_analyze_month, input_dir)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(analyze, *zip(*sources)))
+    else:
+        results = (analyze(source, load) for source, load in sources)
     
     all_monthly_reports = []
-    
-    for file_path in monthly_files:
-        print(f"处理文件: {file_path}")
-        
-        try:
-            month_data = pd.read_csv(file_path)
-            analyzer = MonthlyAnalyzer(month_data)
-            report = analyzer.comprehensive_analysis()
-            
-            # 保存月度报告
-            month = report['month']
-            with open(f"{input_dir}/report_{month}.json", 'w', encoding='utf-8') as f:
-                json.dump(report, f, ensure_ascii=False, indent=2)
-            
+    for (source, _), (report, error) in zip(sources, results):
+        print(f"处理文件: {source}")
+        if error is not None:
+            print(f"处理文件失败 {source}: {error}")
+        else:
             all_monthly_reports.append(report)
-            
-        except Exception as e:
-            print(f"处理文件失败 {file_path}: {e}")
     
     return all_monthly_reports
 
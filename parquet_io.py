@@ -0,0 +1,86 @@
+"""
+按月分区的 Parquet 数据集（cleaned_data/year_month=YYYY-MM/part-*.parquet）
+
+清洗结果只写一遍：每行按 year_month 写入对应分区，时间戳、category 等类型随文件保存；
+月度分析按需读取指定月份的分区和列。时间戳无法解析（year_month 为空）的行写入
+year_month=unknown 分区，不参与月度分析，但不会从输出中丢失。需要可选依赖 pyarrow。
+"""
+
+import os
+import shutil
+
+import pandas as pd
+
+try:
+    import pyarrow.parquet as pq  # type: ignore
+except ImportError:
+    pq = None
+
+PARTITION_COLUMN = 'year_month'
+DATASET_DIR = 'cleaned_data'
+# year_month 为空的行所在分区
+UNKNOWN_MONTH = 'unknown'
+
+def available():
+    return pq is not None
+
+def _require_pyarrow():
+    if pq is None:
+        raise ImportError("读写 Parquet 需要安装 pyarrow：pip install pyarrow")
+
+def dataset_path(output_dir):
+    return os.path.join(output_dir, DATASET_DIR)
+
+def reset_dataset(root):
+    """删除旧的数据集目录，重新写入前调用"""
+    if os.path.isdir(root):
+        shutil.rmtree(root)
+
+def write_partitions(df, root, part_name='part-0'):
+    """
+    按 year_month 把 df 写成 root/year_month=YYYY-MM/<part_name>.parquet，
+    分区列本身不写入文件；year_month 为空的行写入 UNKNOWN_MONTH 分区。返回 {月份: 行数}。
+    """
+    _require_pyarrow()
+    counts = {}
+    for month, group in df.groupby(PARTITION_COLUMN, dropna=False):
+        month = UNKNOWN_MONTH if pd.isna(month) else str(month)
+        partition = os.path.join(root, f"{PARTITION_COLUMN}={month}")
+        os.makedirs(partition, exist_ok=True)
+        group.drop(columns=PARTITION_COLUMN).to_parquet(
+            os.path.join(partition, f"{part_name}.parquet"), index=False, engine='pyarrow')
+        counts[month] = len(group)
+    return counts
+
+def list_partitions(root, include_unknown=False):
+    """[(月份, 分区目录), ...]，按月份排序；include_unknown=True 时包含 UNKNOWN_MONTH 分区（排在最后）"""
+    if not os.path.isdir(root):
+        return []
+    prefix = f"{PARTITION_COLUMN}="
+    partitions = sorted((name[len(prefix):], os.path.join(root, name))
+                        for name in os.listdir(root) if name.startswith(prefix))
+    months = [item for item in partitions if item[0] != UNKNOWN_MONTH]
+    unknown = [item for item in partitions if item[0] == UNKNOWN_MONTH]
+    return months + unknown if include_unknown else months
+
+def read_partition(partition, month, columns=None):
+    """
+    读取一个月份分区（可能由分块写入的多个文件组成），只加载 columns 中存在的列，
+    并补回 period 类型的 year_month 列（UNKNOWN_MONTH 分区为 NaT）。
+    """
+    _require_pyarrow()
+    parts = sorted(os.path.join(partition, name) for name in os.listdir(partition) if name.endswith('.parquet'))
+    if columns is not None and parts:
+        available_columns = set(pq.read_schema(parts[0]).names)
+        columns = [column for column in columns if column in available_columns]
+    frames = [pd.read_parquet(part, columns=columns, engine='pyarrow') for part in parts]
+    if not frames:
+        df = pd.DataFrame(columns=columns)
+    else:
+        df = pd.concat(frames, ignore_index=True)
+        # 各分块文件的类别集合可能不同，拼接后恢复 category 类型
+        for column in frames[0].select_dtypes('category').columns:
+            df[column] = df[column].astype('category')
+    period = pd.NaT if month == UNKNOWN_MONTH else pd.Period(month, freq='M')
+    df[PARTITION_COLUMN] = pd.Series(period, index=df.index, dtype='period[M]')
+    return df
@@ -14,16 +14,20 @@
 """
 
 import argparse
+import glob
 import os
+import re
 import sys
 import json
 import requests
+import pandas as pd
 from typing import List, Dict
+from compressed_io import COMPRESSION_SUFFIXES, strip_compression_suffix
 from data_preprocessor import XiaoXinBaoDataProcessor
 from monthly_analyzer import process_all_months
 # 尝试导入 LogParser，假设在同级目录
 try:
-    from log_parser import LogParser
+    from log_parser import LOG_TIME_FORMAT, LogParser, MultiLogParser, UnansweredWriter
 except ImportError:
     LogParser = None
 try:
@@ -31,8 +35,23 @@ try:
 except ImportError:
     generate_all_plots = None
 
+def find_existing(path: str) -> str:
+    """返回 path 本身或其压缩版本（.gz/.bz2/.xz/.zst）中第一个存在的文件"""
+    for candidate in [path] + [path + suffix for suffix in COMPRESSION_SUFFIXES]:
+        if os.path.exists(candidate):
+            return candidate
+    return ''
+
+# 原始日志文件名：.yaml/.log，可带轮转后缀（.log.1、.log.2025-05-31、.log-20250531），
+# 再加可选的压缩后缀
+LOG_NAME_PATTERN = re.compile(r'\.(?:yaml|log)(?:\.\d+|\.\d{4}-\d{2}-\d{2}|-\d{8})?$')
+
+def is_log_file(path: str) -> bool:
+    """是否为原始日志（见 LOG_NAME_PATTERN；chat.yaml.tar.gz、x.yaml.bak 等不算）"""
+    return LOG_NAME_PATTERN.search(strip_compression_suffix(path).lower()) is not None
+
 def resolve_input_file(cli_input: str = None) -> str:
-    """解析输入文件路径，优先顺序：
+    """解析输入文件路径，优先顺序（均兼容压缩版本，如 chat_logs.csv.gz）：
     1) 命令行 --input-file
     2) input/chat_logs.csv
     3) input/filtered_data.csv
@@ -41,95 +60,216 @@ def resolve_input_file(cli_input: str = None) -> str:
     if cli_input:
         return cli_input
     
-    # 优先检查 input/ 目录
-    if os.path.exists('input/chat_logs.csv'):
-        return 'input/chat_logs.csv'
-    if os.path.exists('input/filtered_data.csv'):
-        return 'input/filtered_data.csv'
-    
-    # 兼容根目录（向后兼容）
-    if os.path.exists('chat_logs.csv'):
-        return 'chat_logs.csv'
-    if os.path.exists('filtered_data.csv'):
-        return 'filtered_data.csv'
-        
-    # Check for log files
-    if os.path.exists('input/xyanb.yaml'):
-        return 'input/xyanb.yaml'
+    candidates = [
+        # 优先检查 input/ 目录
+        'input/chat_logs.csv',
+        'input/filtered_data.csv',
+        # 兼容根目录（向后兼容）
+        'chat_logs.csv',
+        'filtered_data.csv',
+        # Check for log files
+        'input/xyanb.yaml',
+    ]
+    for candidate in candidates:
+        found = find_existing(candidate)
+        if found:
+            return found
     
     return ''
 
+def expand_input_files(input_spec: str) -> List[str]:
+    """展开输入：目录 -> 目录下所有日志文件；通配符 -> 匹配的文件；普通路径 -> 存在则返回自身"""
+    if not input_spec:
+        return []
+    if os.path.isdir(input_spec):
+        return sorted(os.path.join(input_spec, name) for name in os.listdir(input_spec)
+                      if is_log_file(name) and os.path.isfile(os.path.join(input_spec, name)))
+    if glob.has_magic(input_spec):
+        return sorted(path for path in glob.glob(input_spec) if os.path.isfile(path))
+    return [input_spec] if os.path.exists(input_spec) else []
+
 def ensure_dir(path: str) -> None:
     if path and not os.path.exists(path):
         os.makedirs(path, exist_ok=True)
 
-def preprocess_data(input_file: str, output_dir: str, output_format: str = 'csv') -> bool:
-    """数据预处理"""
+def preprocess_data(input_file: str, output_dir: str, output_format: str = 'csv',
+                    log_checkpoint: str = None, log_workers: int = 1,
+                    log_session_pattern: str = None, log_pending_ttl: float = None,
+                    parsed_csv: str = None,
+                    csv_engine: str = None, all_columns: bool = False,
+                    chunk_size: int = None, annotation_cache: str = None,
+                    workers: int = 1, incremental: bool = False) -> bool:
+    """数据预处理
+
+    chunk_size: CSV 输入按该行数分块流式处理（out-of-core），每块处理完即追加写出，
+    峰值内存只与块大小有关。
+    CSV 输入默认只加载流程用到的列（PIPELINE_COLUMNS），all_columns=True 时保留全部列；
+    csv_engine: 'pyarrow' 时使用 pyarrow 的 CSV 解析器。
+    日志解析结果直接以 DataFrame 交给预处理器，不再经过中间 CSV；
+    parsed_csv: 指定时额外把解析结果保存为该 CSV。
+    log_checkpoint: 日志断点文件路径。设置后仅解析上次运行之后新增的日志字节，
+    新解析的问答对追加到 parsed_csv（默认 input/chat_logs.csv），与历史记录一起进入预处理。
+    log_workers: 日志并行解析进程数（单个日志按日志头对齐分块；多个日志则按文件并行）。
+    log_session_pattern: 从提问日志行提取会话（用户/群）标识的正则（第一个分组），
+    回复按接收方匹配到同一会话的提问；未设置时回复匹配最近一次提问。
+    log_pending_ttl: 提问等待回复的最长时间（秒，按日志时间），超时的提问记为未回复（expired）；
+    默认不限时，只受待回复会话数上限约束。
+    未得到回复的提问分批写入 <output_dir>/unanswered_queries.csv（使用断点时追加到已有文件）。
+    input_file 也可以是目录或通配符（如 "logs/*.log.gz"），所有日志按时间戳归并为一个输入。
+    annotation_cache: 持久化标注缓存（SQLite）路径，只给文件名时放在 output_dir 下；
+    重跑时只清洗、分类缓存中没有的对话。
+    workers: 对话清洗和关键词分类的并行进程数，结果与单进程完全一致。
+    incremental: 增量模式。按 output_dir/watermark.json 记录的高水位（最大时间戳及该时刻的行指纹）
+    只处理之后的新行，追加到受影响的月份文件/分区并累加摘要；没有可用标记
+    （首次运行、输出格式或关键词配置变化）时全量处理。
+    """
     print("=== 开始数据预处理 ===")
-    if not input_file or not os.path.exists(input_file):
+    if annotation_cache and not os.path.dirname(annotation_cache):
+        annotation_cache = os.path.join(output_dir, annotation_cache)
+    processor = None
+    input_files = expand_input_files(input_file)
+    if not input_files:
         print("未找到输入文件。请在 input/ 目录放置 chat_logs.csv 或 use --input-file 指定。")
         return False
         
-    # Check if input is a log file (.yaml or .log)
-    if input_file.endswith('.yaml') or input_file.endswith('.log'):
-        print(f"检测到日志文件: {input_file}，尝试解析...")
+    # Check if input is a log file (.yaml or .log, possibly compressed), or several of them
+    if len(input_files) > 1 or is_log_file(input_files[0]):
+        log_files = [path for path in input_files if is_log_file(path)]
+        if len(log_files) < len(input_files):
+            print(f"多文件输入仅支持日志文件，已跳过 {len(input_files) - len(log_files)} 个非日志文件")
+        if not log_files:
+            print("未找到日志文件")
+            return False
         if LogParser:
-            parser = LogParser(input_file)
-            df = parser.parse()
-            if df.empty:
+            ensure_dir(output_dir)
+            unanswered_csv = os.path.join(output_dir, 'unanswered_queries.csv')
+            if len(log_files) > 1:
+                print(f"检测到 {len(log_files)} 个日志文件，并行解析并按时间戳归并...")
+                if log_checkpoint:
+                    print("多文件输入不支持 --log-checkpoint，已忽略")
+                unanswered = UnansweredWriter(unanswered_csv)
+                parser = MultiLogParser(log_files, session_pattern=log_session_pattern, pending_ttl=log_pending_ttl,
+                                        on_unanswered=unanswered)
+            else:
+                print(f"检测到日志文件: {log_files[0]}，尝试解析...")
+                # 断点续读时本次的未回复提问追加到之前各次运行的记录之后
+                unanswered = UnansweredWriter(unanswered_csv,
+                                              append=bool(log_checkpoint) and os.path.exists(log_checkpoint))
+                parser = LogParser(log_files[0], checkpoint_path=log_checkpoint,
+                                   session_pattern=log_session_pattern, pending_ttl=log_pending_ttl,
+                                   on_unanswered=unanswered)
+            df = parser.parse(workers=log_workers)
+            unanswered.close()
+            if log_checkpoint and not parsed_csv:
+                # 增量解析需要保留历史问答对
+                parsed_csv = 'input/chat_logs.csv'
+            if unanswered.count:
+                print(f"未回复的提问 {unanswered.count} 条，已写入: {unanswered_csv}")
+            # 断点续读时，新问答对追加到已有的解析结果之后
+            append = (parsed_csv and parser.checkpoint_status in ('resumed', 'rotated', 'truncated')
+                      and os.path.exists(parsed_csv))
+            if df.empty and not append:
                 print("日志解析结果为空")
                 return False
-            # Save parsed DataFrame as CSV (standard format for processor)
-            parsed_csv = 'input/chat_logs.csv'
-            df.to_csv(parsed_csv, index=False, encoding='utf-8')
-            print(f"日志已解析并保存为标准CSV输入: {parsed_csv}")
-            input_file = parsed_csv # Switch input to the CSV file
+            if append:
+                if not df.empty:
+                    # 与已有文件的列保持一致（旧版本解析结果没有回复时间/延迟列）
+                    existing_columns = pd.read_csv(parsed_csv, nrows=0).columns.tolist()
+                    df.reindex(columns=existing_columns).to_csv(
+                        parsed_csv, index=False, encoding='utf-8', mode='a', header=False)
+                print(f"增量解析 {len(df)} 个新问答对，已追加到: {parsed_csv}")
+                input_file = parsed_csv # 历史与新增问答对一起从CSV加载
+            else:
+                if parsed_csv:
+                    ensure_dir(os.path.dirname(parsed_csv))
+                    df.to_csv(parsed_csv, index=False, encoding='utf-8')
+                    print(f"日志解析结果已保存: {parsed_csv}")
+                processor = XiaoXinBaoDataProcessor.from_frame(df, source_name=parser.log_file_path)
+                # 日志时间格式已知，跳过格式探测
+                processor.timestamp_format = LOG_TIME_FORMAT
         else:
             print("错误: 找不到 LogParser 模块，无法解析日志文件")
             return False
+    else:
+        # 目录或通配符只展开出一个 CSV 时，按展开后的路径加载
+        input_file = input_files[0]
 
-    processor = XiaoXinBaoDataProcessor(input_file)
-    
-    if processor.load_data():
-        print("原始数据形状:", processor.df.shape)
-        
-        # 执行数据清洗
-        processor.clean_column_names()
-        print("列名已清洗")
-        
-        valid_rows = processor.parse_timestamp()
-        print(f"有效时间戳: {valid_rows}/{len(processor.df)}")
-        
-        avg_length = processor.extract_dialogue_content()
-        print(f"平均对话长度: {avg_length:.2f}字符")
-        
-        user_types = processor.categorize_users()
-        print("用户类型分布:", user_types)
-        
-        sentiments = processor.analyze_sentiment()
-        print("情感分布:", sentiments)
-        
-        # 保存处理结果
+    if processor is None and chunk_size:
+        print(f"分块预处理，每块 {chunk_size} 行")
         ensure_dir(output_dir)
-        summary = processor.save_processed_data(output_dir, format=output_format)
+        columns = None if all_columns else XiaoXinBaoDataProcessor.PIPELINE_COLUMNS
+        processor = XiaoXinBaoDataProcessor(input_file)
+        processor.workers = workers
+        watermark = processor.load_watermark(output_dir, output_format) if incremental else None
+        if annotation_cache:
+            processor.open_annotation_cache(annotation_cache)
+        summary = processor.process_in_chunks(
+            output_dir, chunksize=chunk_size, format=output_format, columns=columns, watermark=watermark)
+        processor.close_annotation_cache()
+        if summary is None:
+            return False
         print("\n=== 处理完成 ===")
         print("摘要统计:")
         for key, value in summary.items():
             print(f"  {key}: {value}")
-        
         return True
-    else:
-        print("数据加载失败")
-        return False
+    
+    if processor is None:
+        processor = XiaoXinBaoDataProcessor(input_file)
+        columns = None if all_columns else XiaoXinBaoDataProcessor.PIPELINE_COLUMNS
+        if not processor.load_data(columns=columns, engine=csv_engine):
+            print("数据加载失败")
+            return False
+    
+    print("原始数据形状:", processor.df.shape)
+    processor.workers = workers
+    if annotation_cache:
+        processor.open_annotation_cache(annotation_cache)
+    
+    # 执行数据清洗
+    processor.clean_column_names()
+    print("列名已清洗")
+    
+    valid_rows = processor.parse_timestamp()
+    print(f"有效时间戳: {valid_rows}/{len(processor.df)}")
+    
+    watermark = processor.load_watermark(output_dir, output_format) if incremental else None
+    if watermark is not None:
+        total_rows = len(processor.df)
+        new_rows = processor.select_new_rows(watermark)
+        print(f"增量预处理: 标记 {watermark.timestamp} 之后的新行 {new_rows}/{total_rows}")
+        if not new_rows:
+            processor.close_annotation_cache()
+            print("没有新数据，输出保持不变")
+            return True
+    
+    avg_length = processor.extract_dialogue_content()
+    print(f"平均对话长度: {avg_length:.2f}字符")
+    
+    # 用户类型、情感、话题一次遍历完成，摘要直接复用这里的分布
+    distributions = processor.annotate()
+    print("用户类型分布:", distributions['user_type_distribution'])
+    print("情感分布:", distributions['sentiment_distribution'])
+    processor.close_annotation_cache()
+    
+    # 保存处理结果
+    ensure_dir(output_dir)
+    summary = processor.save_processed_data(output_dir, format=output_format, watermark=watermark)
+    print("\n=== 处理完成 ===")
+    print("摘要统计:")
+    for key, value in summary.items():
+        print(f"  {key}: {value}")
+    
+    return True
 
-def run_monthly_analysis(processed_dir: str) -> List[Dict]:
-    """运行月度分析"""
+def run_monthly_analysis(processed_dir: str, workers: int = None) -> List[Dict]:
+    """运行月度分析；workers 为并行分析的进程数，默认 CPU 核数"""
     print("=== 开始月度分析 ===")
     if not os.path.exists(processed_dir):
         print("请先运行数据预处理")
         return []
     try:
-        reports = process_all_months(processed_dir)
+        reports = process_all_months(processed_dir, workers=workers)
         
         print(f"\n=== 分析完成，共处理 {len(reports)} 个月的数据 ===")
         
@@ -412,13 +552,31 @@ def full_analysis(input_file: str, processed_dir: str, report_dir: str,
                   base_url: str = '',
                   timeout_sec: int = 60,
                   stream: bool = True,
-                  output_format: str = 'csv') -> bool:
+                  output_format: str = 'csv',
+                  log_checkpoint: str = None,
+                  log_workers: int = 1,
+                  log_session_pattern: str = None,
+                  log_pending_ttl: float = None,
+                  parsed_csv: str = None,
+                  csv_engine: str = None,
+                  all_columns: bool = False,
+                  chunk_size: int = None,
+                  annotation_cache: str = None,
+                  workers: int = 1,
+                  incremental: bool = False,
+                  month_workers: int = None) -> bool:
     """完整分析流程，含 Markdown 报告输出。"""
     print("=== 开始完整分析流程 ===")
-    ok = preprocess_data(input_file, processed_dir, output_format=output_format)
+    ok = preprocess_data(input_file, processed_dir, output_format=output_format,
+                         log_checkpoint=log_checkpoint, log_workers=log_workers,
+                         log_session_pattern=log_session_pattern, log_pending_ttl=log_pending_ttl,
+                         parsed_csv=parsed_csv,
+                         csv_engine=csv_engine, all_columns=all_columns, chunk_size=chunk_size,
+                         annotation_cache=annotation_cache, workers=workers,
+                         incremental=incremental)
     if not ok:
         return False
-    reports = run_monthly_analysis(processed_dir)
+    reports = run_monthly_analysis(processed_dir, workers=month_workers)
     if not reports:
         return False
     
@@ -528,10 +686,22 @@ def main():
     parser.add_argument('--preprocess', action='store_true', help='仅数据预处理')
     parser.add_argument('--analyze-monthly', action='store_true', help='仅月度分析')
     parser.add_argument('--full', action='store_true', help='完整流程')
-    parser.add_argument('--input-file', type=str, default=None, help='输入CSV，默认自动查找 input/chat_logs.csv 或 input/filtered_data.csv')
+    parser.add_argument('--input-file', type=str, default=None, help='输入CSV或日志（支持 .gz/.bz2/.xz/.zst 压缩），也可为日志目录或通配符，默认自动查找 input/chat_logs.csv 或 input/filtered_data.csv')
     parser.add_argument('--output-dir', type=str, default='processed_data', help='预处理输出目录，默认 processed_data')
-    parser.add_argument('--output-format', type=str, default='csv', choices=['csv', 'yaml'], help='输出格式 (csv/yaml)')
+    parser.add_argument('--output-format', type=str, default='csv', choices=['csv', 'yaml', 'parquet'], help='输出格式 (csv/yaml/parquet)；parquet 写按月分区的数据集，需安装 pyarrow')
     parser.add_argument('--report-dir', type=str, default='output', help='Markdown 报告输出目录，默认 output')
+    parser.add_argument('--csv-engine', type=str, default=None, choices=['c', 'pyarrow'], help='CSV 解析器，pyarrow 需安装 pyarrow，默认 pandas C 解析器')
+    parser.add_argument('--all-columns', action='store_true', help='加载输入CSV的全部列（默认只加载分析用到的时间、用户、对话等列）')
+    parser.add_argument('--chunk-size', type=int, default=None, help='CSV 分块预处理的每块行数（如 100000），用于内存放不下的大文件；默认整表处理')
+    parser.add_argument('--workers', type=int, default=1, help='对话清洗和关键词分类的并行进程数，默认 1（单进程）')
+    parser.add_argument('--month-workers', type=int, default=None, help='月度分析的并行进程数（各月份独立分析、各自写出报告），默认CPU核数')
+    parser.add_argument('--incremental', action='store_true', help='增量预处理：只处理 <output-dir>/watermark.json 记录的最大时间戳之后的新行，追加到月份文件并累加摘要（无可用标记时全量处理）')
+    parser.add_argument('--annotation-cache', type=str, nargs='?', const='annotation_cache.sqlite', default=None, help='持久化标注缓存（SQLite），重跑时只清洗、分类新出现的对话（不指定路径时为 <output-dir>/annotation_cache.sqlite）')
+    parser.add_argument('--log-checkpoint', type=str, default=None, help='日志断点文件（如 input/xyanb.checkpoint.json），设置后仅解析新增日志')
+    parser.add_argument('--log-workers', type=int, default=1, help='日志并行解析进程数，默认 1（单进程）')
+    parser.add_argument('--save-parsed-csv', type=str, nargs='?', const='input/chat_logs.csv', default=None, help='日志输入时额外保存解析结果CSV（不指定路径时为 input/chat_logs.csv）；默认直接在内存中交给预处理')
+    parser.add_argument('--log-session-pattern', type=str, default=None, help='从提问日志行提取会话标识的正则（第一个分组），用于多用户并发时按会话配对问答')
+    parser.add_argument('--log-pending-ttl', type=float, default=None, help='提问等待回复的最长秒数（按日志时间），超时记为未回复；默认不限时')
     # AI 分析相关
     parser.add_argument('--ai', action='store_true', help='启用 AI 摘要（DeepSeek 或本地 LMStudio 端点）')
     parser.add_argument('--system-prompt', type=str, default='agent/REPORT_ANALYST_SYSTEM_PROMPT.md', help='系统提示词路径')
@@ -547,23 +717,28 @@ def main():
     processed_dir = args.output_dir
     report_dir = args.report_dir
 
-    if not any([args.preprocess, args.analyze_monthly, args.full]):
-        # 如果没有参数，运行完整流程
-        full_analysis(input_file, processed_dir, report_dir,
-                      enable_ai=args.ai,
-                      system_prompt_path=args.system_prompt,
-                      env_path=args.env_file,
-                      ai_output_path=args.ai_output,
-                      model=args.ai_model,
-                      base_url=(args.ai_base_url or ''),
-                      timeout_sec=args.ai_timeout,
-                      stream=args.ai_stream,
-                      output_format=args.output_format)
-    elif args.preprocess:
-        preprocess_data(input_file, processed_dir, output_format=args.output_format)
+    # 预处理参数，--preprocess 与完整流程共用
+    preprocess_options = dict(
+        output_format=args.output_format,
+        log_checkpoint=args.log_checkpoint,
+        log_workers=args.log_workers,
+        log_session_pattern=args.log_session_pattern,
+        log_pending_ttl=args.log_pending_ttl,
+        parsed_csv=args.save_parsed_csv,
+        csv_engine=args.csv_engine,
+        all_columns=args.all_columns,
+        chunk_size=args.chunk_size,
+        annotation_cache=args.annotation_cache,
+        workers=args.workers,
+        incremental=args.incremental,
+    )
+
+    if args.preprocess:
+        preprocess_data(input_file, processed_dir, **preprocess_options)
     elif args.analyze_monthly:
-        run_monthly_analysis(processed_dir)
-    elif args.full:
+        run_monthly_analysis(processed_dir, workers=args.month_workers)
+    else:
+        # --full，或没有参数时运行完整流程
         full_analysis(input_file, processed_dir, report_dir,
                       enable_ai=args.ai,
                       system_prompt_path=args.system_prompt,
@@ -573,7 +748,8 @@ def main():
                       base_url=(args.ai_base_url or ''),
                       timeout_sec=args.ai_timeout,
                       stream=args.ai_stream,
-                      output_format=args.output_format)
+                      month_workers=args.month_workers,
+                      **preprocess_options)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,144 @@
+"""
+可合并的摘要统计（summary.json 的来源）
+
+SummaryAggregate 只保存可以相加的量：行数、最早/最晚时间、各标签计数、按月行数、
+回复延迟的 {毫秒: 次数}。merge() 满足结合律，SummaryAggregate() 为单位元，
+因此按块、按文件、按月分别统计后合并，与整表统计完全一致；分位数等不可相加的
+指标只在 to_summary() 时由计数算出。to_state() / from_state() 用于在增量标记中持久化。
+"""
+
+from collections import Counter
+
+import pandas as pd
+
+def ordered_counts(counts, categories):
+    """{标签: 数量} 去掉 0，按数量降序排列，数量相同时按 categories 中的顺序"""
+    order = {label: i for i, label in enumerate(categories)}
+    return {label: int(count) for label, count in
+            sorted(counts.items(), key=lambda item: (-item[1], order.get(item[0], len(order))))
+            if count > 0}
+
+def ordered_topic_counts(counts, topic_ids):
+    """话题按配置顺序排列，'other' 在最后，去掉 0"""
+    return {topic: int(counts[topic]) for topic in [*topic_ids, 'other'] if counts.get(topic, 0) > 0}
+
+def count_latencies(values):
+    """回复延迟列 -> {延迟: 次数}，忽略空值和无法转换的值"""
+    return pd.to_numeric(values, errors='coerce').dropna().astype('int64').value_counts().to_dict()
+
+def latency_stats(counts):
+    """由 {延迟: 次数} 计算回复延迟统计（分位数线性插值，与 Series.quantile 一致）"""
+    values = sorted(counts)
+    total = sum(counts.values())
+
+    def quantile(q):
+        position = q * (total - 1)
+        lower, upper = int(position), min(int(position) + 1, total - 1)
+        seen, lower_value, upper_value = 0, None, None
+        for value in values:
+            seen += counts[value]
+            if lower_value is None and seen > lower:
+                lower_value = value
+            if seen > upper:
+                upper_value = value
+                break
+        return lower_value + (upper_value - lower_value) * (position - int(position))
+
+    return {
+        'count': int(total),
+        'mean': float(sum(value * n for value, n in counts.items()) / total),
+        'p50': float(quantile(0.5)),
+        'p95': float(quantile(0.95)),
+        'max': float(values[-1]),
+    }
+
+def _earliest(a, b):
+    return b if a is None else a if b is None else min(a, b)
+
+def _latest(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
+class SummaryAggregate:
+    """
+    start / end 为最早、最晚的有效时间戳（没有时为 None）；topic_ids 为话题 -> 位序号，
+    两个非空的 topic_ids 不同（关键词配置不同）时不能合并。
+    """
+
+    def __init__(self, total_records=0, start=None, end=None, user_types=None, sentiments=None,
+                 topics=None, monthly_counts=None, latency_counts=None, topic_ids=None):
+        self.total_records = int(total_records)
+        self.start = start
+        self.end = end
+        self.user_types = Counter(user_types or {})
+        self.sentiments = Counter(sentiments or {})
+        self.topics = Counter(topics or {})
+        self.monthly_counts = Counter(monthly_counts or {})
+        self.latency_counts = Counter(latency_counts or {})
+        self.topic_ids = dict(topic_ids or {})
+
+    def __eq__(self, other):
+        return isinstance(other, SummaryAggregate) and self.to_state() == other.to_state()
+
+    def merge(self, other):
+        """返回两者合并后的新对象，自身和 other 不变"""
+        if self.topic_ids and other.topic_ids and self.topic_ids != other.topic_ids:
+            raise ValueError(f"话题配置不同的摘要不能合并: {list(self.topic_ids)} / {list(other.topic_ids)}")
+        return SummaryAggregate(
+            total_records=self.total_records + other.total_records,
+            start=_earliest(self.start, other.start),
+            end=_latest(self.end, other.end),
+            user_types=self.user_types + other.user_types,
+            sentiments=self.sentiments + other.sentiments,
+            topics=self.topics + other.topics,
+            monthly_counts=self.monthly_counts + other.monthly_counts,
+            latency_counts=self.latency_counts + other.latency_counts,
+            topic_ids=self.topic_ids or other.topic_ids,
+        )
+
+    def to_summary(self, user_type_order=(), sentiment_order=()):
+        """summary.json 的内容；分布按数量降序，数量相同时按给定的标签顺序"""
+        summary = {
+            'total_records': self.total_records,
+            'date_range': {
+                'start': str(self.start if self.start is not None else pd.NaT),
+                'end': str(self.end if self.end is not None else pd.NaT)
+            },
+            'user_type_distribution': ordered_counts(self.user_types, user_type_order),
+            'sentiment_distribution': ordered_counts(self.sentiments, sentiment_order),
+            'topic_distribution': ordered_topic_counts(self.topics, self.topic_ids),
+            'monthly_counts': {month: self.monthly_counts[month] for month in sorted(self.monthly_counts)}
+        }
+        if self.topic_ids:
+            # topic_mask 列的位序号
+            summary['topic_ids'] = self.topic_ids
+        if self.latency_counts:
+            summary['reply_latency_ms'] = latency_stats(self.latency_counts)
+        return summary
+
+    def to_state(self):
+        """可 JSON 序列化的完整状态（延迟计数的键为字符串）"""
+        return {
+            'total_records': self.total_records,
+            'start': self.start.isoformat() if self.start is not None else None,
+            'end': self.end.isoformat() if self.end is not None else None,
+            'user_types': dict(self.user_types),
+            'sentiments': dict(self.sentiments),
+            'topics': dict(self.topics),
+            'monthly_counts': dict(sorted(self.monthly_counts.items())),
+            'latency_counts': {str(value): count for value, count in sorted(self.latency_counts.items())},
+            'topic_ids': self.topic_ids,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(
+            total_records=state['total_records'],
+            start=pd.Timestamp(state['start']) if state.get('start') else None,
+            end=pd.Timestamp(state['end']) if state.get('end') else None,
+            user_types=state.get('user_types'),
+            sentiments=state.get('sentiments'),
+            topics=state.get('topics'),
+            monthly_counts=state.get('monthly_counts'),
+            latency_counts={int(value): int(count) for value, count in state.get('latency_counts', {}).items()},
+            topic_ids=state.get('topic_ids'),
+        )
@@ -9,10 +9,40 @@ import pandas as pd
 import json
 import tempfile
 import os
+import sqlite3
+from unittest import mock
 from io import StringIO
+from contextlib import contextmanager
 from data_preprocessor import XiaoXinBaoDataProcessor
-from monthly_analyzer import MonthlyAnalyzer, convert_numpy_types
+from monthly_analyzer import MonthlyAnalyzer, convert_numpy_types, process_all_months
+from log_parser import LogParser, MultiLogParser, UnansweredWriter, split_log_ranges
+from lexicon import Lexicon
+from memo import LRUMemo
+from summary_aggregate import SummaryAggregate
+import parquet_io
 import numpy as np
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# 整体 JSON 配置（如 .env 中的 USER_CATEGORY_KEYWORDS）会覆盖对应的单项关键词变量
+ENV_OVERRIDES = {
+    'PATIENT_KEYWORDS': 'USER_CATEGORY_KEYWORDS',
+    'VOLUNTEER_KEYWORDS': 'USER_CATEGORY_KEYWORDS',
+    'MEDICAL_KEYWORDS': 'USER_CATEGORY_KEYWORDS',
+    'POSITIVE_WORDS': 'SENTIMENT_WORDS',
+    'NEGATIVE_WORDS': 'SENTIMENT_WORDS',
+    'NEUTRAL_WORDS': 'SENTIMENT_WORDS',
+}
+
+@contextmanager
+def patched_env(**values):
+    """临时设置环境变量并移除会覆盖它们的整体配置，退出时恢复原有环境"""
+    with mock.patch.dict(os.environ, values):
+        for name in values:
+            os.environ.pop(ENV_OVERRIDES.get(name, ''), None)
+        yield
 
 class TestDataPreprocessor(unittest.TestCase):
     """测试数据预处理器"""
@@ -44,6 +74,373 @@ class TestDataPreprocessor(unittest.TestCase):
         self.assertEqual(len(self.processor.df), 3)
         self.assertEqual(len(self.processor.df.columns), 11)
     
+    def test_load_compressed_csv(self):
+        """测试直接加载压缩CSV"""
+        import gzip
+        compressed = self.temp_file.name + '.gz'
+        try:
+            with gzip.open(compressed, 'wt', encoding='utf-8') as f:
+                f.write(self.test_csv_content)
+            processor = XiaoXinBaoDataProcessor(compressed)
+            self.assertTrue(processor.load_data())
+            self.assertEqual(len(processor.df), 3)
+        finally:
+            os.unlink(compressed)
+    
+    def test_load_gbk_projected(self):
+        """测试GBK编码探测与按需加载列"""
+        with open(self.temp_file.name, 'w', encoding='gbk') as f:
+            f.write(self.test_csv_content)
+        # 样本截断在多字节字符中间也能识别
+        self.assertEqual(self.processor.detect_encoding(sample_bytes=11), 'gbk')
+        
+        self.assertTrue(self.processor.load_data(columns=XiaoXinBaoDataProcessor.PIPELINE_COLUMNS))
+        self.assertEqual(self.processor.df.columns.tolist(), ['timestamp', 'user_id', 'dialogue_content'])
+        self.assertEqual(self.processor.clean_column_names(), ['timestamp', 'user_id', 'dialogue_content'])
+        self.assertEqual(self.processor.parse_timestamp(), 3)
+        self.processor.extract_dialogue_content()
+        self.assertIn('担心', self.processor.df['clean_dialogue'].iloc[1])
+    
+    def test_process_in_chunks(self):
+        """测试分块预处理与整表处理输出一致"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.processor.load_data()
+            self.processor.clean_column_names()
+            self.processor.parse_timestamp()
+            self.processor.extract_dialogue_content()
+            self.processor.annotate()
+            expected = self.processor.save_processed_data(os.path.join(tmp_dir, 'full'))
+            
+            chunked = XiaoXinBaoDataProcessor(self.temp_file.name)
+            summary = chunked.process_in_chunks(os.path.join(tmp_dir, 'chunked'), chunksize=2)
+            self.assertEqual(summary, expected)
+            self.assertIsNone(chunked.df)
+            for name in os.listdir(os.path.join(tmp_dir, 'full')):
+                with open(os.path.join(tmp_dir, 'full', name), encoding='utf-8') as f:
+                    full_output = f.read()
+                with open(os.path.join(tmp_dir, 'chunked', name), encoding='utf-8') as f:
+                    self.assertEqual(f.read(), full_output, name)
+    
+    def test_annotate_matches_classifiers(self):
+        """测试融合标注与单独分类结果一致，摘要复用分布而不重新分类"""
+        self.processor.load_data()
+        self.processor.clean_column_names()
+        self.processor.parse_timestamp()
+        self.processor.extract_dialogue_content()
+        with patched_env(CONVERSATION_THEMES='{"symptom": ["化疗"], "emotion": ["担心", "焦虑"]}'):
+            expected = {
+                'user_type_distribution': self.processor.categorize_users(),
+                'sentiment_distribution': self.processor.analyze_sentiment(),
+                'topic_distribution': self.processor.categorize_topics(),
+            }
+            expected_columns = self.processor.df[['user_type', 'sentiment', 'topics']].copy()
+            self.processor.df = self.processor.df.drop(columns=['user_type', 'sentiment', 'topics'])
+            
+            self.assertEqual(self.processor.annotate(), expected)
+            self.assertTrue(self.processor.df[['user_type', 'sentiment', 'topics']].equals(expected_columns))
+            self.assertEqual(self.processor.df['topics'].iloc[1], 'symptom,emotion')
+            
+            self.processor.categorize_users = self.processor.analyze_sentiment = None
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                summary = self.processor.save_processed_data(tmp_dir)
+            self.assertEqual(summary['topic_distribution'], expected['topic_distribution'])
+    
+    def test_memoized_annotation(self):
+        """测试重复对话只清洗、分类一次，结果与逐行计算一致，关键词变化时缓存失效"""
+        dialogues = ['您好', '我是患者家属，很担心', None, '您好', '谢谢志愿者', '您好', '我是患者家属，很担心']
+        processor = XiaoXinBaoDataProcessor.from_frame(pd.DataFrame({'dialogue_content': dialogues}))
+        processor.verbose = False
+        processor.extract_dialogue_content()
+        processor.annotate()
+        
+        lexicon = processor.lexicon()
+        for text, user_type, sentiment in processor.df[['clean_dialogue', 'user_type', 'sentiment']].itertuples(index=False):
+            counts = lexicon.count(text)
+            self.assertEqual(user_type, processor._classify_user(counts))
+            self.assertEqual(sentiment, processor._classify_sentiment(counts, text))
+        self.assertEqual(processor.clean_memo.stats()['misses'], 4)
+        self.assertEqual(processor.annotation_memo.misses, 4)
+        self.assertAlmostEqual(processor.annotation_memo.hit_rate, 3 / 7)
+        
+        processor.annotate()
+        self.assertEqual(processor.annotation_memo.misses, 4)
+        with patched_env(VOLUNTEER_KEYWORDS='您好'):
+            processor.annotate()
+            self.assertEqual(processor.annotation_memo.misses, 8)
+            self.assertEqual(processor.df['user_type'].iloc[0], 'volunteer')
+    
+    def test_memo_distinct_batch(self):
+        """测试几乎没有重复的批次按直接映射处理：结果一致，已缓存的值仍命中，但不写入新值"""
+        memo = LRUMemo()
+        self.assertEqual(memo.map(pd.Series(['a', 'b', 'a', None]), str.upper, na_key='').tolist(), ['A', 'B', 'A', ''])
+        self.assertEqual(len(memo), 3)
+        
+        calls = []
+        def upper(text):
+            calls.append(text)
+            return text.upper()
+        result = memo.map(pd.Series(['a'] + [f'x{i}' for i in range(19)]), upper)
+        self.assertEqual(result.tolist(), ['A'] + [f'X{i}' for i in range(19)])
+        self.assertEqual(len(calls), 19)
+        self.assertEqual(len(memo), 3)
+        self.assertEqual(memo.stats()['misses'], 3 + 19)
+    
+    def test_annotation_cache(self):
+        """测试持久化标注缓存：重跑时结果一致且全部来自缓存，关键词变化后只重新分类"""
+        def run(cache_path):
+            processor = XiaoXinBaoDataProcessor(self.temp_file.name, verbose=False)
+            processor.load_data()
+            processor.clean_column_names()
+            processor.open_annotation_cache(cache_path)
+            processor.extract_dialogue_content()
+            processor.annotate()
+            return processor.df, processor.close_annotation_cache()
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_path = os.path.join(tmp_dir, 'cache', 'annotation_cache.sqlite')
+            first, stats = run(cache_path)
+            self.assertEqual((stats['cleaned_from_cache'], stats['annotated_from_cache']), (0, 0))
+            self.assertGreater(stats['written'], 0)
+            
+            second, stats = run(cache_path)
+            self.assertTrue(second.equals(first))
+            self.assertEqual(stats['cleaned_from_cache'], stats['rows'])
+            self.assertEqual(stats['annotated_from_cache'], stats['rows'])
+            self.assertEqual(stats['written'], 0)
+            
+            with patched_env(VOLUNTEER_KEYWORDS='帮助'):
+                _, stats = run(cache_path)
+            self.assertEqual(stats['cleaned_from_cache'], stats['rows'])
+            self.assertEqual(stats['annotated_from_cache'], 0)
+    
+    def test_annotation_cache_cleaner_version(self):
+        """测试清洗规则指纹变化后旧的清洗结果不再命中，不带指纹的旧缓存表打开时重建"""
+        import data_preprocessor
+        from annotation_cache import AnnotationCache
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_path = os.path.join(tmp_dir, 'annotation_cache.sqlite')
+            legacy = sqlite3.connect(cache_path)
+            legacy.execute("CREATE TABLE cleaned (text_hash BLOB PRIMARY KEY, clean_dialogue TEXT NOT NULL) WITHOUT ROWID")
+            legacy.commit()
+            legacy.close()
+            
+            with AnnotationCache(cache_path) as cache:
+                cache.put_clean({'原文': '旧清洗结果'}, 'v1')
+                self.assertEqual(cache.get_clean(['原文'], 'v1'), {'原文': '旧清洗结果'})
+                self.assertEqual(cache.get_clean(['原文'], 'v2'), {})
+            
+            def run():
+                processor = XiaoXinBaoDataProcessor(self.temp_file.name, verbose=False)
+                processor.load_data()
+                processor.clean_column_names()
+                processor.open_annotation_cache(cache_path)
+                processor.extract_dialogue_content()
+                return processor.df['clean_dialogue'], processor.close_annotation_cache()
+            
+            first, _ = run()
+            with mock.patch.object(data_preprocessor, 'CLEANER_FINGERPRINT', 'next-cleaner'):
+                second, stats = run()
+            self.assertTrue(second.equals(first))
+            self.assertEqual(stats['cleaned_from_cache'], 0)
+    
+    def test_parallel_annotation(self):
+        """测试进程池并行清洗、分类与单进程结果完全一致"""
+        import data_preprocessor
+        dialogues = ['[{"type":"text","text":{"content":"我是患者家属，很担心 %d"}}]' % (i % 40) if i % 3
+                     else '谢谢志愿者的帮助 %d' % (i % 25) for i in range(200)]
+        frames = []
+        with mock.patch.object(data_preprocessor, 'PARALLEL_MIN_TEXTS', 1), \
+                patched_env(CONVERSATION_THEMES='{"emotion": ["担心"], "thanks": ["谢谢"]}'):
+            for workers in (1, 2):
+                processor = XiaoXinBaoDataProcessor.from_frame(pd.DataFrame({'dialogue_content': dialogues}))
+                processor.verbose = False
+                processor.workers = workers
+                processor.extract_dialogue_content()
+                processor.annotate()
+                frames.append(processor.df)
+        self.assertTrue(frames[1].equals(frames[0]))
+        self.assertEqual(frames[1].to_csv(index=False), frames[0].to_csv(index=False))
+    
+    def test_compact_schema(self):
+        """测试标签列为 category，多标签话题存为位掩码并按位计数"""
+        processor = XiaoXinBaoDataProcessor.from_frame(pd.DataFrame({
+            'clean_dialogue': ['化疗后很担心', '谢谢', '化疗方案', '焦虑']}))
+        processor.verbose = False
+        with patched_env(CONVERSATION_THEMES='{"symptom": ["化疗"], "emotion": ["担心", "焦虑"]}'):
+            distributions = processor.annotate()
+        
+        for column in ('user_type', 'sentiment', 'topics'):
+            self.assertIsInstance(processor.df[column].dtype, pd.CategoricalDtype)
+        self.assertEqual(processor.topic_ids, {'symptom': 0, 'emotion': 1})
+        self.assertEqual(processor.df['topic_mask'].tolist(), [3, 0, 1, 2])
+        self.assertEqual(processor.df['topics'].tolist(), ['symptom,emotion', 'other', 'symptom', 'emotion'])
+        self.assertEqual(processor.has_topic('emotion').tolist(), [True, False, False, True])
+        self.assertEqual(distributions['topic_distribution'], {'symptom': 2, 'emotion': 2, 'other': 1})
+        self.assertNotIn(0, distributions['user_type_distribution'].values())
+    
+    def test_wide_topic_mask(self):
+        """测试超过 64 个话题时位掩码拆成多个 uint64 列，计数一致且可写出 Parquet"""
+        themes = {f'topic{i}': [f'词{i}号'] for i in range(70)}
+        processor = XiaoXinBaoDataProcessor.from_frame(pd.DataFrame({
+            'timestamp': pd.to_datetime(['2025-07-01 10:00:00'] * 4),
+            'user_id': ['u1', 'u2', 'u3', 'u4'],
+            'dialogue_content': ['词0号和词65号', '谢谢', '词69号', '词3号']}))
+        processor.verbose = False
+        processor.extract_dialogue_content()
+        with patched_env(CONVERSATION_THEMES=json.dumps(themes, ensure_ascii=False)):
+            distributions = processor.annotate()
+        
+        self.assertEqual(XiaoXinBaoDataProcessor.topic_mask_columns(70), ['topic_mask', 'topic_mask_1'])
+        for column in ('topic_mask', 'topic_mask_1'):
+            self.assertEqual(processor.df[column].dtype, np.uint64)
+        self.assertEqual(processor.df['topic_mask'].tolist(), [1, 0, 0, 8])
+        self.assertEqual(processor.df['topic_mask_1'].tolist(), [2, 0, 32, 0])
+        self.assertEqual(processor.has_topic('topic65').tolist(), [True, False, False, False])
+        self.assertEqual(distributions['topic_distribution'],
+                         {'topic0': 1, 'topic3': 1, 'topic65': 1, 'topic69': 1, 'other': 1})
+        
+        if parquet_io.available():
+            processor.df['year_month'] = processor.df['timestamp'].dt.to_period('M')
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                processor.save_processed_data(tmp_dir, format='parquet')
+                [(month, partition)] = parquet_io.list_partitions(parquet_io.dataset_path(tmp_dir))
+                df = parquet_io.read_partition(partition, month, columns=['topic_mask', 'topic_mask_1'])
+                self.assertEqual(df['topic_mask_1'].tolist(), [2, 0, 32, 0])
+        
+    @unittest.skipUnless(yaml, "需要 PyYAML")
+    def test_yaml_streaming(self):
+        """测试分批写出的 YAML 与整体 dump 一致，空值、时间和月份可被 safe_load 读回"""
+        df = pd.DataFrame({
+            'user_id': ['u1', 'u2', None],
+            'timestamp': pd.to_datetime(['2024-01-02 03:04:05', None, '2024-02-01 00:00:00']),
+            'year_month': pd.PeriodIndex(['2024-01', None, '2024-02'], freq='M'),
+            'turns': [1, 2, 3],
+            'clean_dialogue': ['您好', '很长的一段话' * 30, '- 不是新条目: #'],
+        })
+        output = StringIO()
+        XiaoXinBaoDataProcessor._write_yaml_records(df, output, batch_size=2)
+        
+        records = yaml.safe_load(output.getvalue())
+        self.assertEqual(records[0], {'user_id': 'u1', 'timestamp': '2024-01-02T03:04:05',
+                                      'year_month': '2024-01', 'turns': 1, 'clean_dialogue': '您好'})
+        self.assertIsNone(records[1]['timestamp'])
+        self.assertIsNone(records[1]['year_month'])
+        self.assertIsNone(records[2]['user_id'])
+        self.assertEqual([record['clean_dialogue'] for record in records], df['clean_dialogue'].tolist())
+        expected = yaml.safe_dump(records, allow_unicode=True, sort_keys=False)
+        self.assertEqual(output.getvalue(), expected)
+    
+    def _preprocess(self, output_dir, incremental=False):
+        processor = XiaoXinBaoDataProcessor(self.temp_file.name)
+        processor.verbose = False
+        processor.load_data()
+        processor.clean_column_names()
+        processor.parse_timestamp()
+        watermark = processor.load_watermark(output_dir) if incremental else None
+        if watermark is not None:
+            processor.select_new_rows(watermark)
+        processor.extract_dialogue_content()
+        processor.annotate()
+        return processor.save_processed_data(output_dir, watermark=watermark)
+    
+    def test_incremental_preprocess(self):
+        """测试增量预处理只处理标记之后的行，追加后的输出与全量重建一致"""
+        lines = self.test_csv_content.splitlines(keepends=True)
+        # 与第二行同一时刻的新行，只能靠行指纹区分
+        same_time = '2025/7/29 15:30,外部接入单点,shareChat-000,\'-,咨询问题,2,[],[],[],[],谢谢\n'
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            incremental_dir = os.path.join(tmp_dir, 'incremental')
+            chunked_dir = os.path.join(tmp_dir, 'chunked')
+            with open(self.temp_file.name, 'w', encoding='utf-8') as f:
+                f.writelines(lines[:3])
+            self._preprocess(incremental_dir, incremental=True)
+            XiaoXinBaoDataProcessor(self.temp_file.name).process_in_chunks(chunked_dir, chunksize=2)
+            
+            with open(self.temp_file.name, 'a', encoding='utf-8') as f:
+                f.writelines(lines[3:] + [same_time])
+            processor = XiaoXinBaoDataProcessor(self.temp_file.name)
+            processor.load_data()
+            processor.clean_column_names()
+            processor.parse_timestamp()
+            self.assertEqual(processor.select_new_rows(processor.load_watermark(incremental_dir)), 2)
+            
+            summary = self._preprocess(incremental_dir, incremental=True)
+            expected = self._preprocess(os.path.join(tmp_dir, 'full'))
+            self.assertEqual(summary, expected)
+            self.assertEqual(summary['total_records'], 4)
+            chunked = XiaoXinBaoDataProcessor(self.temp_file.name)
+            chunked_summary = chunked.process_in_chunks(chunked_dir, chunksize=2,
+                                                        watermark=chunked.load_watermark(chunked_dir))
+            self.assertEqual(chunked_summary, expected)
+            for name in os.listdir(os.path.join(tmp_dir, 'full')):
+                with open(os.path.join(tmp_dir, 'full', name), encoding='utf-8') as f:
+                    full_output = f.read()
+                for output_dir in (incremental_dir, chunked_dir):
+                    with open(os.path.join(output_dir, name), encoding='utf-8') as f:
+                        self.assertEqual(f.read(), full_output, name)
+            
+            # 没有新行时摘要不变；关键词配置变化时标记失效
+            self.assertEqual(self._preprocess(incremental_dir, incremental=True), expected)
+            with patched_env(CONVERSATION_THEMES='{"symptom": ["化疗"]}'):
+                self.assertIsNone(XiaoXinBaoDataProcessor(self.temp_file.name).load_watermark(incremental_dir))
+    
+    def _prepared_processor(self):
+        self.processor.load_data()
+        self.processor.clean_column_names()
+        self.processor.parse_timestamp()
+        self.processor.extract_dialogue_content()
+        self.processor.annotate()
+        return self.processor
+    
+    @unittest.skipUnless(parquet_io.available(), "需要 pyarrow")
+    def test_parquet_partitions(self):
+        """测试按月分区的 Parquet 输出保留类型，月度分析只读取需要的分区和列"""
+        processor = self._prepared_processor()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            summary = processor.save_processed_data(tmp_dir, format='parquet')
+            self.assertEqual(summary['monthly_counts'], {'2025-07': 3})
+            self.assertFalse(os.path.exists(os.path.join(tmp_dir, 'cleaned_data.csv')))
+            
+            [(month, partition)] = parquet_io.list_partitions(parquet_io.dataset_path(tmp_dir))
+            df = parquet_io.read_partition(partition, month, columns=['timestamp', 'user_type', 'missing'])
+            self.assertEqual(df.columns.tolist(), ['timestamp', 'user_type', 'year_month'])
+            self.assertTrue(pd.api.types.is_datetime64_any_dtype(df['timestamp']))
+            self.assertIsInstance(df['user_type'].dtype, pd.CategoricalDtype)
+            
+            reports = process_all_months(tmp_dir, months=['2025-07'])
+            self.assertEqual([report['month'] for report in reports], ['2025-07'])
+            self.assertEqual(process_all_months(tmp_dir, months=['2025-08']), [])
+    
+    @unittest.skipUnless(parquet_io.available(), "需要 pyarrow")
+    def test_parquet_missing_timestamp(self):
+        """测试时间戳无法解析的行写入 unknown 分区，不进入月度分析"""
+        with open(self.temp_file.name, 'a', encoding='utf-8') as f:
+            f.write("时间未知,外部接入单点,shareChat-999,'-,无时间,1,[],[],[],[],谢谢\n")
+        processor = self._prepared_processor()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            summary = processor.save_processed_data(tmp_dir, format='parquet')
+            self.assertEqual(summary['total_records'], 4)
+            self.assertEqual(summary['monthly_counts'], {'2025-07': 3})
+            
+            root = parquet_io.dataset_path(tmp_dir)
+            self.assertEqual([month for month, _ in parquet_io.list_partitions(root)], ['2025-07'])
+            month, partition = parquet_io.list_partitions(root, include_unknown=True)[-1]
+            self.assertEqual(month, parquet_io.UNKNOWN_MONTH)
+            df = parquet_io.read_partition(partition, month)
+            self.assertEqual(df['clean_dialogue'].tolist(), ['谢谢'])
+            self.assertTrue(df['year_month'].isna().all())
+            self.assertEqual([report['month'] for report in process_all_months(tmp_dir)], ['2025-07'])
+    
+    @unittest.skipIf(parquet_io.available(), "已安装 pyarrow")
+    def test_parquet_requires_pyarrow(self):
+        """测试未安装 pyarrow 时 parquet 输出退回 CSV"""
+        processor = self._prepared_processor()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            summary = processor.save_processed_data(tmp_dir, format='parquet')
+            self.assertEqual(summary['monthly_counts'], {'2025-07': 3})
+            self.assertTrue(os.path.exists(os.path.join(tmp_dir, 'data_2025-07.csv')))
+            self.assertEqual(len(process_all_months(tmp_dir, months=['2025-07'])), 1)
+    
     def test_clean_column_names(self):
         """测试列名清理"""
         self.processor.load_data()
@@ -65,6 +462,33 @@ class TestDataPreprocessor(unittest.TestCase):
         self.assertIn('timestamp', self.processor.df.columns)
         self.assertIn('year_month', self.processor.df.columns)
     
+    def test_parse_timestamp_formats(self):
+        """测试时间格式按样本探测，不符合的值逐个推断，已知格式时跳过探测"""
+        timestamps = ['2025/7/28 14:32', None, '2025/7/28 14:32', '2025-07-29 10:00:00', '无效时间']
+        processor = XiaoXinBaoDataProcessor.from_frame(pd.DataFrame({'timestamp': timestamps}))
+        processor.verbose = False
+        self.assertEqual(processor.parse_timestamp(), 3)
+        self.assertEqual(processor.timestamp_format, '%Y/%m/%d %H:%M')
+        self.assertEqual(processor.df['timestamp'].tolist(), [
+            pd.Timestamp('2025-07-28 14:32'), pd.NaT, pd.Timestamp('2025-07-28 14:32'),
+            pd.Timestamp('2025-07-29 10:00'), pd.NaT])
+        
+        processor = XiaoXinBaoDataProcessor.from_frame(pd.DataFrame({'timestamp': ['2025-07-29 10:00:00']}))
+        processor.verbose = False
+        processor.timestamp_format = '%Y-%m-%d %H:%M:%S'
+        processor.detect_timestamp_format = None
+        self.assertEqual(processor.parse_timestamp(), 1)
+        self.assertEqual(str(processor.df['year_month'].iloc[0]), '2025-07')
+        
+        # 带时区的值与不带时区的值混在一起：带时区的记为 NaT，其余照常解析
+        for timestamps in (['2025/7/28 14:32', '2025-07-29T10:00:00+08:00', '2025-07-30 10:00:00'],
+                           ['2025-07-29T10:00:00+08:00', '2025-07-30 10:00:00']):
+            processor = XiaoXinBaoDataProcessor.from_frame(pd.DataFrame({'timestamp': timestamps}))
+            processor.verbose = False
+            processor.timestamp_format = None if len(timestamps) == 3 else '%Y/%m/%d'
+            self.assertEqual(processor.parse_timestamp(), len(timestamps) - 1)
+            self.assertTrue(pd.isna(processor.df['timestamp'].iloc[-2]))
+    
     def test_extract_dialogue_content(self):
         """测试对话内容提取"""
         self.processor.load_data()
@@ -80,6 +504,38 @@ class TestDataPreprocessor(unittest.TestCase):
         self.assertIn('担心', dialogues[1])
         self.assertIn('志愿者', dialogues[2])
     
+    def test_clean_dialogues(self):
+        """测试按列清洗：JSON载荷、纯文本、乱码字符与空值"""
+        texts = pd.Series([
+            '[{"type":"text","text":{"content":"第一行\\n第二行"}},{"content": "你好"}]',
+            'userSelect: 化疗 , 放疗 ',
+            '→\ufffd您好\t\t请问',
+            '---',
+            None,
+            'type:text',
+        ], index=[5, 5, 3, 2, 1, 0])
+        cleaned = self.processor.clean_dialogues(texts)
+        self.assertEqual(cleaned.tolist(), ['第一行 第二行 你好', '化疗 放疗', '您好 请问', '---', '', ''])
+        self.assertEqual(cleaned.index.tolist(), [5, 5, 3, 2, 1, 0])
+
+    def test_clean_json_payloads(self):
+        """测试结构化解析JSON载荷：转义引号、交互选项与非法JSON回退"""
+        texts = pd.Series([
+            '[{"type":"text","text":{"content":"他说\\"别担心\\"然后走了"}}]',
+            json.dumps([{"type": "interactive", "interactive": {"type": "userSelect", "params": {
+                "description": "请选择您的身份",
+                "userSelectOptions": [{"value": "患者", "key": "a"}, {"value": "家属", "key": "b"}],
+                "userSelectedVal": "家属"}}}], ensure_ascii=False),
+            '[{"content": "未闭合"',
+            json.dumps([{"content": "化疗"}, {"text": {"content": "放疗"}}]),
+        ])
+        cleaned = self.processor.clean_dialogues(texts)
+        self.assertEqual(cleaned.tolist(), ['他说"别担心"然后走了', '请选择您的身份 家属', '未闭合', '化疗 放疗'])
+        
+        # 嵌套超过递归深度的载荷不中断清洗，回退到正则提取
+        nested = pd.Series(['[' * depth + '{"content":"您好"}' + ']' * depth for depth in range(960, 1060, 20)])
+        self.assertEqual(self.processor.clean_dialogues(nested).tolist(), ['您好'] * len(nested))
+    
     def test_categorize_users(self):
         """测试用户分类"""
         self.processor.load_data()
@@ -102,6 +558,348 @@ class TestDataPreprocessor(unittest.TestCase):
         self.assertIn('negative', sentiment_dist)  # "担心和焦虑"应该被识别为负面
         self.assertIn('positive', sentiment_dist)   # "帮助"应该被识别为正面
 
+class TestLogParser(unittest.TestCase):
+    """测试日志解析器"""
+    
+    def setUp(self):
+        """设置测试日志"""
+        self.test_log_content = """[INFO][2025-05-31 14:53:40][chat_channel.py:120] - receive message
+[INFO][2025-05-31 14:53:42][chat_gpt_bot.py:49] - [CHATGPT] query=化疗后总是恶心怎么办
+[INFO][2025-05-31 14:53:50][gewechat_channel.py:220] - [gewechat] Do send text to user_001: 建议少食多餐
+如果持续呕吐请及时就医
+[INFO][2025-05-31 15:00:01][chat_gpt_bot.py:49] - [CHATGPT] query=这个问题没有回复
+[INFO][2025-05-31 15:01:00][chat_gpt_bot.py:49] - [CHATGPT] query=谢谢你的帮助
+[WARNING][2025-05-31 15:01:02][bot.py:10] - slow response
+[INFO][2025-05-31 15:01:05][gewechat_channel.py:220] - [gewechat] Do send text to user_002: 不客气
+"""
+        self.temp_file = tempfile.NamedTemporaryFile(mode='w', suffix='.log', delete=False, encoding='utf-8')
+        self.temp_file.write(self.test_log_content)
+        self.temp_file.close()
+        
+        self.parser = LogParser(self.temp_file.name)
+    
+    def tearDown(self):
+        """清理测试日志"""
+        os.unlink(self.temp_file.name)
+    
+    def test_parse(self):
+        """测试问答对提取"""
+        df = self.parser.parse()
+        
+        self.assertEqual(len(df), 2)
+        self.assertEqual(df.columns.tolist(), ['timestamp', 'dialogue_content', 'bot_reply',
+                                               'reply_timestamp', 'reply_latency_ms', 'source'])
+        self.assertEqual(df['timestamp'].tolist(), ['2025-05-31 14:53:42', '2025-05-31 15:01:00'])
+        self.assertEqual(df['dialogue_content'].tolist(), ['化疗后总是恶心怎么办', '谢谢你的帮助'])
+        # 多行回复应完整保留
+        self.assertEqual(df['bot_reply'].iloc[0], '建议少食多餐\n如果持续呕吐请及时就医')
+        self.assertEqual(df['bot_reply'].iloc[1], '不客气')
+    
+    def test_reply_latency_and_unanswered(self):
+        """测试回复延迟与未回复提问"""
+        entries = []
+        parser = LogParser(self.temp_file.name, on_unanswered=entries.append)
+        df = parser.parse()
+        
+        self.assertEqual(df['reply_timestamp'].tolist(), ['2025-05-31 14:53:50', '2025-05-31 15:01:05'])
+        self.assertEqual(df['reply_latency_ms'].tolist(), [8000, 5000])
+        self.assertEqual(parser.unanswered_count, 1)
+        unanswered = LogParser.unanswered_frame(entries)
+        self.assertEqual(unanswered['dialogue_content'].tolist(), ['这个问题没有回复'])
+        self.assertEqual(unanswered['reason'].tolist(), ['superseded'])
+    
+    def test_session_pairing(self):
+        """测试多用户并发时按会话配对，待回复提问数量受限"""
+        with open(self.temp_file.name, 'w', encoding='utf-8') as f:
+            f.write("[INFO][2025-05-31 16:00:00][chat_gpt_bot.py:49] - [user_a] [CHATGPT] query=A的问题\n")
+            f.write("[INFO][2025-05-31 16:00:01][chat_gpt_bot.py:49] - [user_b] [CHATGPT] query=B的问题\n")
+            f.write("[INFO][2025-05-31 16:00:02][chat_gpt_bot.py:49] - [user_c] [CHATGPT] query=C的问题\n")
+            f.write("[INFO][2025-05-31 16:00:04][gewechat_channel.py:220] - [gewechat] Do send text to user_b: 回复B\n")
+            f.write("[INFO][2025-05-31 16:00:09][gewechat_channel.py:220] - [gewechat] Do send text to user_a: 回复A\n")
+        session_pattern = r'- \[(\w+)\] \[CHATGPT\]'
+        for use_mmap in (True, False):
+            entries = []
+            parser = LogParser(self.temp_file.name, use_mmap=use_mmap, session_pattern=session_pattern,
+                               on_unanswered=entries.append)
+            df = parser.parse()
+            self.assertEqual(df['dialogue_content'].tolist(), ['B的问题', 'A的问题'])
+            self.assertEqual(df['bot_reply'].tolist(), ['回复B', '回复A'])
+            self.assertEqual(df['reply_latency_ms'].tolist(), [3000, 9000])
+            self.assertEqual(LogParser.unanswered_frame(entries)[['conversation', 'reason']].values.tolist(),
+                             [['user_c', 'end_of_log']])
+        
+        # 超出上限时最早的会话被淘汰
+        entries = []
+        parser = LogParser(self.temp_file.name, session_pattern=session_pattern, max_pending=2,
+                           on_unanswered=entries.append)
+        self.assertEqual(parser.parse()['dialogue_content'].tolist(), ['B的问题'])
+        self.assertEqual([(e['conversation'], e['reason']) for e in entries],
+                         [('user_a', 'evicted'), ('user_c', 'end_of_log')])
+        
+        # 超过 TTL（日志时间）的提问视为过期
+        entries = []
+        parser = LogParser(self.temp_file.name, session_pattern=session_pattern, pending_ttl=5,
+                           on_unanswered=entries.append)
+        self.assertEqual(parser.parse()['dialogue_content'].tolist(), ['B的问题'])
+        self.assertEqual([e['reason'] for e in entries], ['expired', 'expired'])
+    
+    def test_iter_frames_batches(self):
+        """测试分批流式输出"""
+        frames = list(self.parser.iter_frames(batch_size=1))
+        
+        self.assertEqual([len(f) for f in frames], [1, 1])
+        self.assertTrue(pd.concat(frames, ignore_index=True).equals(self.parser.parse()))
+    
+    def test_missing_file(self):
+        """测试文件不存在"""
+        df = LogParser('not_exists.log').parse()
+        self.assertTrue(df.empty)
+    
+    def test_parallel_matches_sequential(self):
+        """测试并行分块解析与顺序解析结果一致"""
+        sequential = self.parser.parse()
+        parallel = self.parser.parse(workers=2)
+        self.assertTrue(parallel.equals(sequential))
+        
+        # 强制切成多个小块，跨块的提问与回复仍能正确配对
+        pairs = list(self.parser.iter_pairs(workers=3, chunk_bytes=1))
+        self.assertEqual(pairs, list(self.parser.iter_pairs()))
+    
+    def test_mmap_matches_line_scan(self):
+        """测试 mmap 字节级扫描与逐行扫描结果一致"""
+        with open(self.temp_file.name, 'a', encoding='utf-8') as f:
+            f.write("[INFO][2025-05-31 15:02:00][chat_gpt_bot.py:49] - [CHATGPT] query= 带空格的提问 \r\n")
+            f.write("[INFO][2025-05-31 15:02:01][gewechat_channel.py:220] - [gewechat] Do send text to user_003: 第一行\n\n  第三行  \n")
+        pairs = list(LogParser(self.temp_file.name).iter_pairs())
+        self.assertEqual(pairs, list(LogParser(self.temp_file.name, use_mmap=False).iter_pairs()))
+        self.assertEqual(pairs[-1]['query'], '带空格的提问')
+        self.assertEqual(pairs[-1]['reply'], '第一行\n\n第三行')
+    
+    def test_compressed_log(self):
+        """测试压缩日志流式解析"""
+        import gzip, bz2
+        expected = self.parser.parse()
+        for suffix, opener in (('.gz', gzip.open), ('.bz2', bz2.open)):
+            compressed = self.temp_file.name + suffix
+            try:
+                with opener(compressed, 'wt', encoding='utf-8') as f:
+                    f.write(self.test_log_content)
+                self.assertTrue(LogParser(compressed).parse(workers=2).equals(expected))
+            finally:
+                os.unlink(compressed)
+    
+    def test_compressed_checkpoint(self):
+        """测试压缩日志断点续读：偏移量按解压后字节计，重跑不会把整个日志当作截断重新解析"""
+        import gzip
+        compressed = self.temp_file.name + '.gz'
+        checkpoint = self.temp_file.name + '.checkpoint.json'
+        try:
+            with gzip.open(compressed, 'wt', encoding='utf-8') as f:
+                f.write(self.test_log_content)
+            first = LogParser(compressed, checkpoint_path=checkpoint)
+            self.assertEqual(len(first.parse()), 1)
+            
+            # 追加一个 gzip 成员（logrotate 之外常见的追加写法）
+            with gzip.open(compressed, 'at', encoding='utf-8') as f:
+                f.write("[INFO][2025-05-31 15:02:00][chat_gpt_bot.py:49] - [CHATGPT] query=复查多久一次\n")
+                f.write("[INFO][2025-05-31 15:02:09][gewechat_channel.py:220] - [gewechat] Do send text to user_003: 一般三个月\n")
+            second = LogParser(compressed, checkpoint_path=checkpoint)
+            df = second.parse()
+            self.assertEqual(second.checkpoint_status, 'resumed')
+            self.assertEqual(df['dialogue_content'].tolist(), ['谢谢你的帮助'])
+            
+            third = LogParser(compressed, checkpoint_path=checkpoint)
+            self.assertTrue(third.parse().empty)
+            self.assertEqual(third.checkpoint_status, 'resumed')
+        finally:
+            for path in (compressed, checkpoint):
+                if os.path.exists(path):
+                    os.unlink(path)
+    
+    def test_multi_file_merge(self):
+        """测试多文件并行解析并按时间戳归并"""
+        other = tempfile.NamedTemporaryFile(mode='w', suffix='.log', delete=False, encoding='utf-8')
+        other.write("[INFO][2025-05-31 14:00:00][chat_gpt_bot.py:49] - [CHATGPT] query=最早的提问\n")
+        other.write("[INFO][2025-05-31 14:00:03][gewechat_channel.py:220] - [gewechat] Do send text to user_009: 回复一\n")
+        other.write("[INFO][2025-05-31 15:00:30][chat_gpt_bot.py:49] - [CHATGPT] query=中间的提问\n")
+        other.write("[INFO][2025-05-31 15:00:33][gewechat_channel.py:220] - [gewechat] Do send text to user_009: 回复二\n")
+        other.close()
+        try:
+            for workers in (1, 2):
+                entries = []
+                df = MultiLogParser([self.temp_file.name, other.name], on_unanswered=entries.append).parse(workers=workers)
+                self.assertEqual(df['dialogue_content'].tolist(),
+                                 ['最早的提问', '化疗后总是恶心怎么办', '中间的提问', '谢谢你的帮助'])
+                self.assertTrue(df['timestamp'].is_monotonic_increasing)
+                self.assertEqual([entry['query'] for entry in entries], ['这个问题没有回复'])
+        finally:
+            os.unlink(other.name)
+    
+    def test_split_log_ranges(self):
+        """测试分块边界对齐到日志头"""
+        ranges = split_log_ranges(self.temp_file.name, 0, 10, min_chunk_bytes=1)
+        self.assertGreater(len(ranges), 1)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], os.path.getsize(self.temp_file.name))
+        with open(self.temp_file.name, 'rb') as f:
+            for start, end in ranges:
+                f.seek(start)
+                self.assertTrue(f.readline().startswith((b'[INFO]', b'[WARNING]', b'[ERROR]')))
+    
+    def test_checkpoint_resume(self):
+        """测试断点续读：仅解析新增字节，跨运行保留未回复的提问"""
+        checkpoint = self.temp_file.name + '.checkpoint.json'
+        try:
+            first = LogParser(self.temp_file.name, checkpoint_path=checkpoint)
+            # 末尾的回复可能仍在写入，留到下次运行
+            self.assertEqual(len(first.parse()), 1)
+            self.assertEqual(first.checkpoint_status, 'new')
+            
+            with open(self.temp_file.name, 'a', encoding='utf-8') as f:
+                f.write("[INFO][2025-05-31 15:02:00][chat_gpt_bot.py:49] - [CHATGPT] query=复查多久一次\n")
+                f.write("[INFO][2025-05-31 15:02:09][gewechat_channel.py:220] - [gewechat] Do send text to user_003: 一般三个月\n")
+                f.write("[INFO][2025-05-31 15:02:10][chat_gpt_bot.py:49] - [CHATGPT] query=还没回复\n")
+            
+            second = LogParser(self.temp_file.name, checkpoint_path=checkpoint)
+            df = second.parse()
+            self.assertEqual(second.checkpoint_status, 'resumed')
+            self.assertEqual(df['dialogue_content'].tolist(), ['谢谢你的帮助', '复查多久一次'])
+            self.assertEqual(df['bot_reply'].tolist(), ['不客气', '一般三个月'])
+            
+            with open(self.temp_file.name, 'a', encoding='utf-8') as f:
+                f.write("[INFO][2025-05-31 15:03:00][gewechat_channel.py:220] - [gewechat] Do send text to user_004: 已回复\n")
+                f.write("[INFO][2025-05-31 15:03:01][bot.py:10] - done\n")
+            df = LogParser(self.temp_file.name, checkpoint_path=checkpoint).parse()
+            self.assertEqual(df['dialogue_content'].tolist(), ['还没回复'])
+            self.assertEqual(df['timestamp'].tolist(), ['2025-05-31 15:02:10'])
+        finally:
+            if os.path.exists(checkpoint):
+                os.unlink(checkpoint)
+    
+    def test_unanswered_streaming(self):
+        """测试未回复提问分批写入 CSV：断点续读时追加，全量解析时覆盖"""
+        checkpoint = self.temp_file.name + '.checkpoint.json'
+        unanswered_csv = self.temp_file.name + '.unanswered.csv'
+        
+        def run(append, checkpoint_path=checkpoint):
+            writer = UnansweredWriter(unanswered_csv, append=append, batch_size=1)
+            LogParser(self.temp_file.name, checkpoint_path=checkpoint_path, on_unanswered=writer).parse()
+            writer.close()
+            return pd.read_csv(unanswered_csv)
+        
+        try:
+            self.assertEqual(run(append=False)['dialogue_content'].tolist(), ['这个问题没有回复'])
+            with open(self.temp_file.name, 'a', encoding='utf-8') as f:
+                f.write("[INFO][2025-05-31 15:02:00][chat_gpt_bot.py:49] - [CHATGPT] query=被覆盖的提问\n")
+                f.write("[INFO][2025-05-31 15:02:05][chat_gpt_bot.py:49] - [CHATGPT] query=最新的提问\n")
+                f.write("[INFO][2025-05-31 15:02:09][gewechat_channel.py:220] - [gewechat] Do send text to user_003: 回复\n")
+                f.write("[INFO][2025-05-31 15:02:10][bot.py:10] - done\n")
+            
+            df = run(append=True)
+            self.assertEqual(df.columns.tolist(), LogParser.UNANSWERED_COLUMNS)
+            self.assertEqual(df['dialogue_content'].tolist(), ['这个问题没有回复', '被覆盖的提问'])
+            self.assertEqual(df['reason'].tolist(), ['superseded', 'superseded'])
+            self.assertEqual(len(run(append=False, checkpoint_path=None)), 2)
+        finally:
+            for path in (checkpoint, unanswered_csv):
+                if os.path.exists(path):
+                    os.unlink(path)
+    
+    def test_checkpoint_truncation(self):
+        """测试日志截断后从头解析"""
+        checkpoint = self.temp_file.name + '.checkpoint.json'
+        try:
+            LogParser(self.temp_file.name, checkpoint_path=checkpoint).parse()
+            with open(self.temp_file.name, 'w', encoding='utf-8') as f:
+                f.write("[INFO][2025-06-01 09:00:00][chat_gpt_bot.py:49] - [CHATGPT] query=新的一天\n")
+                f.write("[INFO][2025-06-01 09:00:05][gewechat_channel.py:220] - [gewechat] Do send text to user_005: 早上好\n")
+                f.write("[INFO][2025-06-01 09:00:06][bot.py:10] - done\n")
+            parser = LogParser(self.temp_file.name, checkpoint_path=checkpoint)
+            df = parser.parse()
+            self.assertEqual(parser.checkpoint_status, 'truncated')
+            self.assertEqual(df['dialogue_content'].tolist(), ['新的一天'])
+        finally:
+            if os.path.exists(checkpoint):
+                os.unlink(checkpoint)
+
+class TestLexicon(unittest.TestCase):
+    """测试关键词自动机"""
+    
+    def test_counts_match_substring_search(self):
+        """测试计数与逐词 in 匹配一致：重叠词、重复列出的词、空关键词"""
+        lexicons = {
+            'volunteer': ['志愿者', '志愿', '志愿'],
+            'patient': ['患者', '者家', ''],
+            'medical': ['医生', '生病'],
+        }
+        texts = ['我是志愿者家属', '患者家属找医生看病', '', '医生病了']
+        for use_native in (True, False):
+            lexicon = Lexicon(lexicons, use_native=use_native)
+            for text in texts:
+                expected = {category: hits for category, words in lexicons.items()
+                            if (hits := sum(1 for word in words if word in text))}
+                self.assertEqual(lexicon.count(text), expected, text)
+    
+    def test_classifiers_use_env_lexicon(self):
+        """测试分类器使用 .env 关键词，配置变化后自动重建"""
+        processor = XiaoXinBaoDataProcessor.from_frame(pd.DataFrame({'clean_dialogue': ['我想当陪诊员']}))
+        processor.verbose = False
+        self.assertEqual(processor.categorize_users(), {'other': 1})
+        with patched_env(VOLUNTEER_KEYWORDS='陪诊'):
+            self.assertEqual(processor.categorize_users(), {'volunteer': 1})
+
+class TestSummaryAggregate(unittest.TestCase):
+    """测试可合并的摘要统计"""
+    
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'timestamp': ['2025-07-28 14:32:00', '2025-08-01 09:00:00', None, '2025-08-03 10:00:00', '2025-06-30 23:59:00'],
+            'dialogue_content': ['我是患者家属，化疗很担心', '谢谢医生', '志愿者报名', '化疗后焦虑', '您好'],
+            'reply_latency_ms': pd.array([1200, None, 300, 4500, 300], dtype='Int64'),
+        })
+    
+    def _aggregate(self, df):
+        processor = XiaoXinBaoDataProcessor.from_frame(df.reset_index(drop=True))
+        processor.verbose = False
+        processor.parse_timestamp()
+        processor.extract_dialogue_content()
+        processor.annotate()
+        return processor, processor.summary_aggregate()
+    
+    def test_merge_matches_whole_frame(self):
+        """测试分片统计合并后与整表统计一致，满足单位元和结合律"""
+        with patched_env(CONVERSATION_THEMES='{"symptom": ["化疗"], "emotion": ["担心", "焦虑"]}'):
+            processor, whole = self._aggregate(self.df)
+            parts = [self._aggregate(self.df.iloc[rows])[1] for rows in ([0, 1], [2], [3, 4])]
+        
+        self.assertEqual(parts[0].merge(parts[1]).merge(parts[2]), whole)
+        self.assertEqual(parts[0].merge(parts[1].merge(parts[2])), whole)
+        self.assertEqual(SummaryAggregate().merge(whole), whole)
+        self.assertEqual(whole.merge(SummaryAggregate()), whole)
+        
+        summary = processor.summary(parts[2].merge(parts[0]).merge(parts[1]))
+        self.assertEqual(summary['total_records'], 5)
+        self.assertEqual(summary['date_range'], {'start': '2025-06-30 23:59:00', 'end': '2025-08-03 10:00:00'})
+        self.assertEqual(summary['monthly_counts'], {'2025-06': 1, '2025-07': 1, '2025-08': 2})
+        self.assertEqual(summary['topic_distribution'], {'symptom': 2, 'emotion': 2, 'other': 3})
+        # 由计数算出的分位数与 Series.quantile 的线性插值一致
+        latency = pd.Series([1200, 300, 4500, 300])
+        self.assertEqual(summary['reply_latency_ms'], {
+            'count': 4, 'mean': 1575.0, 'p50': float(latency.quantile(0.5)),
+            'p95': float(latency.quantile(0.95)), 'max': 4500.0})
+        self.assertEqual(MonthlyAnalyzer(processor.df).basic_metrics()['reply_latency_ms'],
+                         summary['reply_latency_ms'])
+    
+    def test_state_round_trip(self):
+        """测试状态可经 JSON 保存后恢复，话题配置不同的统计不能合并"""
+        _, aggregate = self._aggregate(self.df)
+        restored = SummaryAggregate.from_state(json.loads(json.dumps(aggregate.to_state())))
+        self.assertEqual(restored, aggregate)
+        self.assertEqual(restored.to_summary(), aggregate.to_summary())
+        self.assertEqual(SummaryAggregate().to_summary()['date_range'], {'start': 'NaT', 'end': 'NaT'})
+        with self.assertRaises(ValueError):
+            SummaryAggregate(topic_ids={'symptom': 0}).merge(SummaryAggregate(topic_ids={'emotion': 0}))
+
 class TestMonthlyAnalyzer(unittest.TestCase):
     """测试月度分析器"""
     
@@ -178,6 +976,32 @@ class TestMonthlyAnalyzer(unittest.TestCase):
         except TypeError:
             self.fail("Report contains non-serializable data")
 
+    def test_process_all_months_parallel(self):
+        """测试进程池并行分析：按月份顺序返回、与顺序执行一致，失败的月份被跳过"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for month in ('2025-09', '2025-07', '2025-08'):
+                month_data = self.test_data.copy()
+                month_data['timestamp'] = month_data['timestamp'].apply(lambda ts: ts.replace(month=int(month[-2:])))
+                month_data['year_month'] = pd.Period(month)
+                month_data.to_csv(os.path.join(tmp_dir, f'data_{month}.csv'), index=False)
+            # 空文件无法解析
+            open(os.path.join(tmp_dir, 'data_2025-10.csv'), 'w').close()
+            
+            # 进程数不超过 CPU 核数，单核机器上也按双核验证进程池路径
+            with mock.patch('os.cpu_count', return_value=2):
+                parallel = process_all_months(tmp_dir, workers=2)
+            self.assertEqual([report['month'] for report in parallel], ['2025-07', '2025-08', '2025-09'])
+            for report in parallel:
+                with open(os.path.join(tmp_dir, f"report_{report['month']}.json"), encoding='utf-8') as f:
+                    self.assertEqual(json.load(f), json.loads(json.dumps(report, ensure_ascii=False)))
+            
+            # 只有一个月份、或进程数被核数限制为 1 时不启动进程池
+            with mock.patch('monthly_analyzer.ProcessPoolExecutor', side_effect=AssertionError('不应启动进程池')):
+                self.assertEqual(process_all_months(tmp_dir, workers=1), parallel)
+                self.assertEqual(process_all_months(tmp_dir, months=['2025-08'], workers=4), parallel[1:2])
+                with mock.patch('os.cpu_count', return_value=1):
+                    self.assertEqual(process_all_months(tmp_dir, workers=4), parallel)
+
 class TestConvertNumpyTypes(unittest.TestCase):
     """测试numpy类型转换"""
     
@@ -264,6 +1088,57 @@ class TestEndToEnd(unittest.TestCase):
                 
         finally:
             os.unlink(temp_file.name)
+    
+    def test_log_pipeline_in_memory(self):
+        """测试日志解析结果直接交给预处理器，仅在指定时保存中间CSV"""
+        from run_analysis import preprocess_data
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            log_path = os.path.join(tmp_dir, 'chat.log')
+            with open(log_path, 'w', encoding='utf-8') as f:
+                f.write("[INFO][2025-06-15 10:00:00][chat_gpt_bot.py:49] - [CHATGPT] query=我是患者家属，很担心\n")
+                f.write("[INFO][2025-06-15 10:00:04][gewechat_channel.py:220] - [gewechat] Do send text to user_1: 别担心\n")
+            output_dir = os.path.join(tmp_dir, 'processed')
+            parsed_csv = os.path.join(tmp_dir, 'parsed.csv')
+            
+            self.assertTrue(preprocess_data(log_path, output_dir))
+            self.assertFalse(os.path.exists(parsed_csv))
+            cleaned = pd.read_csv(os.path.join(output_dir, 'cleaned_data.csv'))
+            self.assertEqual(cleaned['reply_latency_ms'].tolist(), [4000])
+            
+            self.assertTrue(preprocess_data(log_path, output_dir, parsed_csv=parsed_csv))
+            self.assertEqual(len(pd.read_csv(parsed_csv)), 1)
+    
+    def test_input_expansion(self):
+        """测试输入展开：日志文件名识别，目录只取日志，通配符只匹配到一个 CSV 时按展开后的路径预处理"""
+        from run_analysis import expand_input_files, is_log_file, preprocess_data
+        for name in ('xyanb.yaml', 'xyanb.log', 'xyanb.log.1', 'xyanb.log.1.gz', 'xyanb.log.2025-05-31',
+                     'xyanb.log-20250531.zst', 'logs/XYANB.LOG.GZ'):
+            self.assertTrue(is_log_file(name), name)
+        for name in ('chat.yaml.tar.gz', 'x.yaml.bak', 'chat.log.old', 'chat_logs.csv', 'chat_logs.csv.gz', 'catalog'):
+            self.assertFalse(is_log_file(name), name)
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            logs_dir = os.path.join(tmp_dir, 'logs')
+            os.makedirs(os.path.join(logs_dir, 'archive.log'))
+            for name in ('b.log', 'a.log.1.gz', 'x.yaml.bak', 'notes.txt'):
+                open(os.path.join(logs_dir, name), 'w').close()
+            self.assertEqual(expand_input_files(logs_dir),
+                             [os.path.join(logs_dir, 'a.log.1.gz'), os.path.join(logs_dir, 'b.log')])
+            self.assertEqual(expand_input_files(os.path.join(tmp_dir, 'missing.csv')), [])
+            self.assertEqual(expand_input_files(''), [])
+            
+            export = os.path.join(tmp_dir, 'export_2025.csv')
+            with open(export, 'w', encoding='utf-8') as f:
+                f.write("时间,来源,使用者,联系方式,标题,消息总数,用户赞同反馈,用户反对反馈,自定义反馈,标注答案,对话详情\n")
+                f.write("2025/6/15 10:00,测试,user1,'-,测试,1,[],[],[],[],"
+                        '"[{""type"":""text"",""text"":{""content"":""我是患者家属""}}]"\n')
+                f.write("2025/7/15 11:00,测试,user2,'-,测试,1,[],[],[],[],谢谢医生\n")
+            pattern = os.path.join(tmp_dir, 'export_*.csv')
+            self.assertEqual(expand_input_files(pattern), [export])
+            output_dir = os.path.join(tmp_dir, 'processed')
+            self.assertTrue(preprocess_data(pattern, output_dir))
+            cleaned = pd.read_csv(os.path.join(output_dir, 'cleaned_data.csv'))
+            self.assertEqual(cleaned['clean_dialogue'].tolist(), ['我是患者家属', '谢谢医生'])
 
 def run_unit_tests():
     """运行所有单元测试"""
@@ -273,6 +1148,9 @@ def run_unit_tests():
     
     # 添加测试类
     suite.addTests(loader.loadTestsFromTestCase(TestDataPreprocessor))
+    suite.addTests(loader.loadTestsFromTestCase(TestLogParser))
+    suite.addTests(loader.loadTestsFromTestCase(TestLexicon))
+    suite.addTests(loader.loadTestsFromTestCase(TestSummaryAggregate))
     suite.addTests(loader.loadTestsFromTestCase(TestMonthlyAnalyzer))
     suite.addTests(loader.loadTestsFromTestCase(TestConvertNumpyTypes))
     suite.addTests(loader.loadTestsFromTestCase(TestEndToEnd))
@@ -0,0 +1,104 @@
+"""
+增量预处理的高水位标记（<output_dir>/watermark.json）
+
+记录已处理数据的最大时间戳，以及时间戳恰好等于该值的各行指纹：同一时刻可能有多行，
+下一次导出还可能在同一时刻补充新行。增量运行只处理时间戳更晚、或时间戳相同但指纹
+未出现过的行，新行追加到受影响的月份文件/分区。标记中保存已处理数据的摘要统计
+（SummaryAggregate），新行的统计与之合并后重新生成 summary.json。
+标记同时保存输出格式与关键词配置的指纹，二者变化时需要全量重建。
+时间戳为空的行无法与标记比较，增量运行时跳过（只在全量运行中计入）。
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from summary_aggregate import SummaryAggregate
+
+WATERMARK_FILE = 'watermark.json'
+
+# 行指纹使用的列（原始内容，不依赖清洗和分类结果）
+FINGERPRINT_COLUMNS = ['user_id', 'dialogue_content']
+
+def watermark_path(output_dir):
+    return os.path.join(output_dir, WATERMARK_FILE)
+
+def row_fingerprints(df):
+    """各行 FINGERPRINT_COLUMNS 内容的 64 位哈希（uint64 数组），与列的存储类型无关"""
+    columns = [column for column in FINGERPRINT_COLUMNS if column in df.columns]
+    values = df[columns].astype(object).where(df[columns].notna(), None)
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+class Watermark:
+    """
+    timestamp 为已处理的最大时间戳（无有效时间戳时为 None），fingerprints 为该时刻各行的指纹；
+    config 为输出配置指纹，next_part 为 Parquet 数据集下一个 part 文件的序号，
+    aggregate 为已处理数据的摘要统计。
+    """
+
+    def __init__(self, config, timestamp=None, fingerprints=(), next_part=0, aggregate=None):
+        self.config = config
+        self.timestamp = timestamp
+        self.fingerprints = set(fingerprints)
+        self.next_part = next_part
+        self.aggregate = aggregate if aggregate is not None else SummaryAggregate()
+
+    @classmethod
+    def load(cls, output_dir):
+        """读取标记，不存在或无法解析时返回 None"""
+        path = watermark_path(output_dir)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            timestamp = pd.Timestamp(data['timestamp']) if data.get('timestamp') else None
+            return cls(data['config'], timestamp, (int(value) for value in data.get('fingerprints', [])),
+                       int(data.get('next_part', 0)), SummaryAggregate.from_state(data['aggregate']))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"忽略无法读取的增量标记 {path}: {e}")
+            return None
+
+    def save(self, output_dir):
+        """先写临时文件再替换，中断时不会留下半个标记"""
+        path = watermark_path(output_dir)
+        data = {
+            'config': self.config,
+            'timestamp': self.timestamp.isoformat() if self.timestamp is not None else None,
+            'fingerprints': sorted(self.fingerprints),
+            'next_part': self.next_part,
+            'aggregate': self.aggregate.to_state(),
+        }
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def copy(self):
+        return Watermark(self.config, self.timestamp, self.fingerprints, self.next_part, self.aggregate)
+
+    def new_rows(self, df):
+        """布尔数组：标记之后的行（时间戳为空的行为 False）"""
+        timestamps = df['timestamp']
+        if self.timestamp is None:
+            return timestamps.notna().to_numpy()
+        later = (timestamps > self.timestamp).to_numpy(copy=True)
+        same = (timestamps == self.timestamp).to_numpy()
+        if same.any():
+            seen = np.isin(row_fingerprints(df[same]), np.array(sorted(self.fingerprints), dtype=np.uint64))
+            later[np.flatnonzero(same)[~seen]] = True
+        return later
+
+    def advance(self, df):
+        """把 df 中的行计入标记：最大时间戳后移，或在同一时刻补充指纹"""
+        latest = df['timestamp'].max()
+        if pd.isna(latest):
+            return
+        if self.timestamp is None or latest > self.timestamp:
+            self.timestamp = latest
+            self.fingerprints = set()
+        if latest == self.timestamp:
+            at_latest = df[(df['timestamp'] == latest).to_numpy()]
+            self.fingerprints.update(int(value) for value in row_fingerprints(at_latest))